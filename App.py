@@ -1,7 +1,8 @@
 import streamlit as st
-from utilities import apply_theme, render_sidebar, validate_login, load_roles
+from utilities import apply_theme, render_sidebar, validate_login, load_roles, ensure_database
 
 st.set_page_config(page_title="Sistema de Gestão", layout="wide")
+ensure_database() # Migrações pendentes rodam uma vez por processo, fora das páginas
 apply_theme()
 
 if 'authenticated' not in st.session_state:
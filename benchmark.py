@@ -0,0 +1,400 @@
+import argparse
+import http.client
+import os
+import threading
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+import utilities
+from parquet_store import read_sensor_readings, write_sensor_readings
+from ingestion_service import INGEST_BATCH_SIZE, INGEST_COLUMNS, INGEST_INSERT, IngestionServer, SensorIngestor
+from prediction_engine import HISTORY_POINTS, fit_arima_forecast, holt_forecast, linear_trend_forecast
+from utilities import ASSET_PROFILES, SENSOR_COLUMNS, SENSOR_DATA_INDEXES, TIMESTAMP_FORMAT, apply_alert_rules, set_sqlite_pragmas
+
+# Benchmarks das rotinas pesadas de utilities.py, executáveis sem o Streamlit.
+# Uso: python benchmark.py alert_rules --rows 1000000
+
+
+def make_sensor_frame(n_rows, seed=42, anomaly_rate=0.01):
+    """Gera um frame sintético no formato de sensor_data, com leituras fora dos limites injetadas."""
+    rng = np.random.default_rng(seed)
+    asset_types = np.array(list(ASSET_PROFILES) + ["Tipo Sem Perfil"])
+    types = asset_types[rng.integers(0, len(asset_types), n_rows)]
+    df = pd.DataFrame({
+        'timestamp': pd.date_range(end=pd.Timestamp.now(), periods=n_rows, freq='1s'),
+        'asset_id': pd.Series(types).str.upper().str.replace(' ', '_') + "-" + rng.integers(1, 6, n_rows).astype(str),
+        'asset_type': types,
+    })
+    for param in ['temperatura', 'pressao', 'vibracao', 'corrente_eletrica', 'vazao_oleo']:
+        df[param] = np.nan
+    for asset_type, profile in ASSET_PROFILES.items():
+        is_type = (types == asset_type); n_type = int(is_type.sum())
+        for param, config in profile['params'].items():
+            values = config['mean'] + config['std'] * rng.standard_normal(n_type)
+            # Sorteia anomalias altas e baixas nos limites de atenção e crítico
+            spikes = rng.random(n_type) < anomaly_rate
+            values[spikes] = rng.choice([config['op_max'] * config['warn_factor'] * 1.01, config['op_max'] * config['crit_factor'] * 1.05,
+                                         config['op_min'] / config['warn_factor'] * 0.99, -1.0], int(spikes.sum()))
+            df.loc[is_type, param] = values
+    return df
+
+
+def legacy_apply_alert_rules(df):
+    """Implementação original (laço por tipo × parâmetro), mantida como referência de paridade."""
+    df_alerts = df.copy(); df_alerts['status'] = 'Normal'; df_alerts['status_reason'] = ''
+    for asset_type, profile in ASSET_PROFILES.items():
+        if asset_type in df_alerts['asset_type'].unique():
+            for param, rules in profile['params'].items():
+                if param in df_alerts.columns and not df_alerts[df_alerts['asset_type']==asset_type][param].isnull().all():
+                    crit_high=rules['op_max']*rules['crit_factor']; warn_high=rules['op_max']*rules['warn_factor']
+                    crit_low=rules['op_min']/rules['crit_factor']; warn_low=rules['op_min']/rules['warn_factor']
+                    is_type = (df_alerts['asset_type'] == asset_type)
+                    df_alerts.loc[is_type & (df_alerts[param] > crit_high), ['status', 'status_reason']] = ['Crítico',f'{param.title()} Alta']; df_alerts.loc[is_type & (df_alerts[param] < crit_low), ['status', 'status_reason']] = ['Crítico',f'{param.title()} Baixa']; df_alerts.loc[is_type & (df_alerts[param] > warn_high) & (df_alerts[param] <= crit_high), ['status', 'status_reason']] = ['Atenção',f'{param.title()} Alta']; df_alerts.loc[is_type & (df_alerts[param] < warn_low) & (df_alerts[param] >= crit_low), ['status', 'status_reason']] = ['Atenção',f'{param.title()} Baixa']
+    return df_alerts
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf'); result = None
+    for _ in range(repeat):
+        start = time.perf_counter(); result = func(*args); best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_alert_rules(n_rows):
+    df = make_sensor_frame(n_rows)
+    legacy_time, expected = timed(legacy_apply_alert_rules, df)
+    vector_time, result = timed(apply_alert_rules, df)
+    for col in ['status', 'status_reason']:
+        mismatches = int((result[col].astype(str) != expected[col]).sum())
+        if mismatches: raise AssertionError(f"Paridade quebrada em '{col}': {mismatches} linha(s) divergentes")
+    print(f"apply_alert_rules ({n_rows:,} linhas): original {legacy_time:.3f}s | vetorizado {vector_time:.3f}s | "
+          f"{legacy_time / vector_time:.1f}x | {n_rows / vector_time:,.0f} linhas/s | paridade OK")
+
+
+def time_sensor_queries(db_engine, df):
+    """Cronometra as consultas do caminho quente: histórico por ativo/sensor e janelas de tempo."""
+    assets = df[['asset_id', 'asset_type']].drop_duplicates('asset_id').head(50)
+    pairs = [(row.asset_id, next(iter(ASSET_PROFILES[row.asset_type]['params']))) for row in assets.itertuples() if row.asset_type in ASSET_PROFILES]
+    last_hour = (df['timestamp'].max() - pd.Timedelta(hours=1)).strftime(TIMESTAMP_FORMAT)
+    timings = {}
+    start = time.perf_counter()
+    for asset_id, sensor in pairs:
+        pd.read_sql(text(f"SELECT timestamp, {sensor} FROM sensor_data WHERE asset_id = :asset_id ORDER BY timestamp DESC LIMIT 200"), db_engine, params={"asset_id": asset_id})
+    timings[f'histórico por ativo ({len(pairs)} consultas)'] = time.perf_counter() - start
+    timings['janela de 1h (SELECT *)'] = timed(lambda: pd.read_sql(text("SELECT * FROM sensor_data WHERE timestamp > :since"), db_engine, params={"since": last_hour}))[0]
+    timings['última leitura por ativo'] = timed(lambda: pd.read_sql("SELECT asset_id, MAX(timestamp) FROM sensor_data GROUP BY asset_id", db_engine))[0]
+    return timings
+
+
+def bench_sqlite(n_rows):
+    df = make_sensor_frame(n_rows)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        plain_engine = create_engine(f"sqlite:///{db_path}")
+        df.to_sql('sensor_data', plain_engine, index=False, chunksize=10000)
+        before = time_sensor_queries(plain_engine, df); plain_engine.dispose()
+        tuned_engine = create_engine(f"sqlite:///{db_path}"); event.listen(tuned_engine, "connect", set_sqlite_pragmas)
+        start = time.perf_counter()
+        with tuned_engine.connect() as conn:
+            for ddl in SENSOR_DATA_INDEXES: conn.execute(text(ddl))
+            conn.commit()
+        print(f"Criação dos índices de sensor_data ({n_rows:,} linhas): {time.perf_counter() - start:.2f}s")
+        after = time_sensor_queries(tuned_engine, df); tuned_engine.dispose()
+    for query, before_time in before.items():
+        print(f"{query}: sem índices {before_time * 1000:.1f}ms | com índices + pragmas {after[query] * 1000:.1f}ms | {before_time / after[query]:.1f}x")
+
+
+def bench_forecast(n_rows, arima_sample=30):
+    """Compara o ARIMA série a série com os previsores vetorizados sobre `n_rows` leituras (janelas de HISTORY_POINTS)."""
+    rng = np.random.default_rng(42); n_series = max(arima_sample, n_rows // HISTORY_POINTS)
+    drift = rng.normal(0, 0.05, (n_series, 1)) * np.arange(HISTORY_POINTS)
+    matrix = 50 + drift + rng.standard_normal((n_series, HISTORY_POINTS))
+    start = time.perf_counter()
+    for values in matrix[:arima_sample]: fit_arima_forecast(values)
+    arima_per_series = (time.perf_counter() - start) / arima_sample
+    print(f"ARIMA série a série: {arima_per_series * 1000:.1f}ms/série -> ~{arima_per_series * n_series:.1f}s para {n_series:,} séries")
+    for name, forecaster in (('Holt', holt_forecast), ('Tendência linear', linear_trend_forecast)):
+        elapsed = timed(forecaster, matrix)[0]
+        print(f"{name} vetorizado: {elapsed * 1000:.1f}ms para {n_series:,} séries | {arima_per_series * n_series / elapsed:,.0f}x")
+
+
+def measured(func):
+    """Executa `func` medindo tempo e pico de memória alocada (tracemalloc)."""
+    tracemalloc.start(); start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start; peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def bench_storage(n_rows):
+    """Compara SQLite e Parquet particionado: tamanho em disco, carga completa e janela de 1h com poucas colunas."""
+    df = make_sensor_frame(n_rows)[['timestamp', 'asset_id'] + SENSOR_COLUMNS]
+    since = df['timestamp'].max() - pd.Timedelta(hours=1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"); event.listen(db_engine, "connect", set_sqlite_pragmas)
+        sqlite_write = timed(lambda: df.to_sql('sensor_data', db_engine, index=False, chunksize=10000), repeat=1)[0]
+        with db_engine.connect() as conn:
+            for ddl in SENSOR_DATA_INDEXES: conn.execute(text(ddl))
+            conn.commit()
+        parquet_dir = os.path.join(tmp_dir, 'parquet')
+        parquet_write = timed(lambda: write_sensor_readings(df, root=parquet_dir), repeat=1)[0]
+        results = {
+            'sqlite': {
+                'escrita': (sqlite_write, None), 'tamanho (MB)': os.path.getsize(os.path.join(tmp_dir, 'bench.db')) / 1e6,
+                'carga completa': measured(lambda: pd.read_sql("SELECT * FROM sensor_data", db_engine, parse_dates=['timestamp'])),
+                'janela 1h, 3 colunas': measured(lambda: pd.read_sql(text("SELECT timestamp, asset_id, temperatura FROM sensor_data WHERE timestamp > :since"), db_engine, params={"since": since.strftime(TIMESTAMP_FORMAT)}, parse_dates=['timestamp'])),
+            },
+            'parquet': {
+                'escrita': (parquet_write, None), 'tamanho (MB)': directory_size(parquet_dir) / 1e6,
+                'carga completa': measured(lambda: read_sensor_readings(root=parquet_dir)),
+                'janela 1h, 3 colunas': measured(lambda: read_sensor_readings(columns=['timestamp', 'asset_id', 'temperatura'], since=since, root=parquet_dir)),
+            },
+        }
+        db_engine.dispose()
+    for backend, metrics in results.items():
+        print(f"[{backend}] escrita {metrics['escrita'][0]:.2f}s | tamanho {metrics['tamanho (MB)']:.1f}MB")
+        for name in ('carga completa', 'janela 1h, 3 colunas'):
+            elapsed, peak, frame = metrics[name]
+            print(f"[{backend}] {name}: {elapsed * 1000:.0f}ms | pico tracemalloc {peak / 1e6:.0f}MB | frame {frame.memory_usage(deep=True).sum() / 1e6:.0f}MB ({len(frame):,} linhas)")
+
+
+def bench_sensor_schema(n_rows):
+    """Compara o sensor_data antigo (metadados do ativo em cada leitura) com o formato normalizado: tamanho e ingestão."""
+    df_narrow = make_sensor_frame(n_rows)
+    df_wide = df_narrow.assign(location=lambda d: "Setor " + d['asset_id'].str[-1] + "-Linha 1", latitude=-18.42, longitude=-49.225)
+    df_wide = df_wide[['timestamp', 'asset_id', 'asset_type', 'location', 'latitude', 'longitude'] + SENSOR_COLUMNS]
+    df_narrow = df_narrow[['timestamp', 'asset_id'] + SENSOR_COLUMNS]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, df in (('largo (antigo)', df_wide), ('normalizado', df_narrow)):
+            db_path = os.path.join(tmp_dir, f"{len(df.columns)}.db"); db_engine = create_engine(f"sqlite:///{db_path}"); event.listen(db_engine, "connect", set_sqlite_pragmas)
+            elapsed = timed(lambda: df.to_sql('sensor_data', db_engine, index=False, chunksize=10000), repeat=1)[0]
+            load_time, _, frame = measured(lambda: pd.read_sql("SELECT * FROM sensor_data", db_engine, parse_dates=['timestamp']))
+            db_engine.dispose()
+            print(f"sensor_data {name}: {os.path.getsize(db_path) / 1e6:.1f}MB | ingestão {elapsed:.2f}s ({n_rows / elapsed:,.0f} linhas/s) | "
+                  f"carga {load_time:.2f}s, frame {frame.memory_usage(deep=True).sum() / 1e6:.0f}MB")
+
+
+@contextmanager
+def temp_database(**engine_kwargs):
+    """Banco SQLite migrado num diretório temporário, no lugar de `utilities.engine` durante o bloco. O diretório atual
+    também passa a ser o temporário (initialize_database cria o diretório de uploads relativo a ele); tudo é restaurado na saída."""
+    original_engine, original_dir = utilities.engine, os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        utilities.engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", **engine_kwargs); event.listen(utilities.engine, "connect", set_sqlite_pragmas)
+        try:
+            utilities.initialize_database()
+            yield utilities.engine
+        finally:
+            utilities.engine.dispose(); utilities.engine = original_engine; os.chdir(original_dir)
+
+
+def bench_rollups(n_rows):
+    """Carga inicial e incremental dos rollups e gráfico de 7 dias de um ativo: leituras brutas x rollups."""
+    df = make_sensor_frame(n_rows)
+    end = df['timestamp'].max(); asset_id = df['asset_id'].iloc[-1]
+    with temp_database() as db_engine:
+        df[['asset_id', 'asset_type']].drop_duplicates('asset_id').to_sql('assets', db_engine, if_exists='append', index=False)
+        df[['timestamp', 'asset_id'] + SENSOR_COLUMNS].to_sql('sensor_data', db_engine, if_exists='append', index=False, chunksize=10000)
+        build_time = timed(utilities.update_sensor_rollups, repeat=1)[0]
+        print(f"Carga inicial dos rollups ({n_rows:,} leituras): {build_time:.2f}s")
+        # O resumo de status por ativo lê a tabela de eventos de alerta (ver bench_alert_events)
+        since = end - pd.Timedelta(days=7); resolution = utilities.choose_rollup_resolution(pd.Timedelta(days=7), 150)
+        raw_time, raw_points = timed(lambda: pd.read_sql(text("SELECT * FROM sensor_data WHERE asset_id = :asset_id AND timestamp >= :since"), db_engine, params={"asset_id": asset_id, "since": since.strftime(TIMESTAMP_FORMAT)}))
+        rollup_time, rollup_points = timed(lambda: utilities.load_sensor_rollups(resolution, since=since, asset_ids=[asset_id]))
+        print(f"Gráfico de 7 dias ({asset_id}): brutas {len(raw_points):,} linhas em {raw_time * 1000:.0f}ms | rollups {resolution} {len(rollup_points):,} linhas em {rollup_time * 1000:.0f}ms")
+        df_new = df.tail(10_000).assign(timestamp=lambda d: d['timestamp'] + (end - df['timestamp'].iloc[-10_000] + pd.Timedelta(seconds=1)))
+        df_new[['timestamp', 'asset_id'] + SENSOR_COLUMNS].to_sql('sensor_data', db_engine, if_exists='append', index=False)
+        print(f"Atualização incremental (10.000 leituras novas): {timed(utilities.update_sensor_rollups, repeat=1)[0] * 1000:.0f}ms")
+
+
+def bench_downsampling(n_rows, budget=utilities.CHART_POINT_BUDGET):
+    """Uma série de `n_rows` leituras de 1 minuto com picos: tempo da redução e tamanho do gráfico enviado ao navegador."""
+    import plotly.express as px
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame({'timestamp': pd.date_range(end=pd.Timestamp.now(), periods=n_rows, freq='1min'), 'valor': 50 + np.cumsum(rng.normal(0, 0.1, n_rows))})
+    is_alert = rng.random(n_rows) < 0.001; df.loc[is_alert, 'valor'] += rng.choice([-30, 30], int(is_alert.sum()))
+    x = df['timestamp'].astype('int64')
+    lttb_time, indices = timed(utilities.downsample_indices, x, df['valor'], budget, is_alert)
+    minmax_time = timed(utilities.minmax_indices, df['valor'], budget)[0]
+    kept_alerts = int(is_alert[indices].sum())
+    full_size = len(px.line(df, x='timestamp', y='valor').to_json()); reduced_size = len(px.line(df.iloc[indices], x='timestamp', y='valor').to_json())
+    print(f"Redução de {n_rows:,} para {len(indices):,} pontos: LTTB {lttb_time * 1000:.0f}ms | mín/máx {minmax_time * 1000:.0f}ms | "
+          f"{kept_alerts}/{int(is_alert.sum())} alertas mantidos | gráfico {full_size / 1e6:.1f}MB -> {reduced_size / 1e6:.2f}MB")
+
+
+def bench_worst_status(n_rows, n_assets=5000):
+    """Pior status por ativo com milhares de ativos: agg com lambda por grupo x códigos de severidade (worst_status)."""
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame({'asset_id': 'ATIVO-' + pd.Series(rng.integers(0, n_assets, n_rows)).astype(str),
+                       'status': rng.choice(utilities.STATUS_LEVELS, n_rows, p=[0.9, 0.02, 0.06, 0.02])})
+    lambda_time, expected = timed(lambda: df.groupby('asset_id')['status'].agg(lambda x: 'Crítico' if 'Crítico' in x.values else ('Atenção' if 'Atenção' in x.values else ('Normal (Resolvido)' if 'Normal (Resolvido)' in x.values else 'Normal'))))
+    vector_time, result = timed(utilities.worst_status, df, 'asset_id')
+    if not (result.astype(str).reindex(expected.index) == expected).all(): raise AssertionError("Paridade quebrada no pior status por ativo")
+    print(f"Pior status ({n_rows:,} linhas, {len(expected):,} ativos): lambda {lambda_time * 1000:.0f}ms | códigos {vector_time * 1000:.0f}ms | {lambda_time / vector_time:.1f}x | paridade OK")
+
+
+def legacy_add_part_to_os(db_engine, os_id, part_id, quantity):
+    """Versão anterior de add_part_to_os: lê o saldo, grava o uso em outra conexão e regrava saldo - quantidade."""
+    with db_engine.connect() as conn:
+        stock_quantity = conn.execute(text("SELECT stock_quantity FROM parts WHERE part_id = :part_id"), {"part_id": part_id}).scalar()
+        if stock_quantity is None or stock_quantity < quantity: return False
+        pd.DataFrame([{"os_id": os_id, "part_id": part_id, "quantity_used": quantity}]).to_sql("os_parts_usage", db_engine, if_exists='append', index=False)
+        conn.execute(text("UPDATE parts SET stock_quantity = :new_qty WHERE part_id = :part_id"), {"new_qty": stock_quantity - quantity, "part_id": part_id}); conn.commit()
+        return True
+
+
+def bench_stock(n_rows, n_threads=16, n_parts=5, initial_stock=200):
+    """Teste de estresse do estoque: `n_threads` técnicos retirando as mesmas peças ao mesmo tempo, com a baixa antiga
+    (ler e regravar) e com reserve_parts_for_os, comparando o saldo final com o inicial menos os usos registrados. As
+    garantias de reserve_parts_for_os (saldo nunca negativo, livro de estoque fechado) são verificadas em tests/test_stock.py."""
+    n_attempts = min(n_rows, 2000); rng = np.random.default_rng(42)
+    requests = [{f"P{p}": int(rng.integers(1, 4)) for p in rng.choice(n_parts, int(rng.integers(1, 4)), replace=False)} for _ in range(n_attempts)]
+    with temp_database(pool_size=2 * n_threads) as db_engine: # A baixa antiga usa duas conexões por retirada
+        def reset_stock():
+            with db_engine.begin() as conn:
+                for table in ('os_parts_usage', 'stock_movements', 'parts'): conn.execute(text(f"DELETE FROM {table}"))
+            utilities.write_parts([{"part_id": f"P{p}", "description": f"P{p}", "stock_quantity": initial_stock, "min_stock_level": 5, "unit_cost": 1.0} for p in range(n_parts)])
+        def check_ledger():
+            with db_engine.connect() as conn:
+                stock = dict(conn.execute(text("SELECT part_id, stock_quantity FROM parts")).fetchall())
+                used = dict(conn.execute(text("SELECT part_id, SUM(quantity_used) FROM os_parts_usage GROUP BY part_id")).fetchall())
+            return sum(initial_stock - used.get(part_id, 0) != quantity for part_id, quantity in stock.items()), min(stock.values())
+        barrier = threading.Barrier(n_threads)
+        def run(worker):
+            def task(indices):
+                barrier.wait(); return sum(bool(worker(i)) for i in indices)
+            with ThreadPoolExecutor(n_threads) as executor:
+                start = time.perf_counter(); successes = sum(executor.map(task, [range(t, n_attempts, n_threads) for t in range(n_threads)]))
+            return time.perf_counter() - start, successes
+        reset_stock()
+        elapsed, successes = run(lambda i: all(legacy_add_part_to_os(db_engine, f"OS-{i}", part_id, quantity) for part_id, quantity in requests[i].items()))
+        mismatched, min_stock = check_ledger()
+        print(f"Baixa antiga ({n_attempts:,} retiradas, {n_threads} threads): {elapsed:.2f}s | {mismatched}/{n_parts} peças com saldo divergente do uso registrado | saldo mínimo {min_stock}")
+        reset_stock()
+        def reserve(i):
+            try: utilities.reserve_parts_for_os(f"OS-{i}", requests[i]); return True
+            except utilities.InsufficientStockError: return False
+        elapsed, successes = run(reserve)
+        mismatched, min_stock = check_ledger()
+        print(f"reserve_parts_for_os ({n_attempts:,} reservas, {n_threads} threads): {elapsed:.2f}s | {successes:,} atendidas | {mismatched}/{n_parts} peças com saldo divergente | saldo mínimo {min_stock}")
+
+
+def post_readings_load(host, port, bodies, n_clients):
+    """Gerador de carga: `n_clients` conexões keep-alive enviando os corpos JSON já serializados ao /readings, como
+    gateways de CLP. Uma requisição recusada com 503 é reenviada após uma pausa curta. Retorna (latências das aceitas, nº de 503)."""
+    def client(chunk):
+        conn = http.client.HTTPConnection(host, port); latencies, refused = [], 0
+        try:
+            for body in chunk:
+                while True:
+                    start = time.perf_counter(); conn.request("POST", "/readings", body, {"Content-Type": "application/json"})
+                    response = conn.getresponse(); response.read()
+                    if response.status == 202: latencies.append(time.perf_counter() - start); break
+                    if response.status != 503: raise AssertionError(f"Resposta inesperada da ingestão: {response.status}")
+                    refused += 1; time.sleep(0.02) # O Retry-After real é de segundos; no benchmark basta ceder a vez ao gravador
+        finally:
+            conn.close()
+        return latencies, refused
+    with ThreadPoolExecutor(n_clients) as executor:
+        results = list(executor.map(client, [bodies[c::n_clients] for c in range(n_clients)]))
+    return [latency for latencies, _ in results for latency in latencies], sum(refused for _, refused in results)
+
+
+def bench_ingestion(n_rows, n_clients=8, request_size=500):
+    """Ingestão contínua via HTTP (ingestion_service), com avaliação de alertas por lote, de leituras dos perfis de ASSET_PROFILES: vazão e latência com a
+    fila folgada e com a fila apertada (backpressure com 503), conferindo que nenhuma leitura aceita se perde.
+    Referência: uma transação por leitura, como um gateway gravando direto no banco."""
+    df_frame = make_sensor_frame(n_rows); df = df_frame[INGEST_COLUMNS]
+    bodies = [df.iloc[i:i + request_size].to_json(orient='records', date_format='iso', date_unit='us').encode() for i in range(0, n_rows, request_size)]
+    expected_sum = df['temperatura'].sum()
+    with temp_database() as db_engine:
+        df_frame[['asset_id', 'asset_type']].drop_duplicates('asset_id').to_sql('assets', db_engine, if_exists='append', index=False) # Tipos para a avaliação de alertas
+        sample = [(ts.strftime(TIMESTAMP_FORMAT), asset_id, *(None if v != v else v for v in values)) for ts, asset_id, *values in df.head(2000).itertuples(index=False)]
+        def one_transaction_per_reading():
+            for row in sample:
+                with db_engine.begin() as conn: conn.exec_driver_sql(INGEST_INSERT, row)
+        single_time = timed(one_transaction_per_reading, repeat=1)[0]
+        print(f"Uma transação por leitura ({len(sample):,} leituras): {len(sample) / single_time:,.0f} leituras/s")
+        for label, max_pending in (("fila folgada", 100_000), ("fila apertada", 2 * INGEST_BATCH_SIZE)):
+            with db_engine.begin() as conn:
+                for table in ('sensor_data', 'alert_events', 'alert_watermarks'): conn.execute(text(f"DELETE FROM {table}"))
+            ingestor = SensorIngestor(max_pending=max_pending, db_engine=db_engine, storage="sqlite").start()
+            server = IngestionServer(("127.0.0.1", 0), ingestor); threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                start = time.perf_counter()
+                latencies, refused = post_readings_load("127.0.0.1", server.server_address[1], bodies, n_clients)
+                ingestor.wait_idle(); elapsed = time.perf_counter() - start
+            finally:
+                server.shutdown(); server.server_close(); ingestor.stop()
+            metrics = ingestor.metrics()
+            with db_engine.connect() as conn:
+                stored, stored_sum = conn.execute(text("SELECT COUNT(*), SUM(temperatura) FROM sensor_data")).one()
+            if stored != n_rows or not np.isclose(stored_sum, expected_sum): raise AssertionError(f"Ingestão ({label}) perdeu leituras: {stored:,} de {n_rows:,} gravadas")
+            request_ms = np.percentile(latencies, [50, 95]) * 1000
+            print(f"Ingestão HTTP, {label} ({n_rows:,} leituras, {n_clients} clientes, {request_size}/requisição): {n_rows / elapsed:,.0f} leituras/s | "
+                  f"requisição p50 {request_ms[0]:.1f}ms p95 {request_ms[1]:.1f}ms | até o commit p50 {metrics['latency_ms']['p50']}ms p95 {metrics['latency_ms']['p95']}ms | "
+                  f"{metrics['batches']} lotes | {refused} respostas 503 | nenhuma leitura perdida")
+
+
+def bench_alert_events(n_rows):
+    """Eventos de alerta: paridade com a classificação por leitura (carga inicial e em lotes, como na ingestão) e tempo
+    das consultas do histórico, do mapa e da geração de OS contra a reclassificação do histórico bruto."""
+    df = make_sensor_frame(n_rows)
+    end = df['timestamp'].max(); asset_id = df['asset_id'].iloc[-1]
+    with temp_database() as db_engine:
+        df[['asset_id', 'asset_type']].drop_duplicates('asset_id').to_sql('assets', db_engine, if_exists='append', index=False)
+        df[['timestamp', 'asset_id'] + SENSOR_COLUMNS].to_sql('sensor_data', db_engine, if_exists='append', index=False, chunksize=10000)
+        build_time = timed(utilities.update_alert_events, repeat=1)[0]
+        events = pd.read_sql("SELECT asset_id, status, reason, started_at, ended_at, last_reading_at, readings FROM alert_events ORDER BY asset_id, started_at", db_engine)
+        print(f"Carga inicial dos eventos ({n_rows:,} leituras): {build_time:.2f}s | {len(events):,} eventos")
+        df_rows = apply_alert_rules(utilities.read_sensor_rows(con=db_engine)); alerts = df_rows[df_rows['status'] != 'Normal']
+        if events['readings'].sum() != len(alerts): raise AssertionError(f"Eventos cobrem {events['readings'].sum():,} leituras em alerta de {len(alerts):,}")
+        critical = alerts.loc[alerts['status'] == 'Crítico', ['asset_id', 'status_reason']].astype(str).drop_duplicates()
+        if set(critical.itertuples(index=False, name=None)) != set(events.loc[events['status'] == 'Crítico', ['asset_id', 'reason']].itertuples(index=False, name=None)):
+            raise AssertionError("Problemas críticos dos eventos diferem da classificação por leitura")
+        # Mesmos eventos quando as leituras chegam em lotes (um por transação, como no serviço de ingestão)
+        with db_engine.begin() as conn: conn.execute(text("DELETE FROM alert_events")); conn.execute(text("DELETE FROM alert_watermarks"))
+        df_raw = utilities.read_sensor_rows(con=db_engine)
+        def evaluate_in_batches():
+            for i in range(0, len(df_raw), INGEST_BATCH_SIZE):
+                with db_engine.begin() as conn: utilities.evaluate_alert_events(conn, df_raw.iloc[i:i + INGEST_BATCH_SIZE])
+        batch_time = timed(evaluate_in_batches, repeat=1)[0]
+        streamed = pd.read_sql("SELECT asset_id, status, reason, started_at, ended_at, last_reading_at, readings FROM alert_events ORDER BY asset_id, started_at", db_engine)
+        if not streamed.equals(events): raise AssertionError("Eventos gravados em lotes diferem da carga inicial")
+        print(f"Avaliação em lotes de {INGEST_BATCH_SIZE:,} leituras: {n_rows / batch_time:,.0f} leituras/s | paridade com a carga inicial e com a classificação por leitura")
+        def raw_history():
+            df_asset = apply_alert_rules(utilities.read_sensor_rows(con=db_engine))
+            return df_asset[(df_asset['asset_id'] == asset_id) & (df_asset['status'] != 'Normal')]
+        raw_time, _ = timed(raw_history)
+        event_time, _ = timed(lambda: utilities.read_alert_events(asset_ids=[asset_id]))
+        print(f"Histórico de alertas ({asset_id}): reclassificação {raw_time * 1000:.0f}ms | eventos {event_time * 1000:.1f}ms | {raw_time / event_time:.0f}x")
+        raw_time, raw_summary = timed(lambda: utilities.worst_status(apply_alert_rules(utilities.read_sensor_rows(end - pd.Timedelta(hours=1), db_engine)), 'asset_id'))
+        event_time, event_summary = timed(lambda: utilities.load_alert_status_summary(pd.Timedelta(hours=1), end=end))
+        if not event_summary.set_index('asset_id')['status'].reindex(raw_summary.index).astype(str).equals(raw_summary.astype(str)): raise AssertionError("Resumo de status (1h) difere da classificação por leitura")
+        print(f"Status por ativo (1h, {len(raw_summary)} ativos): leituras brutas {raw_time * 1000:.0f}ms | eventos {event_time * 1000:.1f}ms | {raw_time / event_time:.0f}x")
+        raw_time, _ = timed(lambda: apply_alert_rules(utilities.read_sensor_rows(con=db_engine)).query("status == 'Crítico'")[['asset_id', 'status_reason']].drop_duplicates())
+        event_time, _ = timed(lambda: utilities.read_alert_events(statuses=['Crítico']).drop_duplicates(['asset_id', 'reason']))
+        print(f"Problemas críticos para a geração de OS: reclassificação {raw_time * 1000:.0f}ms | eventos {event_time * 1000:.1f}ms | {raw_time / event_time:.0f}x")
+
+
+BENCHMARKS = {'alert_rules': bench_alert_rules, 'sqlite': bench_sqlite, 'forecast': bench_forecast, 'storage': bench_storage, 'sensor_schema': bench_sensor_schema, 'rollups': bench_rollups, 'downsampling': bench_downsampling, 'worst_status': bench_worst_status, 'stock': bench_stock, 'ingestion': bench_ingestion, 'alert_events': bench_alert_events}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks da camada de dados e análise.")
+    parser.add_argument('benchmarks', nargs='*', help=f"Benchmarks a executar (padrão: todos). Opções: {', '.join(BENCHMARKS)}.")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Número de leituras de sensor sintéticas.")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown: parser.error(f"benchmark(s) desconhecido(s): {', '.join(unknown)}")
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.rows)
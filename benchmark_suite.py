@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Suíte de benchmarks ponta a ponta da camada de dados e análise, executada sem o Streamlit:
+#   python benchmark_suite.py [--sizes 10k 1m 10m] [--orders 1000 10000 100000] [--output benchmark_results.json] [--compare anterior.json]
+# Cada tamanho de histórico de sensores vira um banco próprio, gerado por gerador_de_dados.py com semente e data final
+# fixas. Cada combinação (sensores, OS) roda em um processo separado com o diretório do banco como diretório atual:
+# os módulos usam esse banco e o pico de memória de um caso não contamina o seguinte. O resultado é um JSON com o
+# tempo (melhor de --repeat execuções) e o pico de memória alocada (tracemalloc, numa execução à parte) de cada
+# função, para comparar commits.
+
+SUITE_SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+SUITE_ORDERS = [1_000, 10_000, 100_000]
+SUITE_SEED = 42
+SUITE_END = '2025-01-01' # Fim fixo do histórico: os mesmos dados em qualquer dia e em qualquer commit
+SUITE_FREQ = '1min'
+SUITE_MIN_ASSETS = 30 # Um ativo de cada tipo
+SUITE_MAX_ASSETS = 2000
+SUITE_RESOLVED_FRACTION = 0.05 # Fração dos ativos com um motivo de alerta marcado como resolvido
+ARIMA_SAMPLE_SERIES = 50 # Séries ajustadas na medição da varredura ARIMA (o total é extrapolado pelo tempo por série)
+DATASET_MARKER = 'dataset.json'
+DERIVED_TABLES = ('service_orders', 'resolved_alerts', 'os_parts_usage', 'sensor_rollups', 'rollup_watermarks',
+                  'alert_events', 'alert_watermarks', 'forecasts', 'kpi_asset_daily', 'kpi_daily', 'kpi_state', 'kpi_dirty_assets')
+
+
+def measure(func, setup=None, repeat=1, trace_memory=True):
+    """Melhor tempo de `repeat` execuções e pico de memória alocada (tracemalloc) em uma execução à parte, para que o
+    rastreamento não pese no tempo. `setup` roda antes de cada execução, fora da medição, e devolve os argumentos de
+    `func`. Sem `trace_memory` (trabalho feito em outros processos, que o tracemalloc não vê), o pico é None.
+    Retorna (segundos, pico em MB, resultado)."""
+    best = float('inf'); result = None
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter(); result = func(*args); best = min(best, time.perf_counter() - start)
+    if not trace_memory: return best, None, result
+    args = setup() if setup else ()
+    tracemalloc.start()
+    try:
+        func(*args); peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 1e6, result
+
+
+def suite_assets(n_rows):
+    return min(SUITE_MAX_ASSETS, max(SUITE_MIN_ASSETS, n_rows // 1440))
+
+
+def prepare_dataset(n_rows, n_orders, seed, rebuild=False):
+    """No diretório atual: gera o histórico de sensores (reaproveitado se o marcador confere) e regrava as OS e os
+    alertas resolvidos. As tabelas derivadas (rollups, eventos, previsões, KPIs) são limpas: cada medição parte do zero."""
+    import numpy as np
+    import pandas as pd
+    from sqlalchemy import text
+    import utilities
+    from gerador_de_dados import OS_HISTORY_DAYS, generate_plant_data, generate_service_orders, write_service_orders
+    n_assets = suite_assets(n_rows); periods = max(1, n_rows // n_assets); end = pd.Timestamp(SUITE_END)
+    spec = {'rows': n_assets * periods, 'assets': n_assets, 'freq': SUITE_FREQ, 'seed': seed, 'end': SUITE_END, 'storage': utilities.SENSOR_STORAGE}
+    marker = None
+    if os.path.exists(DATASET_MARKER):
+        with open(DATASET_MARKER) as f: marker = json.load(f)
+    if rebuild or marker != spec:
+        generate_plant_data(n_assets, periods * pd.Timedelta(SUITE_FREQ) / pd.Timedelta(days=1), SUITE_FREQ, seed, end=end)
+        with open(DATASET_MARKER, 'w') as f: json.dump(spec, f)
+    utilities.migrate_database()
+    with utilities.engine.begin() as conn:
+        for table in DERIVED_TABLES: conn.execute(text(f"DELETE FROM {table}"))
+    df_assets = pd.read_sql("SELECT asset_id, asset_type FROM assets", utilities.engine)
+    write_service_orders(generate_service_orders(df_assets, n_orders, np.random.default_rng([seed, 2]), end - pd.Timedelta(days=OS_HISTORY_DAYS), end))
+    rng = np.random.default_rng([seed, 3]); resolved = df_assets[rng.random(len(df_assets)) < SUITE_RESOLVED_FRACTION]
+    with utilities.engine.begin() as conn:
+        conn.exec_driver_sql("INSERT OR IGNORE INTO resolved_alerts (asset_id, reason) VALUES (?, ?)",
+                             list(zip(resolved['asset_id'], rng.choice(utilities.ALERT_RULES['reasons'][1:], len(resolved)))))
+    return dict(spec, orders=n_orders)
+
+
+def run_measurements(groups, repeat=1, arima_series=ARIMA_SAMPLE_SERIES):
+    """Mede as funções do grupo 'sensors' (histórico de sensores) e/ou 'orders' (OS) no banco do diretório atual."""
+    import warnings
+    from sqlalchemy import text
+    import utilities
+    from kpi_engine import refresh_kpis
+    from prediction_engine import fit_arima_batch, find_stale_series, load_sensor_histories, refresh_forecasts
+    results = []
+    def record(function, measured, **extra):
+        seconds, peak_mb, _ = measured
+        results.append({'function': function, 'seconds': round(seconds, 6), 'peak_mb': round(peak_mb, 3) if peak_mb is not None else None, **extra})
+        print(f"  {function}: {seconds * 1000:,.1f}ms | " + (f"pico {peak_mb:,.1f}MB" if peak_mb is not None else "pico não medido") + ''.join(f" | {key} {value:,}" for key, value in extra.items()), flush=True)
+        return measured[2]
+    def clear_tables(*tables):
+        with utilities.engine.begin() as conn:
+            for table in tables: conn.execute(text(f"DELETE FROM {table}"))
+        return ()
+    def remove_generated_orders():
+        # As OS sintéticas terminam em SUITE_END; as criadas pela medição anterior têm a data de agora
+        with utilities.engine.begin() as conn: conn.execute(text("DELETE FROM service_orders WHERE creation_date > :end"), {"end": SUITE_END})
+        return ()
+    if 'sensors' in groups:
+        df_raw = record('read_sensor_rows', measure(utilities.read_sensor_rows, repeat=repeat))
+        record('apply_alert_rules', measure(lambda: utilities.apply_alert_rules(df_raw), repeat=repeat), rows=len(df_raw))
+        del df_raw
+    # O frame analisado alimenta a supressão e a geração de OS; no grupo 'orders' sozinho é carregado fora da medição
+    if 'sensors' in groups:
+        df_analyzed = record('load_and_analyze_sensor_data', measure(utilities.load_and_analyze_sensor_data, repeat=repeat))
+        record('suppress_resolved_alerts', measure(utilities.suppress_resolved_alerts, lambda: (df_analyzed,), repeat))
+        record('update_sensor_rollups (carga inicial)', measure(utilities.update_sensor_rollups, lambda: clear_tables('sensor_rollups', 'rollup_watermarks'), repeat))
+        record('update_alert_events (carga inicial)', measure(utilities.update_alert_events, lambda: clear_tables('alert_events', 'alert_watermarks'), repeat))
+        record('load_alert_status_summary (24h)', measure(lambda: utilities.load_alert_status_summary(utilities.pd.Timedelta(hours=24)), repeat=repeat))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore') # Avisos de convergência do statsmodels
+            series = record('refresh_forecasts (híbrido)', measure(refresh_forecasts, lambda: clear_tables('forecasts'), repeat))
+            # Varredura ARIMA completa (backend 'arima' da página de previsão): amostra de séries, total extrapolado.
+            # Os ajustes rodam no pool de processos de fit_arima_batch, fora do alcance do tracemalloc: pico não medido
+            clear_tables('forecasts'); stale = find_stale_series('arima')
+            sample = stale.head(arima_series); histories = dict(tuple(load_sensor_histories(sample['asset_id'].unique()).groupby('asset_id')))
+            values = [histories[row.asset_id][row.sensor].dropna().to_numpy(dtype=float) for row in sample.itertuples() if row.asset_id in histories]
+            if values:
+                record('varredura ARIMA (amostra)', measure(lambda: fit_arima_batch(values), repeat=repeat, trace_memory=False), series=len(values), total_series=len(stale), forecasts_refreshed=series)
+                results[-1]['estimated_total_seconds'] = round(results[-1]['seconds'] / len(values) * len(stale), 3)
+    else:
+        df_analyzed = utilities.load_and_analyze_sensor_data()
+    if 'orders' in groups:
+        df_os = record('load_service_orders', measure(utilities.load_service_orders, repeat=repeat))
+        record('query_service_orders (1ª página)', measure(utilities.query_service_orders, repeat=repeat))
+        generated = record('check_and_generate_os', measure(utilities.check_and_generate_os, lambda: remove_generated_orders() + (df_analyzed, df_os), repeat))
+        results[-1]['generated'] = len(generated) - len(df_os)
+        generated = record('check_and_generate_recurring_os', measure(utilities.check_and_generate_recurring_os, lambda: remove_generated_orders() + (df_os,), repeat))
+        results[-1]['generated'] = len(generated) - len(df_os)
+        remove_generated_orders()
+        record('refresh_kpis (reconstrução)', measure(lambda: refresh_kpis(rebuild=True), repeat=repeat))
+    return results
+
+
+def run_worker(args):
+    spec = prepare_dataset(args.rows, args.orders, args.seed, args.rebuild)
+    results = run_measurements(args.groups.split(','), args.repeat, args.arima_series)
+    with open(args.result_file, 'w') as f:
+        json.dump({'dataset': spec, 'results': results, 'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}, f)
+
+
+def git_commit(repo_dir):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def print_comparison(previous, current):
+    """Razão entre os tempos e picos de memória atuais e os de um JSON anterior, para as mesmas (dataset, função)."""
+    def by_key(report):
+        return {(run['size'], run['dataset']['orders'], result['function']): result for run in report['runs'] for result in run['results']}
+    before, after = by_key(previous), by_key(current)
+    print(f"\nComparação com {previous.get('commit') or 'resultado anterior'} (razão atual/anterior; < 1 = melhor):")
+    for key in [key for key in after if key in before]:
+        old, new = before[key], after[key]
+        memory = f"{new['peak_mb'] / max(old['peak_mb'], 1e-9):.2f}x" if new['peak_mb'] is not None and old['peak_mb'] is not None else "não medida"
+        print(f"  [{key[0]} leituras, {key[1]:,} OS] {key[2]}: tempo {new['seconds'] / max(old['seconds'], 1e-9):.2f}x | memória {memory}")
+
+
+def run_suite(sizes, order_counts, output, data_dir=None, repeat=1, seed=SUITE_SEED, rebuild=False, arima_series=ARIMA_SAMPLE_SERIES, compare=None):
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    keep_data = data_dir is not None; data_dir = os.path.abspath(data_dir) if keep_data else tempfile.mkdtemp(prefix='maintence-bench-')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo_dir, os.environ.get('PYTHONPATH')])))
+    runs = []
+    try:
+        for size in sizes:
+            dataset_dir = os.path.join(data_dir, f"sensors-{size}"); os.makedirs(dataset_dir, exist_ok=True)
+            for i, n_orders in enumerate(order_counts):
+                # As funções do histórico de sensores não dependem das OS: são medidas só na primeira quantidade de OS
+                groups = 'sensors,orders' if i == 0 else 'orders'
+                result_file = os.path.join(dataset_dir, 'result.json')
+                print(f"[{size} leituras, {n_orders:,} OS]", flush=True)
+                subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', '--rows', str(SUITE_SIZES[size]), '--orders', str(n_orders), '--groups', groups,
+                                '--repeat', str(repeat), '--seed', str(seed), '--arima-series', str(arima_series), '--result-file', result_file] + (['--rebuild'] if rebuild and i == 0 else []),
+                               cwd=dataset_dir, env=env, check=True)
+                with open(result_file) as f: runs.append(dict(json.load(f), size=size))
+    finally:
+        if not keep_data: shutil.rmtree(data_dir, ignore_errors=True)
+    report = {'created_at': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(repo_dir), 'python': platform.python_version(), 'platform': platform.platform(),
+              'cpu_count': os.cpu_count(), 'seed': seed, 'repeat': repeat, 'runs': runs}
+    with open(output, 'w') as f: json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {output}.")
+    if compare:
+        with open(compare) as f: print_comparison(json.load(f), report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks ponta a ponta da camada de dados e análise, com resultados em JSON.")
+    parser.add_argument('--sizes', nargs='+', choices=list(SUITE_SIZES), default=list(SUITE_SIZES), help="Tamanhos do histórico de sensores.")
+    parser.add_argument('--orders', nargs='+', type=int, default=SUITE_ORDERS, help="Quantidades de OS (para cada tamanho).")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', default=None, help="JSON de uma execução anterior para comparar.")
+    parser.add_argument('--data-dir', default=None, help="Diretório dos bancos gerados (mantido e reaproveitado; padrão: temporário).")
+    parser.add_argument('--repeat', type=int, default=1, help="Execuções cronometradas por função (vale a melhor).")
+    parser.add_argument('--seed', type=int, default=SUITE_SEED)
+    parser.add_argument('--rebuild', action='store_true', help="Regera o histórico de sensores mesmo se já existir em --data-dir.")
+    parser.add_argument('--arima-series', type=int, default=ARIMA_SAMPLE_SERIES, help="Séries ajustadas na medição da varredura ARIMA.")
+    # Execução interna de um caso (sensores, OS), chamada pela própria suíte no diretório do banco
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--rows', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--groups', default='sensors,orders', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        args.orders = args.orders if isinstance(args.orders, int) else args.orders[0]
+        run_worker(args)
+    else:
+        run_suite(args.sizes, args.orders, args.output, args.data_dir, args.repeat, args.seed, args.rebuild, args.arima_series, args.compare)
@@ -4,6 +4,7 @@ import plotly.express as px
 import numpy as np
 import os
 from datetime import datetime
+from utilities import worst_status
 
 st.set_page_config(page_title="Dashboard de Gestão de Ativos", layout="wide")
 
@@ -215,9 +216,8 @@ with tab1:
     st.subheader("Status dos Ativos (24h)")
     asset_status_summary = df_last_24h.groupby('asset_id').agg(
         asset_type=('asset_type', 'first'),
-        location=('location', 'first'),
-        status=('status', lambda x: 'Crítico' if 'Crítico' in x.values else ('Atenção' if 'Atenção' in x.values else 'Normal'))
-    ).reset_index()
+        location=('location', 'first')
+    ).join(worst_status(df_last_24h, 'asset_id')).reset_index()
     
     def style_alert_rows(row):
         if row.status == 'Crítico': return ['background-color: #8B0000; color: white'] * len(row)
@@ -231,12 +231,10 @@ with tab2:
     # (Código da Tab2 permanece o mesmo)
     st.header("🗺️ Mapa da Planta")
     asset_locations = df_analyzed[['asset_id', 'latitude', 'longitude']].drop_duplicates().set_index('asset_id')
-    asset_status_summary_map = df_analyzed[df_analyzed['timestamp'] >= (df_analyzed['timestamp'].max() - pd.Timedelta(hours=1))].groupby('asset_id').agg(
-        status=('status', lambda x: 'Crítico' if 'Crítico' in x.values else ('Atenção' if 'Atenção' in x.values else 'Normal'))
-    ).reset_index().set_index('asset_id')
+    asset_status_summary_map = worst_status(df_analyzed, 'asset_id', start=df_analyzed['timestamp'].max() - pd.Timedelta(hours=1)).to_frame()
     map_data = asset_locations.join(asset_status_summary_map).reset_index()
     color_map = {'Normal': '#008000', 'Atenção': '#FFA500', 'Crítico': '#FF0000'}
-    map_data['color'] = map_data['status'].map(color_map)
+    map_data['color'] = map_data['status'].astype(str).map(color_map)
     map_data.rename(columns={'latitude': 'lat', 'longitude': 'lon'}, inplace=True)
     st.map(map_data, color='color', size=20)
     st.write("### Legenda")
@@ -1,15 +1,21 @@
-import pandas as pd
+import argparse
+import os
+import shutil
+import time
 import numpy as np
-import random
-import uuid
-from sqlalchemy import create_engine, text
-from datetime import datetime, timedelta
-from utilities import initialize_database, ASSET_PROFILES, engine, save_assets
-
-print("Iniciando a geração de dados...")
+import pandas as pd
+from sqlalchemy import text
+from utilities import (
+    initialize_database, ALERT_RULES, ASSET_PROFILES, RECURRENCE_PERIODS, ROOT_CAUSES, SENSOR_COLUMNS, SENSOR_DATA_INDEXES, SENSOR_STORAGE, SQLITE_PRAGMAS,
+    TIMESTAMP_FORMAT, engine, save_assets
+)
+from parquet_store import PARQUET_DIR, write_sensor_readings
 
-# Limpa todas as tabelas transacionais e recria a estrutura do DB
-initialize_database(clear_all=True)
+# Gerador de dados sintéticos da planta (ativos + histórico de sensores), vetorizado e com semente:
+#   python gerador_de_dados.py [--assets 150] [--days 1] [--freq 1min] [--seed 42] [--storage sqlite|parquet] [--orders 0]
+# Todos os ativos x instantes são gerados como arrays NumPy e gravados em blocos de até --chunk-rows leituras,
+# então a memória não cresce com o tamanho do histórico (ex.: --assets 2000 --days 90 --freq 5min).
+# Com a mesma semente e os mesmos parâmetros os dados são idênticos, qualquer que seja o tamanho do bloco.
 
 tipos_de_equipamentos = [
     "Torno CNC", "Fresadora", "Compressor de Ar Industrial", "Prensa Hidráulica",
@@ -24,58 +30,186 @@ tipos_de_equipamentos = [
     "Silo de Armazenamento"
 ]
 
-total_ativos = 150
-ativos_por_tipo = total_ativos // len(tipos_de_equipamentos)
-lista_de_ativos = []
-
-print(f"Gerando {total_ativos} ativos...")
-for tipo in tipos_de_equipamentos:
-    for i in range(1, ativos_por_tipo + 1):
-        tipo_id = tipo.replace(' ', '_').upper()
-        asset_id = f"{tipo_id}-{str(i).zfill(3)}"
-        location = f"Setor {random.choice(['A','B','C','D','E'])}-Linha {random.randint(1, 10)}"
-        install_date = (datetime.now() - timedelta(days=random.randint(30, 365*5))).strftime('%Y-%m-%d')
-        lista_de_ativos.append({'asset_id': asset_id, 'asset_type': tipo, 'location': location, 'description': f"{tipo} modelo #{i}", 'install_date': install_date})
-
-df_assets = pd.DataFrame(lista_de_ativos)
-save_assets(df_assets)
-print(f"{len(df_assets)} ativos criados e salvos.")
-
-NUM_PONTOS = 1440
-FREQ = '1min'
-all_sensor_data = []
-print("Gerando dados de sensores...")
-
-for index, asset in df_assets.iterrows():
-    asset_id = asset['asset_id']
-    asset_type = asset['asset_type']
-    if asset_type in ASSET_PROFILES:
-        profile = ASSET_PROFILES[asset_type]
-        timestamps = pd.date_range(end=pd.Timestamp.now(), periods=NUM_PONTOS, freq=FREQ)
-        sensor_data_dict = {
-            'timestamp': timestamps, 'asset_id': asset_id, 'asset_type': asset_type,
-            'location': asset['location'], 'latitude': -18.420 + random.uniform(-0.008, 0.008),
-            'longitude': -49.225 + random.uniform(-0.008, 0.008)
-        }
+DEFAULT_ASSETS = 150
+DEFAULT_DAYS = 1
+DEFAULT_FREQ = '1min'
+DEFAULT_CHUNK_ROWS = 200_000 # Leituras por bloco gravado (limita a memória do gerador)
+ANOMALY_RATE = 0.20 # Fração de ativos com um pico crítico curto (como no gerador original)
+ANOMALY_STEPS = (10, 20) # Duração do pico, em leituras
+DRIFT_RATE = 0.05 # Fração de ativos com degradação gradual de um parâmetro até a faixa de atenção/crítico
+OS_HISTORY_DAYS = 365 # Período mínimo do histórico de OS sintéticas
+OS_CLASSES = (['Corretiva', 'Preventiva', 'Preditiva'], [0.5, 0.35, 0.15])
+OS_STATUSES = (['Concluída', 'Aberta', 'Em Andamento'], [0.8, 0.12, 0.08])
+OS_PRIORITIES = ["Baixa", "Média", "Alta", "Crítica"]
+OS_MANUAL_REASONS = ["Inspeção de rotina", "Lubrificação geral", "Troca de filtro", "Ruído anormal", "Vazamento", "Falha na partida", "Calibração de sensores", "Aperto de conexões"]
+OS_COLUMNS = ['os_id', 'asset_id', 'asset_type', 'creation_date', 'reason', 'priority', 'status', 'class', 'recorrencia', 'assigned_to', 'notes', 'estimated_cost', 'actual_cost', 'files_attached', 'root_cause', 'completion_date']
+SENSOR_INSERT = f"INSERT INTO sensor_data (timestamp, asset_id, {', '.join(SENSOR_COLUMNS)}) VALUES ({', '.join('?' * (len(SENSOR_COLUMNS) + 2))})"
+
+
+def generate_assets(n_assets, rng):
+    """Cadastro de `n_assets` ativos distribuídos entre os tipos (IDs TIPO-001, TIPO-002, ... por tipo)."""
+    type_index = np.sort(np.arange(n_assets) % len(tipos_de_equipamentos), kind='stable')
+    asset_types = np.array(tipos_de_equipamentos, dtype=object)[type_index]
+    number = np.arange(n_assets) - np.searchsorted(type_index, type_index) + 1
+    df_assets = pd.DataFrame({'asset_id': [f"{t.replace(' ', '_').upper()}-{n:03d}" for t, n in zip(asset_types, number)], 'asset_type': asset_types})
+    df_assets['location'] = [f"Setor {s}-Linha {l}" for s, l in zip(rng.choice(list('ABCDE'), n_assets), rng.integers(1, 11, n_assets))]
+    df_assets['description'] = [f"{t} modelo #{n}" for t, n in zip(asset_types, number)]
+    df_assets['install_date'] = (pd.Timestamp.now().normalize() - pd.to_timedelta(rng.integers(30, 365*5 + 1, n_assets), unit='D')).strftime('%Y-%m-%d')
+    df_assets['latitude'] = -18.420 + rng.uniform(-0.008, 0.008, n_assets); df_assets['longitude'] = -49.225 + rng.uniform(-0.008, 0.008, n_assets)
+    return df_assets
+
+
+def plan_sensor_series(asset_types, periods, rng, anomaly_rate=ANOMALY_RATE, drift_rate=DRIFT_RATE):
+    """Parâmetros de cada (ativo, sensor) vindos de ASSET_PROFILES (todos os tipos devem ter perfil) e os padrões
+    injetados, sorteados uma única vez: um pico no nível crítico (anomalia) e uma rampa linear a partir de um instante
+    até um alvo entre o limite de atenção e pouco acima do crítico (deriva). Sensores fora do perfil ficam NaN."""
+    shape = (len(asset_types), len(SENSOR_COLUMNS))
+    plan = {key: np.full(shape, np.nan) for key in ('mean', 'std', 'low', 'high', 'op_max', 'warn_factor', 'crit_factor')}
+    for asset_type, profile in ASSET_PROFILES.items():
+        rows = np.flatnonzero(asset_types == asset_type)
         for param, config in profile['params'].items():
-            dados_normais = config['mean'] + config['std'] * np.random.randn(NUM_PONTOS)
-            sensor_data_dict[param] = np.clip(dados_normais, config['op_min'] * 0.9, config['op_max'] * 1.1)
-        
-        df_sensor_asset = pd.DataFrame(sensor_data_dict)
-        
-        if random.random() < 0.20:
-            param_to_affect = random.choice(list(profile['params'].keys()))
-            start_index = random.randint(0, NUM_PONTOS - 60)
-            end_index = start_index + random.randint(10, 20)
-            anomalous_value = profile['params'][param_to_affect]['op_max'] * profile['params'][param_to_affect].get('crit_factor', 1.5)
-            df_sensor_asset.loc[start_index:end_index, param_to_affect] = anomalous_value + np.random.randn()
-        
-        all_sensor_data.append(df_sensor_asset)
-
-if all_sensor_data:
-    df_final_sensores = pd.concat(all_sensor_data, ignore_index=True)
-    try:
-        df_final_sensores.to_sql('sensor_data', engine, if_exists='append', index=False, chunksize=10000)
-        print(f"Dados de sensores salvos com sucesso.")
-    except Exception as e:
-        print(f"Ocorreu um erro ao salvar os dados de sensores no banco de dados: {e}")
\ No newline at end of file
+            s = SENSOR_COLUMNS.index(param)
+            plan['mean'][rows, s], plan['std'][rows, s] = config['mean'], config['std']
+            plan['low'][rows, s], plan['high'][rows, s] = config['op_min']*0.9, config['op_max']*1.1
+            plan['op_max'][rows, s], plan['warn_factor'][rows, s], plan['crit_factor'][rows, s] = config['op_max'], config['warn_factor'], config['crit_factor']
+    def pick_param():
+        # Um parâmetro do perfil de cada ativo, sorteado de forma uniforme
+        return np.where(np.isnan(plan['mean']), -1, rng.random(shape)).argmax(axis=1)
+    assets = np.arange(shape[0])
+    anomaly_param = pick_param(); anomaly = np.flatnonzero(rng.random(shape[0]) < anomaly_rate)
+    plan['anomaly'] = {'assets': anomaly, 'param': anomaly_param[anomaly], 'start': rng.integers(0, max(1, periods - 60), shape[0])[anomaly]}
+    plan['anomaly']['end'] = plan['anomaly']['start'] + rng.integers(ANOMALY_STEPS[0], ANOMALY_STEPS[1] + 1, shape[0])[anomaly]
+    plan['anomaly']['value'] = (plan['op_max']*plan['crit_factor'])[assets, anomaly_param][anomaly] + rng.standard_normal(shape[0])[anomaly]
+    drift_param = pick_param(); drift = np.flatnonzero(rng.random(shape[0]) < drift_rate)
+    drift_start = rng.integers(0, max(1, periods // 2), shape[0])[drift]
+    target = plan['op_max'][assets, drift_param][drift] * rng.uniform(plan['warn_factor'][assets, drift_param][drift], plan['crit_factor'][assets, drift_param][drift]*1.05)
+    plan['drift'] = {'assets': drift, 'param': drift_param[drift], 'start': drift_start, 'slope': (target - plan['mean'][assets, drift_param][drift]) / np.maximum(periods - 1 - drift_start, 1)}
+    return plan
+
+
+def generate_sensor_block(plan, seed, first_step, n_steps):
+    """Leituras dos instantes [first_step, first_step + n_steps) de todos os ativos, como array (instante, ativo, sensor).
+    O ruído de cada instante vem de um gerador próprio derivado da semente, então o resultado não depende do bloco."""
+    noise = np.stack([np.random.default_rng([seed, step]).standard_normal(plan['mean'].shape) for step in range(first_step, first_step + n_steps)])
+    values = np.clip(plan['mean'] + plan['std']*noise, plan['low'], plan['high'])
+    steps = np.arange(first_step, first_step + n_steps)[:, None]
+    drift = plan['drift']
+    if len(drift['assets']): values[:, drift['assets'], drift['param']] += drift['slope'] * np.maximum(steps - drift['start'], 0)
+    anomaly = plan['anomaly']
+    if len(anomaly['assets']):
+        in_spike = (steps >= anomaly['start']) & (steps <= anomaly['end'])
+        values[:, anomaly['assets'], anomaly['param']] = np.where(in_spike, anomaly['value'], values[:, anomaly['assets'], anomaly['param']])
+    return values
+
+
+def generate_sensor_chunks(df_assets, periods, freq=DEFAULT_FREQ, end=None, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS, anomaly_rate=ANOMALY_RATE, drift_rate=DRIFT_RATE):
+    """Gera o histórico de sensores em frames de até `chunk_rows` leituras, em ordem de tempo (todos os ativos de cada instante)."""
+    # Tipo, localização e coordenadas ficam apenas na tabela `assets`; só ativos com perfil têm leituras
+    df_assets = df_assets[df_assets['asset_type'].isin(list(ASSET_PROFILES))]
+    if df_assets.empty: return
+    asset_ids = df_assets['asset_id'].to_numpy()
+    plan = plan_sensor_series(df_assets['asset_type'].to_numpy(), periods, np.random.default_rng([seed, 1]), anomaly_rate, drift_rate)
+    timestamps = pd.date_range(end=end if end is not None else pd.Timestamp.now(), periods=periods, freq=freq)
+    steps_per_chunk = max(1, chunk_rows // len(asset_ids))
+    for first_step in range(0, periods, steps_per_chunk):
+        n_steps = min(steps_per_chunk, periods - first_step)
+        values = generate_sensor_block(plan, seed, first_step, n_steps).reshape(-1, len(SENSOR_COLUMNS))
+        df_chunk = pd.DataFrame(values, columns=SENSOR_COLUMNS)
+        df_chunk.insert(0, 'asset_id', np.tile(asset_ids, n_steps)); df_chunk.insert(0, 'timestamp', np.repeat(timestamps[first_step:first_step + n_steps], len(asset_ids)))
+        yield df_chunk
+
+
+def write_sensor_chunks(chunks, storage=SENSOR_STORAGE, db_engine=None):
+    """Grava os blocos conforme chegam (executemany direto no driver ou um conjunto de arquivos Parquet por bloco).
+    No SQLite os índices de sensor_data são recriados só no fim, depois da carga. Retorna o número de leituras gravadas."""
+    db_engine = db_engine if db_engine is not None else engine
+    written = 0
+    if storage == "parquet":
+        for df_chunk in chunks: write_sensor_readings(df_chunk); written += len(df_chunk)
+        return written
+    with db_engine.connect() as conn:
+        for ddl in SENSOR_DATA_INDEXES: conn.execute(text(f"DROP INDEX IF EXISTS {ddl.split(' IF NOT EXISTS ')[1].split()[0]}"))
+        conn.commit()
+        try:
+            for df_chunk in chunks:
+                # NaN vira NULL no SQLite; os timestamps vão no formato da coluna sensor_data.timestamp (formatados uma vez por instante)
+                codes, instants = pd.factorize(df_chunk['timestamp'])
+                rows = zip(np.array(instants.strftime(TIMESTAMP_FORMAT), dtype=object)[codes].tolist(), df_chunk['asset_id'].tolist(), *(df_chunk[c].tolist() for c in SENSOR_COLUMNS))
+                conn.exec_driver_sql("BEGIN IMMEDIATE"); conn.exec_driver_sql(SENSOR_INSERT, list(rows)); conn.commit()
+                written += len(df_chunk)
+        finally:
+            # A ordenação da criação dos índices vai para arquivos temporários (temp_store=MEMORY a manteria inteira na RAM)
+            conn.exec_driver_sql("PRAGMA temp_store = FILE")
+            for ddl in SENSOR_DATA_INDEXES: conn.execute(text(ddl))
+            conn.commit(); conn.exec_driver_sql(f"PRAGMA temp_store = {SQLITE_PRAGMAS['temp_store']}")
+    return written
+
+
+def generate_service_orders(df_assets, n_orders, rng, start, end):
+    """Histórico sintético de `n_orders` OS criadas em [start, end): OS preditivas com os motivos das regras de alerta,
+    preventivas com recorrência e, nas concluídas, data de conclusão, custo real e causa raiz."""
+    n_orders = int(n_orders); asset_index = rng.integers(0, len(df_assets), n_orders)
+    os_class = rng.choice(OS_CLASSES[0], n_orders, p=OS_CLASSES[1]); status = rng.choice(OS_STATUSES[0], n_orders, p=OS_STATUSES[1])
+    creation = pd.Series(pd.Timestamp(start) + pd.to_timedelta(rng.random(n_orders) * (pd.Timestamp(end) - pd.Timestamp(start)).total_seconds(), unit='s'))
+    reason = np.where(os_class == 'Preditiva', rng.choice(ALERT_RULES['reasons'][1:], n_orders), rng.choice(OS_MANUAL_REASONS, n_orders))
+    recurrence = np.where(os_class == 'Preventiva', rng.choice(['Não recorrente'] + list(RECURRENCE_PERIODS), n_orders), 'Não recorrente')
+    completed = status == 'Concluída'
+    estimated_cost = np.round(rng.gamma(2.0, 400.0, n_orders), 2)
+    completion = (creation + pd.to_timedelta(rng.exponential(8.0, n_orders), unit='h')).clip(upper=pd.Timestamp(end)).where(completed)
+    return pd.DataFrame({
+        'os_id': [f"OS-{value:012x}" for value in rng.integers(0, 16**12, n_orders, dtype=np.int64)], 'asset_id': df_assets['asset_id'].to_numpy()[asset_index],
+        'asset_type': df_assets['asset_type'].to_numpy()[asset_index], 'creation_date': creation, 'reason': reason,
+        'priority': np.where(os_class == 'Preditiva', 'Crítica', rng.choice(OS_PRIORITIES, n_orders)), 'status': status, 'class': os_class, 'recorrencia': recurrence,
+        'assigned_to': rng.choice(["Não atribuído", "Administrador", "Operador"], n_orders), 'notes': '', 'estimated_cost': estimated_cost,
+        'actual_cost': np.where(completed, np.round(estimated_cost * rng.uniform(0.6, 1.6, n_orders), 2), 0.0), 'files_attached': '[]',
+        'root_cause': np.where(completed, rng.choice(ROOT_CAUSES[1:], n_orders), None), 'completion_date': completion,
+    }).drop_duplicates('os_id')
+
+
+def write_service_orders(df_orders, db_engine=None):
+    """Grava as OS em uma única transação (executemany direto no driver, datas no formato das colunas)."""
+    db_engine = db_engine if db_engine is not None else engine
+    df_orders = df_orders[OS_COLUMNS].astype(object)
+    for column in ('creation_date', 'completion_date'): df_orders[column] = pd.to_datetime(df_orders[column]).dt.strftime(TIMESTAMP_FORMAT).astype(object).where(df_orders[column].notna(), None)
+    with db_engine.begin() as conn:
+        conn.exec_driver_sql(f"INSERT INTO service_orders ({', '.join(OS_COLUMNS)}) VALUES ({', '.join('?' * len(OS_COLUMNS))})", list(df_orders.itertuples(index=False, name=None)))
+    return len(df_orders)
+
+
+def generate_plant_data(n_assets=DEFAULT_ASSETS, days=DEFAULT_DAYS, freq=DEFAULT_FREQ, seed=None, storage=SENSOR_STORAGE, chunk_rows=DEFAULT_CHUNK_ROWS,
+                        anomaly_rate=ANOMALY_RATE, drift_rate=DRIFT_RATE, end=None, n_orders=0, db_engine=None):
+    """Limpa os dados operacionais e gera ativos, histórico de sensores e, opcionalmente, `n_orders` OS.
+    Retorna (semente usada, ativos, leituras, OS)."""
+    if seed is None: seed = int(np.random.SeedSequence().entropy % 2**32)
+    # Limpa todas as tabelas transacionais e recria a estrutura do DB
+    initialize_database(clear_all=True)
+    if storage == "parquet" and os.path.isdir(PARQUET_DIR):
+        shutil.rmtree(PARQUET_DIR)
+    df_assets = generate_assets(n_assets, np.random.default_rng([seed, 0]))
+    save_assets(df_assets)
+    periods = round(pd.Timedelta(days=days) / pd.Timedelta(freq))
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now()
+    chunks = generate_sensor_chunks(df_assets, periods, freq, end, seed, chunk_rows, anomaly_rate, drift_rate)
+    n_readings = write_sensor_chunks(chunks, storage, db_engine)
+    # O histórico de OS cobre pelo menos um ano, para que haja preventivas recorrentes vencidas como numa planta real
+    df_orders = generate_service_orders(df_assets, n_orders, np.random.default_rng([seed, 2]), end - pd.Timedelta(days=max(days, OS_HISTORY_DAYS)), end)
+    return seed, len(df_assets), n_readings, write_service_orders(df_orders, db_engine) if n_orders else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera ativos e histórico de sensores sintéticos para a planta.")
+    parser.add_argument('--assets', type=int, default=DEFAULT_ASSETS, help="Número de ativos (distribuídos entre os tipos).")
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS, help="Dias de histórico até agora.")
+    parser.add_argument('--freq', default=DEFAULT_FREQ, help="Intervalo entre leituras (ex.: 1min, 5min, 1h).")
+    parser.add_argument('--seed', type=int, default=None, help="Semente do gerador (padrão: aleatória, exibida no fim).")
+    parser.add_argument('--storage', choices=['sqlite', 'parquet'], default=SENSOR_STORAGE)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="Leituras por bloco gravado.")
+    parser.add_argument('--anomaly-rate', type=float, default=ANOMALY_RATE, help="Fração de ativos com pico crítico.")
+    parser.add_argument('--drift-rate', type=float, default=DRIFT_RATE, help="Fração de ativos com degradação gradual.")
+    parser.add_argument('--orders', type=int, default=0, help="OS sintéticas a gerar (histórico de pelo menos um ano).")
+    args = parser.parse_args()
+    print("Iniciando a geração de dados...")
+    start = time.perf_counter()
+    seed, n_assets, n_readings, n_orders = generate_plant_data(args.assets, args.days, args.freq, args.seed, args.storage, args.chunk_rows, args.anomaly_rate, args.drift_rate, n_orders=args.orders)
+    elapsed = time.perf_counter() - start
+    print(f"{n_assets} ativos, {n_readings:,} leituras de sensores ({args.storage}) e {n_orders:,} OS salvos em {elapsed:.1f}s. Semente: {seed}")
@@ -0,0 +1,272 @@
+import argparse
+import json
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from utilities import SENSOR_COLUMNS, SENSOR_STORAGE, TIMESTAMP_FORMAT, attach_asset_types, engine, ensure_database, evaluate_alert_events, update_alert_events
+
+# Serviço de ingestão contínua de leituras de sensores (gateways de CLP), executado fora do Streamlit:
+#   python -m ingestion_service [--host 127.0.0.1] [--port 8600] [--batch-size 5000] [--flush-interval 0.5] [--max-pending 100000]
+# POST /readings com um objeto JSON, uma lista de objetos ou NDJSON ({"asset_id": ..., "timestamp": ..., <sensores>}):
+#   202 quando as leituras entram na fila; 503 + Retry-After quando a fila está cheia (o gateway reenvia depois).
+# GET /metrics devolve os contadores de vazão e latência; GET /health indica se o gravador está vivo.
+# Uma única thread grava a fila em lotes (uma transação com executemany por lote), por tamanho ou por prazo;
+# cada lote é classificado pelas regras de ASSET_PROFILES e as transições de status vão para alert_events no mesmo commit.
+
+INGEST_HOST = "127.0.0.1"
+INGEST_PORT = 8600
+INGEST_BATCH_SIZE = 5000 # Leituras por transação
+INGEST_FLUSH_SECONDS = 0.5 # Prazo máximo de uma leitura na fila antes de ir ao banco, mesmo sem completar o lote
+INGEST_MAX_PENDING = 100_000 # Leituras aceitas e ainda não gravadas; acima disso as requisições são recusadas com 503
+INGEST_RETRY_AFTER_SECONDS = 1
+INGEST_MAX_BODY_BYTES = 16 * 1024 * 1024
+INGEST_WRITE_RETRY_SECONDS = (0.1, 0.5, 1, 2, 5) # Espera entre novas tentativas de um lote que falhou (ex.: banco bloqueado)
+INGEST_LATENCY_SAMPLES = 2048 # Amostras recentes usadas nos percentis de latência
+INGEST_COLUMNS = ['timestamp', 'asset_id'] + SENSOR_COLUMNS
+INGEST_INSERT = f"INSERT INTO sensor_data ({', '.join(INGEST_COLUMNS)}) VALUES ({', '.join('?' * len(INGEST_COLUMNS))})"
+
+
+def parse_timestamp(value, received_at):
+    """Timestamp ISO 8601 (ou epoch em segundos) -> texto no formato de sensor_data, em hora local sem fuso."""
+    if value is None: return received_at
+    if isinstance(value, (int, float)) and not isinstance(value, bool): moment = datetime.fromtimestamp(value)
+    else:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if moment.tzinfo is not None: moment = moment.astimezone().replace(tzinfo=None)
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def parse_reading(reading, received_at):
+    if not isinstance(reading, dict) or not reading.get('asset_id'): raise ValueError("cada leitura precisa ser um objeto com 'asset_id'")
+    values = []
+    for column in SENSOR_COLUMNS:
+        value = reading.get(column)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))): raise ValueError(f"'{column}' deve ser numérico")
+        values.append(None if value is None or value != value else float(value))
+    return (parse_timestamp(reading.get('timestamp'), received_at), str(reading['asset_id']), *values)
+
+
+def parse_readings(body):
+    """Corpo da requisição (JSON ou NDJSON) -> tuplas na ordem de INGEST_COLUMNS. Levanta ValueError se algo for inválido:
+    a requisição é aceita ou recusada por inteiro."""
+    received_at = datetime.now().strftime(TIMESTAMP_FORMAT)
+    try:
+        payload = json.loads(body)
+    except json.JSONDecodeError:
+        try:
+            payload = [json.loads(line) for line in body.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON inválido: {e}") from e
+    readings = payload if isinstance(payload, list) else [payload]
+    try:
+        return [parse_reading(reading, received_at) for reading in readings]
+    except (TypeError, ValueError, OverflowError, OSError) as e:
+        raise ValueError(str(e)) from e
+
+
+def percentiles_ms(samples):
+    if not samples: return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    values = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2), 'max': round(values.max(), 2)}
+
+
+class SensorIngestor:
+    """Fila limitada de leituras + thread gravadora. offer() nunca bloqueia: quando a fila passaria de `max_pending`
+    a requisição inteira é recusada (backpressure), e as leituras só saem da conta de pendentes depois do commit,
+    então um banco lento ou indisponível reduz o que é aceito em vez de crescer a memória."""
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, flush_seconds=INGEST_FLUSH_SECONDS, max_pending=INGEST_MAX_PENDING, db_engine=None, storage=None):
+        self.batch_size, self.flush_seconds, self.max_pending = batch_size, flush_seconds, max_pending
+        self.engine = db_engine if db_engine is not None else engine; self.storage = storage or SENSOR_STORAGE
+        self._condition = threading.Condition(); self._buffer = deque(); self._queued = 0; self._pending = 0; self._stopping = False
+        self.counters = {'accepted': 0, 'rejected': 0, 'rejected_requests': 0, 'invalid_requests': 0, 'written': 0, 'batches': 0, 'write_errors': 0, 'dropped': 0}
+        self.latencies = deque(maxlen=INGEST_LATENCY_SAMPLES); self.write_times = deque(maxlen=INGEST_LATENCY_SAMPLES)
+        self.last_error = None; self.started_at = time.monotonic()
+        self._writer = threading.Thread(target=self._run_writer, name="sensor-ingest-writer", daemon=True)
+
+    def start(self):
+        self._writer.start(); return self
+
+    def offer(self, rows):
+        """Enfileira as leituras (tuplas de INGEST_COLUMNS). Retorna False, sem enfileirar nada, se a fila estiver cheia."""
+        if not rows: return True
+        with self._condition:
+            if self._stopping or self._pending + len(rows) > self.max_pending:
+                self.counters['rejected'] += len(rows); self.counters['rejected_requests'] += 1
+                return False
+            self._buffer.append((time.monotonic(), rows)); self._queued += len(rows); self._pending += len(rows)
+            self.counters['accepted'] += len(rows)
+            # Acorda o gravador com o lote cheio ou quando a fila deixa de estar vazia (para ele armar o prazo de gravação)
+            if self._queued >= self.batch_size or len(self._buffer) == 1: self._condition.notify()
+        return True
+
+    def record_invalid(self):
+        with self._condition: self.counters['invalid_requests'] += 1
+
+    def _take_batch(self):
+        """Espera até ter um lote cheio, o prazo da leitura mais antiga vencer ou o serviço parar. Retorna
+        (leituras, [(momento de entrada, nº de leituras)]) ou None quando parado e sem nada na fila."""
+        with self._condition:
+            while True:
+                if self._queued >= self.batch_size or (self._stopping and self._buffer): break
+                if self._stopping: return None
+                if self._buffer:
+                    wait = self._buffer[0][0] + self.flush_seconds - time.monotonic()
+                    if wait <= 0: break
+                else: wait = None
+                self._condition.wait(wait)
+            batch, arrivals = [], []
+            while self._buffer and len(batch) < self.batch_size:
+                enqueued_at, rows = self._buffer.popleft(); room = self.batch_size - len(batch)
+                if len(rows) > room: self._buffer.appendleft((enqueued_at, rows[room:])); rows = rows[:room]
+                batch.extend(rows); arrivals.append((enqueued_at, len(rows)))
+            self._queued -= len(batch)
+            return batch, arrivals
+
+    def write_batch(self, batch):
+        df = pd.DataFrame(batch, columns=INGEST_COLUMNS).astype({column: 'float64' for column in SENSOR_COLUMNS})
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT)
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                if self.storage != "parquet": conn.exec_driver_sql(INGEST_INSERT, batch)
+                # As marcas d'água de alert_watermarks tornam a avaliação idempotente se o lote for regravado após uma falha
+                evaluate_alert_events(conn, attach_asset_types(df.copy(), conn)); conn.commit()
+            except Exception:
+                conn.rollback(); raise
+        if self.storage == "parquet":
+            from parquet_store import write_sensor_readings
+            write_sensor_readings(df)
+
+    def _run_writer(self):
+        while True:
+            taken = self._take_batch()
+            if taken is None: return
+            batch, arrivals = taken; attempt = 0
+            while True:
+                start = time.monotonic()
+                try:
+                    self.write_batch(batch); break
+                except Exception as e:
+                    self.last_error = f"{type(e).__name__}: {e}"; self.counters['write_errors'] += 1
+                    if self._stopping and attempt >= len(INGEST_WRITE_RETRY_SECONDS): batch = None; break # Parado e o banco não volta: desiste do lote
+                    time.sleep(INGEST_WRITE_RETRY_SECONDS[min(attempt, len(INGEST_WRITE_RETRY_SECONDS) - 1)]); attempt += 1
+            committed_at = time.monotonic()
+            with self._condition:
+                self._pending -= sum(n for _, n in arrivals)
+                if batch is None: self.counters['dropped'] += sum(n for _, n in arrivals); continue
+                self.counters['written'] += len(batch); self.counters['batches'] += 1
+                self.write_times.append(committed_at - start); self.latencies.extend(committed_at - enqueued_at for enqueued_at, _ in arrivals)
+
+    def stop(self, timeout=None):
+        """Para de aceitar leituras, grava o que está na fila e encerra a thread gravadora."""
+        with self._condition:
+            self._stopping = True; self._condition.notify_all()
+        if self._writer.is_alive(): self._writer.join(timeout)
+
+    def wait_idle(self, timeout=None):
+        """Espera até todas as leituras aceitas serem gravadas (ou descartadas). Retorna False se o prazo acabar antes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending:
+            if deadline is not None and time.monotonic() > deadline: return False
+            time.sleep(0.01)
+        return True
+
+    @property
+    def pending(self):
+        with self._condition: return self._pending
+
+    @property
+    def healthy(self):
+        return self._writer.is_alive()
+
+    def metrics(self):
+        with self._condition:
+            counters = dict(self.counters); latencies = list(self.latencies); write_times = list(self.write_times); pending = self._pending
+        uptime = time.monotonic() - self.started_at
+        return {**counters, 'pending': pending, 'max_pending': self.max_pending, 'batch_size': self.batch_size, 'storage': self.storage,
+                'uptime_seconds': round(uptime, 3), 'rows_per_second': round(counters['written'] / uptime, 1) if uptime else 0.0,
+                'latency_ms': percentiles_ms(latencies), 'write_ms': percentiles_ms(write_times), 'last_error': self.last_error}
+
+
+class IngestionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Conexões keep-alive: o gateway reaproveita o socket entre os envios
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.end_headers(); self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/readings': return self.send_json(404, {"error": "rota desconhecida"})
+        if self.headers.get('Content-Length') is None: return self.send_json(411, {"error": "Content-Length obrigatório"})
+        try:
+            raw_length = self.headers['Content-Length'].strip(); length = int(raw_length)
+            if length < 0 or not raw_length.isdigit(): raise ValueError(raw_length) # int() também aceitaria '+5' e '1_000'
+        except ValueError:
+            # Sem um tamanho válido não dá para saber onde o corpo termina: a conexão não pode ser reaproveitada
+            self.close_connection = True; self.server.ingestor.record_invalid()
+            return self.send_json(400, {"error": "Content-Length inválido"})
+        if length > INGEST_MAX_BODY_BYTES:
+            self.close_connection = True
+            return self.send_json(413, {"error": f"corpo acima de {INGEST_MAX_BODY_BYTES} bytes"})
+        try:
+            rows = parse_readings(self.rfile.read(length))
+        except ValueError as e:
+            self.server.ingestor.record_invalid()
+            return self.send_json(400, {"error": str(e)})
+        if not self.server.ingestor.offer(rows):
+            return self.send_json(503, {"error": "fila de ingestão cheia, reenvie mais tarde"}, headers={"Retry-After": str(INGEST_RETRY_AFTER_SECONDS)})
+        self.send_json(202, {"accepted": len(rows)})
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path == '/metrics': return self.send_json(200, self.server.ingestor.metrics())
+        if path == '/health':
+            healthy = self.server.ingestor.healthy
+            return self.send_json(200 if healthy else 503, {"status": "ok" if healthy else "gravador parado"})
+        self.send_json(404, {"error": "rota desconhecida"})
+
+    def log_message(self, format, *args):
+        pass # Sem log por requisição: milhares por segundo; os contadores ficam em /metrics
+
+
+class IngestionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, ingestor):
+        super().__init__(address, IngestionHandler); self.ingestor = ingestor
+
+
+def run_service(host=INGEST_HOST, port=INGEST_PORT, batch_size=INGEST_BATCH_SIZE, flush_seconds=INGEST_FLUSH_SECONDS, max_pending=INGEST_MAX_PENDING):
+    ensure_database()
+    update_alert_events() # Leituras gravadas por outros meios antes de o serviço subir entram nos eventos antes das novas
+    ingestor = SensorIngestor(batch_size, flush_seconds, max_pending).start()
+    server = IngestionServer((host, port), ingestor)
+    # shutdown() espera o serve_forever terminar, então é chamado de outra thread
+    for sig in (signal.SIGINT, signal.SIGTERM): signal.signal(sig, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"Ingestão de sensores em http://{host}:{server.server_address[1]} (lotes de {batch_size}, prazo {flush_seconds}s, fila de até {max_pending} leituras, {ingestor.storage}).")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close(); ingestor.stop()
+        metrics = ingestor.metrics()
+        print(f"Ingestão finalizada: {metrics['written']} leitura(s) gravada(s) em {metrics['batches']} lote(s), {metrics['rejected']} recusada(s), {metrics['dropped']} descartada(s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço de ingestão contínua de leituras de sensores.")
+    parser.add_argument('--host', default=INGEST_HOST)
+    parser.add_argument('--port', type=int, default=INGEST_PORT)
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help="Leituras por transação.")
+    parser.add_argument('--flush-interval', type=float, default=INGEST_FLUSH_SECONDS, help="Prazo máximo, em segundos, de uma leitura na fila.")
+    parser.add_argument('--max-pending', type=int, default=INGEST_MAX_PENDING, help="Leituras pendentes a partir das quais as requisições recebem 503.")
+    args = parser.parse_args()
+    run_service(args.host, args.port, args.batch_size, args.flush_interval, args.max_pending)
@@ -0,0 +1,218 @@
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from utilities import TIMESTAMP_FORMAT, engine, ensure_database
+
+# Motor de KPIs de manutenção: mantém agregados diários das OS concluídas em dois níveis, por ativo (kpi_asset_daily,
+# recalculado por ativo quando suas OS são concluídas) e por tipo de ativo (kpi_daily, derivado do primeiro só nos dias
+# afetados), e responde MTTR, MTBF, custo, disponibilidade e tendências (D/S/M/T/A) somando esses agregados.
+# refresh_kpis() roda no agendador e ao concluir uma OS no App do Técnico; a página 8_KPIs_Manutencao só lê os agregados.
+# Uso (fora do Streamlit): python -m kpi_engine [--rebuild]
+
+FAILURE_CLASSES = ['Preditiva', 'Corretiva'] # OS que representam falhas (MTTR/MTBF); Preventiva conta como parada planejada
+PLANNED_CLASSES = ['Preventiva']
+UNDEFINED_CAUSE = 'Não Definida'
+# Agrupamentos de tempo da página -> frequência de período do pandas
+PERIOD_FREQUENCIES = {'Diário': 'D', 'Semanal': 'W', 'Mensal': 'M', 'Trimestral': 'Q', 'Anual': 'Y'}
+KPI_MEASURES = ['orders', 'repair_hours', 'uptime_hours', 'uptime_count', 'cost']
+KPI_ASSET_COLUMNS = ['day', 'asset_id', 'asset_type', 'os_class', 'root_cause'] + KPI_MEASURES
+KPI_TYPE_DIMENSIONS = ['day', 'asset_type', 'os_class', 'root_cause']
+
+
+def load_completed_orders(conn, asset_ids=None):
+    # Com ativos, o "+" tira status do índice: o SQLite passa a buscar por asset_id em vez de varrer todas as concluídas
+    query = ("SELECT os_id, asset_id, asset_type, class, root_cause, creation_date, completion_date, actual_cost FROM service_orders "
+             + ("WHERE +status = 'Concluída' AND completion_date IS NOT NULL AND asset_id IN :asset_ids" if asset_ids is not None else "WHERE status = 'Concluída' AND completion_date IS NOT NULL"))
+    query = text(query).bindparams(bindparam('asset_ids', expanding=True)) if asset_ids is not None else text(query)
+    # ISO8601: datas gravadas com e sem microssegundos convivem na tabela; nenhuma pode virar NaT e sumir dos agregados
+    return pd.read_sql(query, conn, params={"asset_ids": list(asset_ids)} if asset_ids is not None else {},
+                       parse_dates={'creation_date': {'format': 'ISO8601'}, 'completion_date': {'format': 'ISO8601'}})
+
+
+def aggregate_daily_kpis(df_orders):
+    """Agregados diários (dia de conclusão × ativo × classe × causa raiz) das OS concluídas, todos vetorizados.
+    O tempo em operação entre falhas é medido da conclusão da falha anterior do mesmo ativo até a abertura da seguinte."""
+    if df_orders.empty: return pd.DataFrame(columns=KPI_ASSET_COLUMNS)
+    df = df_orders.sort_values(['asset_id', 'creation_date', 'os_id']).reset_index(drop=True)
+    df['repair_hours'] = (df['completion_date'] - df['creation_date']).dt.total_seconds() / 3600
+    is_failure = df['class'].isin(FAILURE_CLASSES)
+    failures = df[is_failure]
+    uptime = (failures['creation_date'] - failures.groupby('asset_id')['completion_date'].shift(1)).dt.total_seconds() / 3600
+    df['uptime_hours'] = uptime.where(uptime > 0) # Só intervalos positivos entram no MTBF, como no cálculo original
+    df['day'] = df['completion_date'].dt.strftime('%Y-%m-%d')
+    df['os_class'] = df['class'].fillna('')
+    df['root_cause'] = df['root_cause'].fillna(UNDEFINED_CAUSE)
+    df['asset_type'] = df['asset_type'].fillna('')
+    daily = df.groupby(['day', 'asset_id', 'os_class', 'root_cause'], sort=False).agg(
+        asset_type=('asset_type', 'first'), orders=('os_id', 'size'), repair_hours=('repair_hours', 'sum'),
+        uptime_hours=('uptime_hours', 'sum'), uptime_count=('uptime_hours', 'count'), cost=('actual_cost', 'sum'))
+    return daily.reset_index()[KPI_ASSET_COLUMNS]
+
+
+def completed_signature(conn):
+    """(nº de OS concluídas, última conclusão) gravados em kpi_state a cada atualização."""
+    count, last_completion = conn.execute(text("SELECT COUNT(*), MAX(completion_date) FROM service_orders WHERE status = 'Concluída'")).one()
+    return count, last_completion
+
+
+def refresh_asset_kpis(conn, asset_ids=None):
+    """Recalcula os agregados dos ativos informados (todos se None) dentro da transação de `conn`. Em kpi_daily aplica só
+    a diferença (linhas novas menos antigas desses ativos) nos (dia, tipo) afetados, sem re-somar os demais ativos."""
+    if asset_ids is not None and len(asset_ids) == 0: return 0
+    df_daily = aggregate_daily_kpis(load_completed_orders(conn, asset_ids))
+    if asset_ids is None:
+        conn.execute(text("DELETE FROM kpi_asset_daily")); conn.execute(text("DELETE FROM kpi_daily"))
+        insert_asset_kpis(conn, df_daily)
+        conn.execute(text(f"INSERT INTO kpi_daily ({', '.join(KPI_TYPE_DIMENSIONS + KPI_MEASURES)}) SELECT {', '.join(KPI_TYPE_DIMENSIONS)}, "
+                          f"{', '.join(f'SUM({m})' for m in KPI_MEASURES)} FROM kpi_asset_daily GROUP BY {', '.join(KPI_TYPE_DIMENSIONS)}"))
+        return len(df_daily)
+    in_assets = {"asset_ids": list(asset_ids)}; asset_filter = bindparam('asset_ids', expanding=True)
+    df_old = pd.read_sql(text(f"SELECT {', '.join(KPI_TYPE_DIMENSIONS + KPI_MEASURES)} FROM kpi_asset_daily WHERE asset_id IN :asset_ids").bindparams(asset_filter), conn, params=in_assets)
+    df_old[KPI_MEASURES] = -df_old[KPI_MEASURES]
+    delta = pd.concat([df_old, df_daily[KPI_TYPE_DIMENSIONS + KPI_MEASURES]]).groupby(KPI_TYPE_DIMENSIONS, sort=False)[KPI_MEASURES].sum().reset_index()
+    conn.execute(text("DELETE FROM kpi_asset_daily WHERE asset_id IN :asset_ids").bindparams(asset_filter), in_assets)
+    insert_asset_kpis(conn, df_daily)
+    conn.exec_driver_sql(f"INSERT INTO kpi_daily ({', '.join(KPI_TYPE_DIMENSIONS + KPI_MEASURES)}) VALUES ({', '.join('?' * len(KPI_TYPE_DIMENSIONS + KPI_MEASURES))}) "
+                         f"ON CONFLICT({', '.join(KPI_TYPE_DIMENSIONS)}) DO UPDATE SET {', '.join(f'{m} = {m} + excluded.{m}' for m in KPI_MEASURES)}",
+                         list(delta.astype(object).itertuples(index=False, name=None)))
+    conn.exec_driver_sql("DELETE FROM kpi_daily WHERE orders <= 0") # (dia, tipo, classe, causa) que ficaram sem nenhuma OS
+    return len(df_daily)
+
+
+def insert_asset_kpis(conn, df_daily):
+    if df_daily.empty: return
+    conn.exec_driver_sql(f"INSERT INTO kpi_asset_daily ({', '.join(KPI_ASSET_COLUMNS)}) VALUES ({', '.join('?' * len(KPI_ASSET_COLUMNS))})",
+                         list(df_daily.astype(object).where(df_daily.notna(), None).itertuples(index=False, name=None)))
+
+
+def refresh_kpis(rebuild=False):
+    """Mantém os agregados em dia de forma incremental: recalcula só os ativos marcados em kpi_dirty_assets pelos gatilhos
+    de service_orders (OS concluídas, reabertas, removidas ou com custo, causa, datas ou classe editados) e não faz nada
+    se nenhum foi marcado. Sem atualização anterior (ou com `rebuild`) reconstrói tudo. Retorna o nº de ativos
+    recalculados (None = reconstrução completa)."""
+    ensure_database()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            has_state = conn.execute(text("SELECT 1 FROM kpi_state WHERE id = 1")).scalar() is not None
+            asset_ids = [asset_id for (asset_id,) in conn.execute(text("SELECT asset_id FROM kpi_dirty_assets"))]
+            if not rebuild and has_state and not asset_ids: conn.rollback(); return 0
+            if rebuild or not has_state: refresh_asset_kpis(conn); refreshed = None
+            else:
+                refresh_asset_kpis(conn, [asset_id for asset_id in asset_ids if asset_id is not None]); refreshed = len(asset_ids)
+                aggregated = conn.execute(text("SELECT COALESCE(SUM(orders), 0) FROM kpi_daily")).scalar()
+                if aggregated != conn.execute(text("SELECT COUNT(*) FROM service_orders WHERE status = 'Concluída' AND completion_date IS NOT NULL")).scalar():
+                    refresh_asset_kpis(conn); refreshed = None # OS sem ativo ou alteradas com os gatilhos ausentes: as contas não fecham por ativo
+            conn.execute(text("DELETE FROM kpi_dirty_assets"))
+            count, last_completion = completed_signature(conn)
+            conn.execute(text("INSERT INTO kpi_state (id, completed_orders, last_completion, refreshed_at) VALUES (1, :count, :last, :now) "
+                              "ON CONFLICT(id) DO UPDATE SET completed_orders = excluded.completed_orders, last_completion = excluded.last_completion, refreshed_at = excluded.refreshed_at"),
+                         {"count": count, "last": last_completion, "now": datetime.now().strftime(TIMESTAMP_FORMAT)})
+            conn.commit()
+        except Exception:
+            conn.rollback(); raise
+    return refreshed
+
+
+def load_kpi_status():
+    """(última atualização dos agregados ou None, nº de ativos aguardando recálculo)."""
+    with engine.connect() as conn:
+        refreshed_at = conn.execute(text("SELECT refreshed_at FROM kpi_state WHERE id = 1")).scalar()
+        pending = conn.execute(text("SELECT COUNT(*) FROM kpi_dirty_assets")).scalar()
+    return (pd.Timestamp(refreshed_at) if refreshed_at else None), pending
+
+
+def day_range_filter(start, end):
+    conditions, params = [], {}
+    if start is not None: conditions.append("day >= :start"); params["start"] = pd.Timestamp(start).strftime('%Y-%m-%d')
+    if end is not None: conditions.append("day <= :end"); params["end"] = pd.Timestamp(end).strftime('%Y-%m-%d')
+    return conditions, params
+
+
+def load_kpi_daily(start=None, end=None):
+    """Agregados diários por tipo de ativo, classe e causa raiz com dia em [start, end] (datas inclusivas)."""
+    conditions, params = day_range_filter(start, end)
+    query = f"SELECT {', '.join(KPI_TYPE_DIMENSIONS + KPI_MEASURES)} FROM kpi_daily" + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+    df = pd.read_sql(text(query), engine, params=params)
+    df['day'] = pd.to_datetime(df['day'], format='%Y-%m-%d')
+    return df
+
+
+def load_asset_kpis(start=None, end=None, classes=FAILURE_CLASSES):
+    """Medidas somadas por ativo no período (por padrão só as falhas), direto de kpi_asset_daily."""
+    conditions, params = day_range_filter(start, end)
+    conditions.append("os_class IN :classes"); params["classes"] = list(classes)
+    query = text(f"SELECT asset_id, asset_type, {', '.join(f'SUM({m}) AS {m}' for m in KPI_MEASURES)} FROM kpi_asset_daily WHERE {' AND '.join(conditions)} GROUP BY asset_id")
+    return pd.read_sql(query.bindparams(bindparam('classes', expanding=True)), engine, params=params).set_index('asset_id')
+
+
+def load_order_date_range():
+    """Primeira e última data de abertura de OS (None, None sem OS); coberta pelo índice de creation_date."""
+    with engine.connect() as conn:
+        # Duas subconsultas: cada uma é uma busca na ponta do índice, enquanto MIN e MAX juntos varrem o índice inteiro
+        first, last = conn.execute(text("SELECT (SELECT MIN(creation_date) FROM service_orders), (SELECT MAX(creation_date) FROM service_orders)")).one()
+    return (pd.Timestamp(first).date(), pd.Timestamp(last).date()) if first else (None, None)
+
+
+def load_order_class_counts(start, end):
+    """OS abertas por classe entre as datas `start` e `end` (inclusivas), contadas no índice (creation_date, class)."""
+    params = {"start": pd.Timestamp(start).strftime(TIMESTAMP_FORMAT), "end": (pd.Timestamp(end) + pd.Timedelta(days=1)).strftime(TIMESTAMP_FORMAT)}
+    return pd.read_sql(text("SELECT class, COUNT(*) AS count FROM service_orders WHERE creation_date >= :start AND creation_date < :end GROUP BY class"), engine, params=params)
+
+
+def summarize_kpis(df_daily, calendar_hours):
+    """Somatórios dos agregados -> indicadores. `calendar_hours` é o tempo de calendário da frota no período
+    (horas × ativos); a disponibilidade segue o OEE: (tempo planejado - paradas por falha) / tempo planejado."""
+    failures = df_daily[df_daily['os_class'].isin(FAILURE_CLASSES)]; planned = df_daily[df_daily['os_class'].isin(PLANNED_CLASSES)]
+    n_failures = int(failures['orders'].sum()); uptime_count = failures['uptime_count'].sum()
+    unplanned_downtime = failures['repair_hours'].sum(); planned_downtime = planned['repair_hours'].sum()
+    planned_time = calendar_hours - planned_downtime
+    return {
+        'failures': n_failures, 'cost': failures['cost'].sum(),
+        'mttr_hours': unplanned_downtime / n_failures if n_failures else np.nan,
+        'mtbf_hours': failures['uptime_hours'].sum() / uptime_count if uptime_count else np.nan,
+        'unplanned_downtime_hours': unplanned_downtime, 'planned_downtime_hours': planned_downtime,
+        'availability': float(np.clip((planned_time - unplanned_downtime) / planned_time, 0, 1)) if planned_time > 0 else np.nan,
+    }
+
+
+def kpis_by(df_daily, by, n_assets=None, calendar_hours=None):
+    """Indicadores por grupo (ex.: 'asset_type', 'root_cause'); com `n_assets` (Series por grupo) e as horas
+    do período, inclui a disponibilidade de cada grupo."""
+    failures = df_daily[df_daily['os_class'].isin(FAILURE_CLASSES)]
+    grouped = failures.groupby(by).agg(failures=('orders', 'sum'), repair_hours=('repair_hours', 'sum'), uptime_hours=('uptime_hours', 'sum'),
+                                       uptime_count=('uptime_count', 'sum'), cost=('cost', 'sum'))
+    grouped['mttr_hours'] = grouped['repair_hours'] / grouped['failures'].where(grouped['failures'] > 0)
+    grouped['mtbf_hours'] = grouped['uptime_hours'] / grouped['uptime_count'].where(grouped['uptime_count'] > 0)
+    if n_assets is not None and calendar_hours is not None:
+        planned = df_daily[df_daily['os_class'].isin(PLANNED_CLASSES)].groupby(by)['repair_hours'].sum()
+        planned_time = n_assets.reindex(grouped.index).fillna(0) * calendar_hours - planned.reindex(grouped.index).fillna(0)
+        grouped['availability'] = ((planned_time - grouped['repair_hours']) / planned_time.where(planned_time > 0)).clip(0, 1)
+    return grouped
+
+
+def kpi_trend(df_daily, period, start, end, n_assets):
+    """Série temporal por período ('D', 'W', 'M', 'Q', 'Y'): falhas, custo, MTTR e disponibilidade da frota.
+    As horas de cada período são recortadas ao intervalo [start, end] para os períodos das pontas."""
+    failures = df_daily[df_daily['os_class'].isin(FAILURE_CLASSES)]
+    periods = pd.period_range(pd.Timestamp(start), pd.Timestamp(end), freq=period)
+    by_period = lambda df: df.groupby(df['day'].dt.to_period(period))
+    trend = by_period(failures).agg(failures=('orders', 'sum'), cost=('cost', 'sum'), repair_hours=('repair_hours', 'sum')).reindex(periods, fill_value=0)
+    planned = by_period(df_daily[df_daily['os_class'].isin(PLANNED_CLASSES)])['repair_hours'].sum().reindex(periods, fill_value=0)
+    range_start, range_end = pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(days=1)
+    period_hours = (pd.Series(periods.end_time + pd.Timedelta(1)).clip(upper=range_end) - pd.Series(periods.start_time).clip(lower=range_start)) / pd.Timedelta(hours=1)
+    planned_time = period_hours.to_numpy() * n_assets - planned.to_numpy()
+    trend['mttr_hours'] = trend['repair_hours'] / trend['failures'].where(trend['failures'] > 0)
+    trend['availability'] = np.clip((planned_time - trend['repair_hours'].to_numpy()) / np.where(planned_time > 0, planned_time, np.nan), 0, 1)
+    trend.index = periods.start_time; trend.index.name = 'period'
+    return trend
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Atualiza os agregados diários de KPIs de manutenção.")
+    parser.add_argument('--rebuild', action='store_true', help="Recalcula todos os agregados, não só os ativos com OS concluídas desde a última atualização.")
+    args = parser.parse_args()
+    refreshed = refresh_kpis(rebuild=args.rebuild)
+    print("Agregados de KPI reconstruídos." if refreshed is None else f"{refreshed} ativo(s) com agregados de KPI atualizados.")
@@ -0,0 +1,26 @@
+import argparse
+from utilities import MIGRATIONS, engine, migrate_database, schema_version
+
+# Aplica as migrações pendentes do banco (maintenance.db) fora do Streamlit:
+#   python -m migrate            -> aplica o que falta
+#   python -m migrate --status   -> apenas mostra a versão atual e as pendentes
+
+
+def show_status():
+    with engine.begin() as conn:
+        current = schema_version(conn)
+    pending = [(version, description) for version, description, _ in MIGRATIONS if version > current]
+    print(f"Versão do esquema: {current} (mais recente: {MIGRATIONS[-1][0]})")
+    for version, description in pending: print(f"  pendente {version}: {description}")
+    if not pending: print("Nenhuma migração pendente.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações versionadas do banco de dados.")
+    parser.add_argument('--status', action='store_true', help="Mostra a versão atual e as migrações pendentes, sem aplicar.")
+    args = parser.parse_args()
+    if args.status:
+        show_status()
+    else:
+        applied = migrate_database(verbose=True)
+        print(f"{len(applied)} migração(ões) aplicada(s)." if applied else "Esquema já está na versão mais recente.")
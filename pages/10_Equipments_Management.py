@@ -1,6 +1,5 @@
 import streamlit as st
-import pandas as pd
-from utilities import apply_theme, check_authentication, has_page_access, render_sidebar, load_assets, save_assets, ASSET_PROFILES
+from utilities import apply_theme, check_authentication, has_page_access, render_sidebar, load_assets, insert_asset, ASSET_PROFILES
 from datetime import datetime
 
 check_authentication()
@@ -20,19 +19,21 @@ with st.expander("➕ Cadastrar Novo Ativo"):
         location = st.text_input("Localização (Ex: Setor A-Linha 2)")
         description = st.text_input("Descrição")
         install_date = st.date_input("Data de Instalação", value=datetime.today())
+        col_lat, col_lon = st.columns(2)
+        with col_lat: latitude = st.number_input("Latitude no Mapa da Planta", value=-18.420, format="%.6f")
+        with col_lon: longitude = st.number_input("Longitude no Mapa da Planta", value=-49.225, format="%.6f")
         
         if st.form_submit_button("Salvar Ativo"):
             if not all([asset_id, asset_type, location]):
                 st.warning("ID, Tipo e Localização são obrigatórios.")
-            elif asset_id in df_assets['asset_id'].values:
+            # A checagem de duplicidade é feita pelo próprio INSERT (ON CONFLICT), válida mesmo com outro editor simultâneo
+            elif not insert_asset({
+                'asset_id': asset_id, 'asset_type': asset_type, 'location': location,
+                'description': description, 'install_date': install_date,
+                'latitude': latitude, 'longitude': longitude
+            }):
                 st.error(f"O ID de ativo '{asset_id}' já existe.")
             else:
-                new_asset = pd.DataFrame([{
-                    'asset_id': asset_id, 'asset_type': asset_type, 'location': location,
-                    'description': description, 'install_date': install_date
-                }])
-                df_assets = pd.concat([df_assets, new_asset], ignore_index=True)
-                save_assets(df_assets)
                 st.success(f"Ativo '{asset_id}' cadastrado com sucesso!")
                 st.rerun()
 
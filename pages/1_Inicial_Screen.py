@@ -1,44 +1,50 @@
 import streamlit as st
 import pandas as pd
 from utilities import (
-    apply_theme, load_and_analyze_sensor_data, load_service_orders, load_parts,
-    check_and_generate_os, suppress_resolved_alerts, check_and_generate_recurring_os,
+    apply_theme, load_latest_alert_timestamps, load_alert_status_summary, load_service_orders, estimate_stock_runway, load_assets,
+    load_scheduler_status,
     check_authentication, has_page_access, render_sidebar
 )
+from datetime import datetime
 check_authentication(); render_sidebar()
 has_page_access("1_Inicial_Screen") # <-- CORRIGIDO
 apply_theme()
 st.title("🏭 Visão Geral da Planta")
-df_parts = load_parts()
-low_stock_parts = df_parts[df_parts['stock_quantity'] <= df_parts['min_stock_level']]
+df_runway = estimate_stock_runway()
+low_stock_parts = df_runway[df_runway['stock_quantity'] <= df_runway['min_stock_level']]
 if not low_stock_parts.empty:
     st.warning(f"⚠️ **Alerta:** {len(low_stock_parts)} peça(s) com estoque baixo! Verifique a 'Gestão de Estoque'.")
-df_analyzed_raw = load_and_analyze_sensor_data()
+upcoming_stockouts = int(df_runway['reorder'].sum()) - len(low_stock_parts)
+if upcoming_stockouts > 0:
+    st.info(f"🛒 {upcoming_stockouts} peça(s) com ruptura prevista pelo consumo recente. Verifique a 'Gestão de Estoque'.")
+# A geração automática de OS roda no agendador (python -m scheduler); aqui apenas lemos o resultado
+scheduler_status = load_scheduler_status()
+if scheduler_status is None or scheduler_status['expires_at'] < pd.Timestamp(datetime.now()):
+    st.info("ℹ️ O agendador de OS automáticas não está em execução. Inicie-o com `python -m scheduler`.")
+elif scheduler_status['last_run'] is not None:
+    st.caption(f"Última verificação automática de OS: {scheduler_status['last_run']:%d/%m/%Y %H:%M:%S}")
+# Os eventos de alerta são mantidos pelo agendador; aqui apenas lemos o resumo
+latest_timestamps = load_latest_alert_timestamps()
 df_os = load_service_orders()
-if df_analyzed_raw is not None:
-    df_os = check_and_generate_recurring_os(df_os)
-    df_analyzed = suppress_resolved_alerts(df_analyzed_raw)
-    df_os = check_and_generate_os(df_analyzed, df_os)
+if not latest_timestamps.empty:
     st.header("KPIs (Últimas 24 Horas)")
-    max_timestamp = df_analyzed['timestamp'].max()
-    cutoff_24h = max_timestamp - pd.Timedelta(hours=24)
-    df_last_24h = df_analyzed[df_analyzed['timestamp'] >= cutoff_24h]
-    total_assets = df_analyzed['asset_id'].nunique()
-    assets_with_alerts_24h = df_last_24h[~df_last_24h['status'].str.contains('Normal')]['asset_id'].nunique()
+    # Pior status de cada ativo lido dos eventos de alerta, com os alertas resolvidos já suprimidos
+    asset_status_summary = load_alert_status_summary(pd.Timedelta(hours=24), end=latest_timestamps.max(), suppress_resolved=True)
+    total_assets = len(latest_timestamps)
+    assets_with_alerts_24h = asset_status_summary['status'].isin(['Atenção', 'Crítico']).sum()
     os_abertas_count = df_os[df_os['status'] == 'Aberta'].shape[0]
     col1, col2, col3 = st.columns(3)
     col1.metric("Total de Ativos", f"{total_assets}")
     col2.metric("Ativos com Alertas Ativos (24h)", f"{assets_with_alerts_24h}")
     col3.metric("Ordens de Serviço Abertas", f"{os_abertas_count}")
     st.header("Status dos Ativos (24h)")
-    asset_status_summary = df_last_24h.groupby('asset_id').agg(
-        asset_type=('asset_type', 'first'),
-        location=('location', 'first'),
-        status=('status', lambda x: 'Crítico' if 'Crítico' in x.values else ('Atenção' if 'Atenção' in x.values else ('Normal (Resolvido)' if 'Normal (Resolvido)' in x.values else 'Normal')))
-    ).reset_index()
+    # Tipo e localização vêm do cadastro de ativos (não são repetidos nas leituras de sensor)
+    asset_status_summary = asset_status_summary.merge(load_assets()[['asset_id', 'asset_type', 'location']], on='asset_id', how='left')[['asset_id', 'asset_type', 'location', 'status']]
     def style_alert_rows(row):
         if row.status == 'Crítico': return ['background-color: #8B0000; color: white'] * len(row)
         if row.status == 'Atenção': return ['background-color: #FFD700; color: #31333F'] * len(row)
         if row.status == 'Normal (Resolvido)': return ['background-color: #006400; color: white'] * len(row)
         return [''] * len(row)
-    st.dataframe(asset_status_summary.style.apply(style_alert_rows, axis=1), use_container_width=True)
\ No newline at end of file
+    st.dataframe(asset_status_summary.style.apply(style_alert_rows, axis=1), use_container_width=True)
+else:
+    st.info("Nenhuma leitura de sensor encontrada. Execute 'gerador_de_dados.py' primeiro.")
\ No newline at end of file
@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from utilities import apply_theme, load_and_analyze_sensor_data, check_authentication, has_page_access, render_sidebar
+from utilities import apply_theme, load_alert_status_summary, load_assets, check_authentication, has_page_access, render_sidebar
 
 check_authentication()
 render_sidebar()
@@ -9,15 +9,15 @@ apply_theme()
 
 st.title("🗺️ Mapa da Planta")
 
-df_analyzed = load_and_analyze_sensor_data()
-if df_analyzed is not None:
-    asset_locations = df_analyzed[['asset_id', 'latitude', 'longitude']].drop_duplicates().set_index('asset_id')
-    asset_status_summary_map = df_analyzed[df_analyzed['timestamp'] >= (df_analyzed['timestamp'].max() - pd.Timedelta(hours=1))].groupby('asset_id').agg(
-        status=('status', lambda x: 'Crítico' if 'Crítico' in x.values else ('Atenção' if 'Atenção' in x.values else 'Normal'))
-    ).reset_index().set_index('asset_id')
+# Pior status da última hora de cada ativo, lido dos eventos de alerta (mantidos pelo agendador, python -m scheduler)
+asset_status_summary_map = load_alert_status_summary(pd.Timedelta(hours=1)).set_index('asset_id')
+if not asset_status_summary_map.empty:
+    # Coordenadas vêm do cadastro de ativos, apenas para os ativos com leituras de sensor
+    df_assets = load_assets()
+    asset_locations = df_assets[df_assets['asset_id'].isin(asset_status_summary_map.index)][['asset_id', 'latitude', 'longitude']].dropna().set_index('asset_id')
     map_data = asset_locations.join(asset_status_summary_map).reset_index()
     color_map = {'Normal': '#008000', 'Atenção': '#FFA500', 'Crítico': '#FF0000'}
-    map_data['color'] = map_data['status'].map(color_map)
+    map_data['color'] = map_data['status'].astype(str).map(color_map)
     map_data.rename(columns={'latitude': 'lat', 'longitude': 'lon'}, inplace=True)
     st.map(map_data, color='color', size=20)
     st.write("### Legenda")
@@ -1,7 +1,13 @@
 import streamlit as st
+import pandas as pd
 import plotly.express as px
-from utilities import apply_theme, load_and_analyze_sensor_data, check_authentication, has_page_access, render_sidebar
-import numpy as np
+import plotly.graph_objects as go
+from datetime import timedelta
+from utilities import (
+    apply_theme, load_sensor_window, load_latest_sensor_timestamps, load_sensor_rollups, choose_rollup_resolution, render_pending_readings_note,
+    downsample_indices, rebucket_rollups, worst_status, check_authentication, has_page_access, render_sidebar,
+    SENSOR_COLUMNS, CHART_POINT_BUDGET
+)
 
 check_authentication()
 render_sidebar()
@@ -10,19 +16,52 @@ apply_theme()
 
 st.title("📊 Análise Detalhada por Ativo")
 
-df_analyzed = load_and_analyze_sensor_data()
-if df_analyzed is not None:
-    selected_asset_id = st.selectbox('Selecione um Ativo:', options=df_analyzed['asset_id'].unique())
+# Os rollups são mantidos pelo agendador (python -m scheduler); a página só lê o que já foi consolidado
+latest_timestamps = load_latest_sensor_timestamps()
+if not latest_timestamps.empty:
+    selected_asset_id = st.selectbox('Selecione um Ativo:', options=latest_timestamps.index)
+    with st.sidebar:
+        point_budget = st.slider("Pontos por gráfico", min_value=200, max_value=5000, value=CHART_POINT_BUDGET, step=100,
+                                 help="Limite de pontos enviados ao navegador por série; os alertas são sempre preservados.")
     if selected_asset_id:
-        df_asset_detail = df_analyzed[df_analyzed['asset_id'] == selected_asset_id]
+        last_reading = latest_timestamps[selected_asset_id].to_pydatetime()
+        render_pending_readings_note(selected_asset_id, latest_timestamps[selected_asset_id])
+        first_reading = load_sensor_rollups('1D', asset_ids=[selected_asset_id])['bucket'].min().to_pydatetime()
+        start, end = st.slider('Período:', min_value=first_reading, max_value=last_reading, value=(max(first_reading, last_reading - timedelta(days=1)), last_reading),
+                               step=timedelta(minutes=15), format="DD/MM/YYYY HH:mm")
+        window = pd.Timestamp(end) - pd.Timestamp(start)
+        # Rollup mais grosso que ainda rende o orçamento de pontos; janelas menores leem as leituras brutas do período
+        resolution = choose_rollup_resolution(window, point_budget)
         st.subheader(f"Dados do Ativo: {selected_asset_id}")
-        sensor_cols_detail = [c for c in df_asset_detail.select_dtypes(include=np.number).columns if c not in ['latitude', 'longitude']]
-        for sensor in sensor_cols_detail:
-            fig = px.line(df_asset_detail, x='timestamp', y=sensor, 
-                          title=f'Leituras de {sensor.replace("_", " ").title()}',
-                          template='plotly_dark')
-            alerts_warn = df_asset_detail[df_asset_detail['status'] == 'Atenção']
-            alerts_crit = df_asset_detail[df_asset_detail['status'] == 'Crítico']
-            if not alerts_warn.empty: fig.add_scatter(x=alerts_warn['timestamp'], y=alerts_warn[sensor], mode='markers', name='Atenção', marker=dict(color='orange', size=8, symbol='triangle-up'))
-            if not alerts_crit.empty: fig.add_scatter(x=alerts_crit['timestamp'], y=alerts_crit[sensor], mode='markers', name='Crítico', marker=dict(color='red', size=8, symbol='x'))
-            st.plotly_chart(fig, use_container_width=True, key=f"chart_{sensor}_{selected_asset_id}")
\ No newline at end of file
+        if resolution is None:
+            df_asset_detail = load_sensor_window(selected_asset_id, start, end)
+            sensor_cols_detail = [c for c in SENSOR_COLUMNS if df_asset_detail[c].notna().any()]
+            for sensor in sensor_cols_detail:
+                df_sensor = df_asset_detail.dropna(subset=[sensor]); n_readings = len(df_sensor)
+                # LTTB até o orçamento de pontos, sem descartar leituras em alerta
+                is_alert = df_sensor['status'].isin(['Atenção', 'Crítico']).to_numpy()
+                df_sensor = df_sensor.iloc[downsample_indices(df_sensor['timestamp'].astype('int64'), df_sensor[sensor], point_budget, keep=is_alert)]
+                if len(df_sensor) < n_readings: st.caption(f"{sensor.replace('_', ' ').title()}: {len(df_sensor):,} de {n_readings:,} leituras exibidas (LTTB).")
+                fig = px.line(df_sensor, x='timestamp', y=sensor,
+                              title=f'Leituras de {sensor.replace("_", " ").title()}',
+                              template='plotly_dark')
+                alerts_warn = df_sensor[df_sensor['status'] == 'Atenção']
+                alerts_crit = df_sensor[df_sensor['status'] == 'Crítico']
+                if not alerts_warn.empty: fig.add_scatter(x=alerts_warn['timestamp'], y=alerts_warn[sensor], mode='markers', name='Atenção', marker=dict(color='orange', size=8, symbol='triangle-up'))
+                if not alerts_crit.empty: fig.add_scatter(x=alerts_crit['timestamp'], y=alerts_crit[sensor], mode='markers', name='Crítico', marker=dict(color='red', size=8, symbol='x'))
+                st.plotly_chart(fig, use_container_width=True, key=f"chart_{sensor}_{selected_asset_id}")
+        else:
+            st.caption(f"Exibindo agregados de {resolution}: média com faixa mínimo–máximo por intervalo.")
+            df_rollup = rebucket_rollups(load_sensor_rollups(resolution, since=start, until=end, asset_ids=[selected_asset_id]), point_budget)
+            # Pior status do ativo em cada bucket (máximo entre os sensores), como nas marcações das leituras brutas
+            bucket_status = worst_status(df_rollup, 'bucket', status_col='worst_status')
+            for sensor, df_sensor in df_rollup.groupby('sensor', sort=False):
+                fig = go.Figure(layout=dict(title=f'Leituras de {sensor.replace("_", " ").title()} ({resolution})', template='plotly_dark'))
+                fig.add_scatter(x=df_sensor['bucket'], y=df_sensor['max_value'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip')
+                fig.add_scatter(x=df_sensor['bucket'], y=df_sensor['min_value'], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(99, 110, 250, 0.25)', name='Mín–Máx')
+                fig.add_scatter(x=df_sensor['bucket'], y=df_sensor['mean_value'], mode='lines', name='Média', line=dict(color='#636EFA'))
+                status = bucket_status.reindex(df_sensor['bucket']).to_numpy()
+                alerts_warn, alerts_crit = df_sensor[status == 'Atenção'], df_sensor[status == 'Crítico']
+                if not alerts_warn.empty: fig.add_scatter(x=alerts_warn['bucket'], y=alerts_warn['max_value'], mode='markers', name='Atenção', marker=dict(color='orange', size=8, symbol='triangle-up'))
+                if not alerts_crit.empty: fig.add_scatter(x=alerts_crit['bucket'], y=alerts_crit['max_value'], mode='markers', name='Crítico', marker=dict(color='red', size=8, symbol='x'))
+                st.plotly_chart(fig, use_container_width=True, key=f"chart_{sensor}_{selected_asset_id}")
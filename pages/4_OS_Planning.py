@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 from utilities import (
-    apply_theme, load_service_orders, append_to_table, update_os, load_users,
-    load_and_analyze_sensor_data, add_resolved_alert, check_authentication, has_page_access, render_sidebar
+    apply_theme, load_service_order_filter_options, service_orders_pager, append_to_table, update_os, load_users,
+    load_assets, add_resolved_alert, check_authentication, has_page_access, render_sidebar
 )
 from datetime import datetime
 import numpy as np
@@ -16,14 +16,13 @@ apply_theme()
 
 st.title("📋 Planejamento e Gestão de OS")
 
-df_analyzed = load_and_analyze_sensor_data()
-df_os = load_service_orders()
+df_assets = load_assets()
 users = load_users()
 technician_names = ["Não atribuído"] + [details['name'] for user, details in users.items()]
 
 st.subheader("Criar Nova Ordem de Serviço Manual")
 with st.form(key="new_os_form", clear_on_submit=True):
-    all_assets = df_analyzed['asset_id'].unique() if df_analyzed is not None else []
+    all_assets = df_assets['asset_id'].tolist()
     col1, col2, col3, col4 = st.columns(4);
     with col1: selected_asset = st.selectbox("Selecione o Ativo:", options=all_assets)
     with col2: os_class = st.selectbox("Classe da OS:", options=["Preventiva", "Corretiva"], key="os_class")
@@ -42,7 +41,7 @@ with st.form(key="new_os_form", clear_on_submit=True):
             st.warning("Por favor, preencha todos os campos obrigatórios (Ativo e Descrição).")
         else:
             new_os_id = f"OS-{uuid.uuid4().hex[:12]}"
-            asset_type = df_analyzed[df_analyzed['asset_id'] == selected_asset]['asset_type'].iloc[0]
+            asset_type = df_assets.loc[df_assets['asset_id'] == selected_asset, 'asset_type'].iloc[0]
             
             # --- CORREÇÃO: Removida a coluna 'parts_used' ---
             new_os = pd.DataFrame([{'os_id': new_os_id, 'asset_id': selected_asset, 'asset_type': asset_type, 'creation_date': datetime.now(), 'reason': os_reason, 'priority': os_priority, 'status': 'Aberta', 'class': os_class, 'recorrencia': os_recurrence, 'assigned_to': assigned_technician, 'notes': '', 'estimated_cost': estimated_cost, 'actual_cost': 0.0, 'files_attached': '[]', 'completion_date': pd.NaT}])
@@ -53,8 +52,20 @@ with st.form(key="new_os_form", clear_on_submit=True):
 
 st.header("Ordens de Serviço Atuais")
 # --- CORREÇÃO: Filtros que permitem ao gestor ver TUDO ---
-status_filter = st.multiselect('Filtrar por Status:', options=df_os['status'].unique(), default=df_os['status'].unique(), key="status_filter_full")
-class_filter = st.multiselect('Filtrar por Classe:', options=df_os['class'].unique(), default=df_os['class'].unique(), key="class_filter_full")
+# Os filtros vão para o SQL (query_service_orders); a tabela mostra apenas a página atual
+filter_options = load_service_order_filter_options()
+col_status, col_class = st.columns(2)
+with col_status: status_filter = st.multiselect('Filtrar por Status:', options=filter_options['status'], default=filter_options['status'], key="status_filter_full")
+with col_class: class_filter = st.multiselect('Filtrar por Classe:', options=filter_options['class'], default=filter_options['class'], key="class_filter_full")
+col_tech, col_asset, col_period = st.columns(3)
+with col_tech: technician_filter = st.multiselect('Filtrar por Técnico:', options=technician_names, placeholder="Todos", key="technician_filter_full")
+with col_asset: asset_filter = st.multiselect('Filtrar por Ativo:', options=all_assets, placeholder="Todos", key="asset_filter_full")
+with col_period: period_filter = st.date_input('Criadas no período:', value=(), key="period_filter_full")
 
-df_os_filtered = df_os[df_os['status'].isin(status_filter) & df_os['class'].isin(class_filter)]
-st.dataframe(df_os_filtered, use_container_width=True)
\ No newline at end of file
+period_start, period_end = (period_filter + (None, None))[:2] if isinstance(period_filter, tuple) else (period_filter, None)
+df_os_page = service_orders_pager(
+    "os_planning", statuses=status_filter, classes=class_filter,
+    assignees=technician_filter or None, asset_ids=asset_filter or None,
+    created_from=period_start, created_to=period_end + pd.Timedelta(days=1) if period_end else None,
+)
+st.dataframe(df_os_page, use_container_width=True)
@@ -1,9 +1,10 @@
 import streamlit as st
 from utilities import (
-    apply_theme, load_service_orders, update_os, add_attachment_to_os, UPLOAD_DIR,
+    apply_theme, service_orders_pager, update_os, add_attachment_to_os, UPLOAD_DIR,
     add_resolved_alert, check_authentication, has_page_access, render_sidebar,
     load_parts, add_part_to_os, get_parts_for_os, ROOT_CAUSES
 )
+from kpi_engine import refresh_kpis
 from datetime import datetime
 import os
 import json
@@ -12,17 +13,16 @@ import pandas as pd
 check_authentication(); render_sidebar(); has_page_access("5_Tech_App"); apply_theme()
 
 st.title("⚙️ Execução de Ordens de Serviço")
-df_os = load_service_orders(); df_parts = load_parts()
+df_parts = load_parts()
 current_user_name = st.session_state['name']
 
 st.header("Minhas Tarefas (OS Abertas / Em Andamento)")
-my_os_filter = (df_os['status'].isin(['Aberta', 'Em Andamento']))
-if st.session_state['role'] != 'admin':
-    my_os_filter &= (df_os['assigned_to'] == current_user_name)
-my_os = df_os[my_os_filter]
+# Filtro aplicado no SQL; só a página atual de OS é carregada
+assignees = None if st.session_state['role'] == 'admin' else [current_user_name]
 if st.session_state['role'] == 'admin':
     if st.toggle("Ver todas as OS ativas (visão de admin)"):
-        my_os = df_os[df_os['status'].isin(['Aberta', 'Em Andamento'])]
+        assignees = None
+my_os = service_orders_pager("tech_app", statuses=['Aberta', 'Em Andamento'], assignees=assignees)
 st.dataframe(my_os, use_container_width=True)
 
 st.header("Detalhes e Atualização de OS")
@@ -31,7 +31,7 @@ if not os_to_update_options:
     st.info("Não há ordens de serviço para atualizar.")
 else:
     selected_os_id = st.selectbox("Selecione a OS para trabalhar:", options=os_to_update_options)
-    os_row = df_os[df_os['os_id'] == selected_os_id].iloc[0]
+    os_row = my_os[my_os['os_id'] == selected_os_id].iloc[0]
     st.write(f"**Ativo:** {os_row['asset_id']} | **Descrição:** {os_row['reason']}")
     
     tab1, tab2, tab3 = st.tabs(["Atualizar Status", "Registrar Peças", "Anexos"])
@@ -66,6 +66,8 @@ else:
                     
                     if new_status == 'Concluída' and os_row['class'] == 'Preditiva':
                         add_resolved_alert(os_row['asset_id'], os_row['reason'])
+                    if new_status == 'Concluída':
+                        refresh_kpis() # Atualiza os agregados de KPI do ativo na conclusão
                         
                     st.success(f"Ordem de Serviço {selected_os_id} atualizada!")
                     st.rerun()
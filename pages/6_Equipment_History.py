@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
 from utilities import (
-    apply_theme, load_and_analyze_sensor_data, load_service_orders,
-    check_authentication, has_page_access, render_sidebar, UPLOAD_DIR, get_parts_for_os
+    apply_theme, load_latest_alert_timestamps, read_alert_events, query_service_orders, get_parts_for_orders, summarize_asset_costs, render_pending_readings_note,
+    check_authentication, has_page_access, render_sidebar, UPLOAD_DIR
 )
 import os
 import json
@@ -14,11 +14,11 @@ apply_theme()
 
 st.title("🔎 Histórico do Ativo")
 
-df_analyzed = load_and_analyze_sensor_data()
-df_os = load_service_orders()
+# Os eventos de alerta são mantidos pelo agendador; a página só lê o que já foi classificado
+latest_timestamps = load_latest_alert_timestamps()
 
-if df_analyzed is not None:
-    asset_list = sorted(df_analyzed['asset_id'].unique())
+if not latest_timestamps.empty:
+    asset_list = sorted(latest_timestamps.index)
     selected_asset_id = st.selectbox("Selecione um ativo para ver seu histórico:", options=asset_list)
 
     if selected_asset_id:
@@ -26,22 +26,31 @@ if df_analyzed is not None:
         st.header(f"Histórico para: {selected_asset_id}")
 
         st.subheader("Histórico de Ordens de Serviço")
-        asset_os = df_os[df_os['asset_id'] == selected_asset_id].copy()
+        asset_os, _ = query_service_orders(asset_ids=[selected_asset_id], limit=None) # Já vem da mais recente para a mais antiga
 
         if asset_os.empty:
             st.info("Nenhuma OS registrada para este ativo.")
         else:
-            for index, row in asset_os.sort_values(by="creation_date", ascending=False).iterrows():
+            # Peças de todas as OS do ativo numa única consulta, agrupadas aqui, e o custo acumulado a partir delas
+            asset_parts = get_parts_for_orders(asset_os['os_id'])
+            parts_by_os = dict(tuple(asset_parts.groupby('os_id')))
+            costs = summarize_asset_costs(asset_os, asset_parts).loc[selected_asset_id]
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Ordens de Serviço", f"{int(costs['orders'])}")
+            col2.metric("Mão de Obra", f"R$ {costs['labor_cost']:,.2f}")
+            col3.metric("Peças", f"R$ {costs['parts_cost']:,.2f}")
+            col4.metric("Custo Total", f"R$ {costs['total_cost']:,.2f}")
+            for index, row in asset_os.iterrows():
                 with st.expander(f"**{row['os_id']}** - {row['reason']} ({row['creation_date'].strftime('%d/%m/%Y')})"):
                     # (Detalhes da OS como antes)
                     # ...
                     
                     st.markdown("**Peças Utilizadas:**")
-                    used_parts_df = get_parts_for_os(row['os_id'])
-                    if used_parts_df.empty:
+                    used_parts_df = parts_by_os.get(row['os_id'])
+                    if used_parts_df is None:
                         st.caption("Nenhuma peça registrada.")
                     else:
-                        st.dataframe(used_parts_df)
+                        st.dataframe(used_parts_df[['description', 'quantity_used', 'unit_cost']])
                     
                     st.markdown("**Anexos:**")
                     # (Lógica de anexos como antes)
@@ -49,12 +58,15 @@ if df_analyzed is not None:
         
         st.divider()
         st.subheader("Histórico de Alertas")
-        asset_alerts = df_analyzed[(df_analyzed['asset_id'] == selected_asset_id) & (~df_analyzed['status'].str.contains('Normal'))].copy()
+        # Um registro por período em alerta (transições gravadas em alert_events), em vez de uma linha por leitura
+        asset_alerts = read_alert_events(asset_ids=[selected_asset_id])
+        render_pending_readings_note(selected_asset_id, latest_timestamps[selected_asset_id])
 
         if asset_alerts.empty:
             st.info("Nenhum alerta registrado para este ativo.")
         else:
-            alerts_to_show = asset_alerts[['timestamp', 'status', 'status_reason']].rename(
-                columns={'timestamp': 'Data/Hora', 'status': 'Status', 'status_reason': 'Motivo'}
+            asset_alerts['duration'] = (asset_alerts['ended_at'].fillna(latest_timestamps[selected_asset_id]) - asset_alerts['started_at']).astype(str)
+            alerts_to_show = asset_alerts[['started_at', 'ended_at', 'status', 'reason', 'duration', 'readings']].rename(
+                columns={'started_at': 'Início', 'ended_at': 'Fim', 'status': 'Status', 'reason': 'Motivo', 'duration': 'Duração', 'readings': 'Leituras'}
             )
-            st.dataframe(alerts_to_show.sort_values(by="Data/Hora", ascending=False), use_container_width=True)
\ No newline at end of file
+            st.dataframe(alerts_to_show, use_container_width=True)
\ No newline at end of file
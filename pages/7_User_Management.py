@@ -1,5 +1,5 @@
 import streamlit as st
-from utilities import apply_theme, check_authentication, has_page_access, load_users, save_users, load_roles, save_roles, AVAILABLE_PAGES, render_sidebar, hash_password
+from utilities import apply_theme, check_authentication, has_page_access, load_users, insert_user, update_user, update_rows, load_roles, insert_role, save_roles, AVAILABLE_PAGES, render_sidebar
 
 check_authentication(); render_sidebar()
 has_page_access("7_User_Management") # <-- CORRIGIDO
@@ -26,12 +26,9 @@ with tab1:
             if st.form_submit_button("Cadastrar Usuário"):
                 if not all([new_username, new_name, new_password, new_role]):
                     st.warning("Todos os campos são obrigatórios.")
-                elif new_username in users_data:
+                elif not insert_user(new_username, new_name, new_password, new_role):
                     st.error(f"O login '{new_username}' já existe.")
                 else:
-                    hashed_password = hash_password(new_password)
-                    users_data[new_username] = {"password": hashed_password, "role": new_role, "name": new_name}
-                    save_users(users_data)
                     st.success(f"Usuário '{new_username}' cadastrado com sucesso!")
                     st.rerun()
 
@@ -39,6 +36,7 @@ with tab1:
     
     # --- Seção para Editar Perfis (sem alterações) ---
     st.subheader("Alterar Perfil de Acesso de Usuários")
+    role_changes = {} # Apenas os usuários alterados são gravados, sem sobrescrever edições de outros administradores
     for username, details in users_data.items():
         col1, col2 = st.columns([1, 1])
         with col1:
@@ -58,12 +56,12 @@ with tab1:
                 key=f"role_{username}", 
                 disabled=is_current_user
             )
-            users_data[username]['role'] = new_role
+            if new_role != user_role: role_changes[username] = new_role
             if is_current_user:
                 st.caption("Não é possível alterar o próprio perfil.")
     
     if st.button("Salvar Alterações de Perfis"):
-        save_users(users_data)
+        update_rows("users", [{'username': username, 'role': role} for username, role in role_changes.items()])
         st.success("Perfis de usuário atualizados!")
         st.rerun()
 
@@ -83,14 +81,8 @@ with tab1:
                 elif new_password_reset != confirm_password_reset:
                     st.error("As senhas não coincidem. Tente novamente.")
                 else:
-                    # Carrega os dados mais recentes antes de alterar
-                    current_users = load_users()
-                    # Gera o hash da nova senha
-                    hashed_password = hash_password(new_password_reset)
-                    # Atualiza a senha do usuário selecionado
-                    current_users[user_to_reset]['password'] = hashed_password
-                    # Salva os dados atualizados no banco de dados
-                    save_users(current_users)
+                    # Atualiza só a senha (com hash) do usuário selecionado
+                    update_user(user_to_reset, password=new_password_reset)
                     st.success(f"Senha do usuário '{user_to_reset}' alterada com sucesso!")
 
     st.divider()
@@ -105,9 +97,7 @@ with tab2:
         with st.form("new_role_form", clear_on_submit=True):
             new_role_name = st.text_input("Nome do Novo Perfil (ex: manutencao, engenharia)").lower()
             if st.form_submit_button("Criar Perfil"):
-                if new_role_name and new_role_name not in roles_data:
-                    roles_data[new_role_name] = {"pages": []}
-                    save_roles(roles_data)
+                if new_role_name and insert_role(new_role_name):
                     st.success(f"Perfil '{new_role_name}' criado com sucesso!"); st.rerun()
                 else:
                     st.error("Nome de perfil inválido ou já existente.")
@@ -115,6 +105,7 @@ with tab2:
     st.divider()
     
     st.subheader("Permissões por Perfil")
+    changed_roles = {}
     for role, permissions in roles_data.items():
         st.write(f"**Perfil:** `{role}`")
         is_admin_role = (role == 'admin')
@@ -126,9 +117,9 @@ with tab2:
             default=current_permissions, key=f"pages_{role}", disabled=is_admin_role
         )
         if is_admin_role: st.caption("O perfil 'admin' tem acesso total e não pode ser editado.")
-        roles_data[role]['pages'] = selected_pages
+        if selected_pages != current_permissions: changed_roles[role] = {'pages': selected_pages}
     
     if st.button("Salvar Alterações de Permissões"):
-        save_roles(roles_data)
+        save_roles(changed_roles)
         st.success("Permissões dos perfis atualizadas com sucesso!")
         st.rerun()
\ No newline at end of file
@@ -3,10 +3,13 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from utilities import (
-    apply_theme, load_service_orders,
+    apply_theme, load_assets,
     check_authentication, has_page_access, render_sidebar
 )
-from datetime import datetime
+from kpi_engine import (
+    load_kpi_status, load_kpi_daily, load_asset_kpis, load_order_date_range, load_order_class_counts, summarize_kpis, kpis_by, kpi_trend,
+    FAILURE_CLASSES, PERIOD_FREQUENCIES, UNDEFINED_CAUSE
+)
 
 # --- Autenticação e Configuração da Página ---
 check_authentication()
@@ -16,14 +19,20 @@ apply_theme()
 
 st.title("📈 Dashboard de KPIs de Manutenção")
 
-df_os = load_service_orders()
+min_date, max_date = load_order_date_range()
+if min_date is None:
+    st.info("Nenhuma ordem de serviço registrada ainda.")
+    st.stop()
+# Os indicadores saem dos agregados diários (kpi_daily), mantidos pelo agendador e pela conclusão de OS no App do Técnico
+refreshed_at, pending_assets = load_kpi_status()
+if refreshed_at is None:
+    st.info("Os agregados de KPI ainda não foram calculados. Execute o agendador (`python -m scheduler`) ou `python -m kpi_engine`.")
+    st.stop()
+st.caption(f"Agregados atualizados em {refreshed_at:%d/%m/%Y %H:%M}" + (f"; {pending_assets} ativo(s) com OS alteradas aguardam o agendador." if pending_assets else "."))
 
 # --- Filtros Principais da Página ---
 st.sidebar.header("Filtros de KPI")
 # Filtro de data na barra lateral para aplicar a toda a página
-min_date = df_os['creation_date'].min().date()
-max_date = df_os['creation_date'].max().date()
-
 date_range = st.sidebar.date_input(
     "Selecione o Período de Análise",
     value=(min_date, max_date),
@@ -36,45 +45,42 @@ if len(date_range) != 2:
     st.stop()
 
 start_date, end_date = date_range
-# Converte as datas para datetime para filtrar corretamente
-df_os_filtered = df_os[
-    (df_os['creation_date'].dt.date >= start_date) & 
-    (df_os['creation_date'].dt.date <= end_date)
-]
-
-# Dataframe base para cálculos: OS de falha que foram concluídas no período
-df_failures = df_os_filtered[
-    (df_os_filtered['status'] == 'Concluída') &
-    (df_os_filtered['class'].isin(['Preditiva', 'Corretiva'])) &
-    (pd.notna(df_os_filtered['completion_date']))
-].copy()
+# Agregados das OS concluídas no período (por data de conclusão)
+df_daily = load_kpi_daily(start_date, end_date)
+df_failures = df_daily[df_daily['os_class'].isin(FAILURE_CLASSES)]
+# Tempo de calendário da frota no período, base da disponibilidade
+assets_per_type = load_assets().groupby('asset_type')['asset_id'].nunique()
+n_assets = max(int(assets_per_type.sum()), 1)
+period_hours = ((pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1) * 24
 
 st.header("Análise Geral do Período")
 
 if df_failures.empty:
     st.warning("Não há dados de ordens de serviço de falha concluídas no período selecionado para calcular os KPIs.")
 else:
-    # --- 1. KPIs Gerais (MTTR, Custo Total) ---
-    df_failures['duration_hours'] = (df_failures['completion_date'] - df_failures['creation_date']).dt.total_seconds() / 3600
-    overall_mttr = df_failures['duration_hours'].mean()
-    total_failures = len(df_failures)
-    total_cost = df_failures['actual_cost'].sum()
+    # --- 1. KPIs Gerais (MTTR, MTBF, Custo, Disponibilidade) ---
+    kpis = summarize_kpis(df_daily, period_hours * n_assets)
     
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total de Falhas Analisadas", f"{total_failures}")
-    col2.metric("MTTR Geral (Horas)", f"{overall_mttr:.2f}")
-    col3.metric("Custo Total de Reparos", f"R$ {total_cost:,.2f}")
+    col1.metric("Total de Falhas Analisadas", f"{kpis['failures']}")
+    col2.metric("MTTR Geral (Horas)", f"{kpis['mttr_hours']:.2f}")
+    col3.metric("Custo Total de Reparos", f"R$ {kpis['cost']:,.2f}")
+    col4, col5, col6 = st.columns(3)
+    col4.metric("MTBF Geral (Horas)", f"{kpis['mtbf_hours']:.2f}" if pd.notna(kpis['mtbf_hours']) else "—")
+    col5.metric("Disponibilidade da Frota", f"{kpis['availability']:.2%}" if pd.notna(kpis['availability']) else "—",
+                help="Estilo OEE: (tempo planejado − paradas por falha) / tempo planejado; o tempo planejado desconta as preventivas.")
+    col6.metric("Paradas por Falha / Planejadas (h)", f"{kpis['unplanned_downtime_hours']:,.1f} / {kpis['planned_downtime_hours']:,.1f}")
 
     st.divider()
     st.header("Análise de Causa Raiz (Princípio de Pareto)")
 
     # Filtra causas não definidas
-    rca_df = df_failures[df_failures['root_cause'].notna() & (df_failures['root_cause'] != 'Não Definida')]
+    rca_df = df_failures[df_failures['root_cause'] != UNDEFINED_CAUSE]
 
     if rca_df.empty:
         st.info("Nenhuma causa raiz foi registrada para as falhas no período selecionado.")
     else:
-        cause_counts = rca_df['root_cause'].value_counts().reset_index()
+        cause_counts = rca_df.groupby('root_cause')['orders'].sum().reset_index()
         cause_counts.columns = ['Causa Raiz', 'Frequência']
         
         # Calcula a porcentagem acumulada para o gráfico de Pareto
@@ -119,29 +125,34 @@ else:
     
     time_agg_option = st.selectbox(
         "Agrupar dados por:",
-        options=['Diário', 'Semanal', 'Mensal', 'Trimestral', 'Anual']
+        options=list(PERIOD_FREQUENCIES)
     )
-    time_mapping = {'Diário': 'D', 'Semanal': 'W', 'Mensal': 'M', 'Trimestral': 'Q', 'Anual': 'Y'}
     
-    # Prepara dados para os gráficos de tendência
-    df_trends = df_failures.set_index('completion_date')
+    # Prepara dados para os gráficos de tendência (somas dos agregados diários por período)
+    df_trends = kpi_trend(df_daily, PERIOD_FREQUENCIES[time_agg_option], start_date, end_date, n_assets)
     
     # Gráfico 1: Custo ao longo do tempo
-    costs_over_time = df_trends['actual_cost'].resample(time_mapping[time_agg_option]).sum()
-    fig_cost_trend = px.line(costs_over_time, x=costs_over_time.index, y='actual_cost',
+    fig_cost_trend = px.line(df_trends, x=df_trends.index, y='cost',
                              title=f"Custo de Manutenção ({time_agg_option})",
-                             labels={'completion_date': 'Período', 'actual_cost': 'Custo Total (R$)'},
+                             labels={'period': 'Período', 'cost': 'Custo Total (R$)'},
                              template='plotly_dark', markers=True)
     st.plotly_chart(fig_cost_trend, use_container_width=True)
 
     # Gráfico 2: Número de falhas ao longo do tempo
-    failures_over_time = df_trends['os_id'].resample(time_mapping[time_agg_option]).count()
-    fig_failures_trend = px.bar(failures_over_time, x=failures_over_time.index, y='os_id',
+    fig_failures_trend = px.bar(df_trends, x=df_trends.index, y='failures',
                                 title=f"Número de Falhas ({time_agg_option})",
-                                labels={'completion_date': 'Período', 'os_id': 'Nº de Falhas'},
+                                labels={'period': 'Período', 'failures': 'Nº de Falhas'},
                                 template='plotly_dark')
     st.plotly_chart(fig_failures_trend, use_container_width=True)
 
+    # Gráfico 3: Disponibilidade da frota ao longo do tempo
+    fig_availability_trend = px.line(df_trends, x=df_trends.index, y='availability',
+                                     title=f"Disponibilidade da Frota ({time_agg_option})",
+                                     labels={'period': 'Período', 'availability': 'Disponibilidade'},
+                                     template='plotly_dark', markers=True)
+    fig_availability_trend.update_yaxes(tickformat='.1%')
+    st.plotly_chart(fig_availability_trend, use_container_width=True)
+
     # --- 3. Análise de Composição e Ranking (NOVOS GRÁFICOS) ---
     st.divider()
     st.header("Composição e Ranking")
@@ -149,19 +160,19 @@ else:
     col_pie, col_top5 = st.columns(2)
 
     with col_pie:
-        # Gráfico 3: Distribuição de OS por Classe
-        class_counts = df_os_filtered['class'].value_counts().reset_index()
+        # Gráfico 4: Distribuição de OS (abertas no período) por Classe
+        class_counts = load_order_class_counts(start_date, end_date)
         fig_pie = px.pie(class_counts, names='class', values='count', 
                          title='Distribuição de OS por Classe',
                          template='plotly_dark')
         st.plotly_chart(fig_pie, use_container_width=True)
     
     with col_top5:
-        # Gráfico 4: Top 5 Ativos com mais Custo
-        top_5_cost_assets = df_failures.groupby('asset_id')['actual_cost'].sum().nlargest(5).sort_values()
-        fig_top5 = px.bar(top_5_cost_assets, x='actual_cost', y=top_5_cost_assets.index,
+        # Gráfico 5: Top 5 Ativos com mais Custo
+        top_5_cost_assets = load_asset_kpis(start_date, end_date)['cost'].nlargest(5).sort_values()
+        fig_top5 = px.bar(top_5_cost_assets, x='cost', y=top_5_cost_assets.index,
                           orientation='h', title='Top 5 Ativos por Custo de Manutenção',
-                          labels={'actual_cost': 'Custo Total (R$)', 'y': 'ID do Ativo'},
+                          labels={'cost': 'Custo Total (R$)', 'y': 'ID do Ativo'},
                           template='plotly_dark')
         st.plotly_chart(fig_top5, use_container_width=True)
 
@@ -169,23 +180,27 @@ else:
     # --- 4. Análise de Confiabilidade (Gráficos Antigos) ---
     st.divider()
     st.header("Análise de Confiabilidade por Tipo de Ativo")
+    kpis_by_type = kpis_by(df_daily, 'asset_type', n_assets=assets_per_type, calendar_hours=period_hours).reset_index()
     
     # MTTR por Tipo de Ativo
-    mttr_by_asset = df_failures.groupby('asset_type')['duration_hours'].mean().reset_index()
-    fig_mttr = px.bar(mttr_by_asset, x='asset_type', y='duration_hours', title='MTTR (Tempo Médio para Reparo) por Tipo de Ativo',
-                      labels={'asset_type': 'Tipo de Ativo', 'duration_hours': 'MTTR (Horas)'}, template='plotly_dark')
+    fig_mttr = px.bar(kpis_by_type, x='asset_type', y='mttr_hours', title='MTTR (Tempo Médio para Reparo) por Tipo de Ativo',
+                      labels={'asset_type': 'Tipo de Ativo', 'mttr_hours': 'MTTR (Horas)'}, template='plotly_dark')
     st.plotly_chart(fig_mttr, use_container_width=True)
 
     # MTBF por Tipo de Ativo
-    df_failures = df_failures.sort_values(by=['asset_id', 'creation_date'])
-    df_failures['previous_completion'] = df_failures.groupby('asset_id')['completion_date'].shift(1)
-    df_failures['uptime_hours'] = (df_failures['creation_date'] - df_failures['previous_completion']).dt.total_seconds() / 3600
-    df_mtbf = df_failures[df_failures['uptime_hours'] > 0]
+    df_mtbf = kpis_by_type[kpis_by_type['mtbf_hours'].notna()]
     
     if not df_mtbf.empty:
-        mtbf_by_asset = df_mtbf.groupby('asset_type')['uptime_hours'].mean().reset_index()
-        fig_mtbf = px.bar(mtbf_by_asset, x='asset_type', y='uptime_hours', title='MTBF (Tempo Médio Entre Falhas) por Tipo de Ativo',
-                          labels={'asset_type': 'Tipo de Ativo', 'uptime_hours': 'MTBF (Horas)'}, template='plotly_dark')
+        fig_mtbf = px.bar(df_mtbf, x='asset_type', y='mtbf_hours', title='MTBF (Tempo Médio Entre Falhas) por Tipo de Ativo',
+                          labels={'asset_type': 'Tipo de Ativo', 'mtbf_hours': 'MTBF (Horas)'}, template='plotly_dark')
         st.plotly_chart(fig_mtbf, use_container_width=True)
     else:
-        st.info("Não há dados suficientes (falhas consecutivas no mesmo ativo) para calcular o MTBF por tipo de ativo.")
\ No newline at end of file
+        st.info("Não há dados suficientes (falhas consecutivas no mesmo ativo) para calcular o MTBF por tipo de ativo.")
+
+    # Disponibilidade por Tipo de Ativo
+    df_availability = kpis_by_type[kpis_by_type['availability'].notna()]
+    if not df_availability.empty:
+        fig_availability = px.bar(df_availability, x='asset_type', y='availability', title='Disponibilidade por Tipo de Ativo',
+                                  labels={'asset_type': 'Tipo de Ativo', 'availability': 'Disponibilidade'}, template='plotly_dark')
+        fig_availability.update_yaxes(tickformat='.1%')
+        st.plotly_chart(fig_availability, use_container_width=True)
@@ -1,6 +1,5 @@
 import streamlit as st
-import pandas as pd
-from utilities import apply_theme, load_parts, save_parts, check_authentication, has_page_access, render_sidebar
+from utilities import apply_theme, load_parts, upsert_part, estimate_stock_runway, load_stock_movements, check_authentication, has_page_access, render_sidebar, REORDER_LEAD_DAYS, CONSUMPTION_WINDOW_DAYS
 
 check_authentication()
 render_sidebar()
@@ -17,6 +16,15 @@ if not low_stock_parts.empty:
     st.warning("⚠️ Alerta de Estoque Baixo para os seguintes itens:")
     st.dataframe(low_stock_parts)
 
+# --- PREVISÃO DE RUPTURA (consumo médio do livro de estoque) ---
+df_runway = estimate_stock_runway()
+reorder_parts = df_runway[df_runway['reorder'] & ~df_runway['part_id'].isin(low_stock_parts['part_id'])]
+if not reorder_parts.empty:
+    st.info(f"🛒 Ruptura prevista em até {REORDER_LEAD_DAYS} dias, pelo consumo dos últimos {CONSUMPTION_WINDOW_DAYS} dias:")
+    st.dataframe(reorder_parts[['part_id', 'description', 'stock_quantity', 'daily_consumption', 'days_to_stockout', 'stockout_date']].rename(columns={
+        'part_id': 'Peça', 'description': 'Descrição', 'stock_quantity': 'Estoque', 'daily_consumption': 'Consumo/dia', 'days_to_stockout': 'Dias até zerar', 'stockout_date': 'Ruptura prevista'}),
+        use_container_width=True)
+
 with st.expander("➕ Adicionar/Editar Peça no Inventário"):
     with st.form("part_form", clear_on_submit=True):
         part_id = st.text_input("ID da Peça (SKU)")
@@ -30,15 +38,19 @@ with st.expander("➕ Adicionar/Editar Peça no Inventário"):
             if not all([part_id, description]):
                 st.warning("ID da Peça e Descrição são obrigatórios.")
             else:
-                if part_id in df_parts['part_id'].values:
-                    df_parts.loc[df_parts['part_id'] == part_id, ['description', 'stock_quantity', 'min_stock_level', 'unit_cost']] = [description, stock_quantity, min_stock_level, unit_cost]
-                    st.success(f"Peça '{part_id}' atualizada!")
-                else:
-                    new_part = pd.DataFrame([{'part_id': part_id, 'description': description, 'stock_quantity': stock_quantity, 'min_stock_level': min_stock_level, 'unit_cost': unit_cost}])
-                    df_parts = pd.concat([df_parts, new_part], ignore_index=True)
-                    st.success(f"Peça '{part_id}' adicionada!")
-                save_parts(df_parts)
+                upsert_part({'part_id': part_id, 'description': description, 'stock_quantity': stock_quantity, 'min_stock_level': min_stock_level, 'unit_cost': unit_cost})
+                st.success(f"Peça '{part_id}' {'atualizada' if part_id in df_parts['part_id'].values else 'adicionada'}!")
                 st.rerun()
 
 st.header("Inventário Atual de Peças")
-st.dataframe(df_parts, use_container_width=True)
\ No newline at end of file
+st.dataframe(df_parts, use_container_width=True)
+
+st.header("Movimentações de Estoque")
+selected_part = st.selectbox("Selecione a peça:", options=df_parts['part_id'], key="movements_part")
+if selected_part:
+    df_movements = load_stock_movements(selected_part)
+    if df_movements.empty:
+        st.caption("Nenhuma movimentação registrada.")
+    else:
+        st.dataframe(df_movements[['created_at', 'kind', 'quantity', 'balance', 'os_id']].rename(columns={
+            'created_at': 'Data/Hora', 'kind': 'Tipo', 'quantity': 'Quantidade', 'balance': 'Saldo', 'os_id': 'OS'}), use_container_width=True)
\ No newline at end of file
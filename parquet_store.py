@@ -0,0 +1,64 @@
+import os
+import uuid
+import pandas as pd
+
+# Camada opcional de armazenamento colunar para o histórico de sensores (requer o pacote `pyarrow`).
+# As leituras são gravadas em arquivos Parquet particionados por dia (sensor_parquet/date=AAAA-MM-DD/),
+# e a leitura aplica poda de colunas e filtros de timestamp/asset_id direto nos arquivos.
+
+PARQUET_DIR = "sensor_parquet"
+ROW_GROUP_SIZE = 65536 # Grupos menores = estatísticas min/max mais seletivas para o filtro por asset_id
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("O armazenamento em Parquet requer o pacote 'pyarrow' (pip install pyarrow).") from e
+    return pa, ds, pq
+
+
+def write_sensor_readings(df, root=PARQUET_DIR):
+    """Anexa as leituras como novos arquivos nas partições diárias correspondentes."""
+    pa, _, pq = _import_pyarrow()
+    for date, df_day in df.groupby(df['timestamp'].dt.strftime('%Y-%m-%d')):
+        partition_dir = os.path.join(root, f"date={date}"); os.makedirs(partition_dir, exist_ok=True)
+        table = pa.Table.from_pandas(df_day.sort_values(['asset_id', 'timestamp']), preserve_index=False)
+        pq.write_table(table, os.path.join(partition_dir, f"part-{uuid.uuid4().hex}.parquet"), row_group_size=ROW_GROUP_SIZE, compression='zstd')
+
+
+def read_sensor_readings(columns=None, since=None, until=None, asset_ids=None, root=PARQUET_DIR):
+    """Lê as leituras com poda de partições/colunas. `since` é exclusivo e `until` inclusivo, como nas consultas SQL."""
+    pa, ds, _ = _import_pyarrow()
+    if not os.path.isdir(root): raise FileNotFoundError(f"Diretório Parquet '{root}' não encontrado.")
+    dataset = ds.dataset(root, format='parquet', partitioning=ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive'))
+    conditions = []
+    if since is not None:
+        conditions += [ds.field('date') >= since.strftime('%Y-%m-%d'), ds.field('timestamp') > pd.Timestamp(since).to_datetime64()]
+    if until is not None:
+        conditions += [ds.field('date') <= until.strftime('%Y-%m-%d'), ds.field('timestamp') <= pd.Timestamp(until).to_datetime64()]
+    if asset_ids is not None:
+        conditions.append(ds.field('asset_id').isin(list(asset_ids)))
+    row_filter = None
+    for condition in conditions: row_filter = condition if row_filter is None else row_filter & condition
+    columns = columns or [name for name in dataset.schema.names if name != 'date']
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+def read_latest_timestamps(asset_ids, root=PARQUET_DIR):
+    """Último timestamp de cada ativo de `asset_ids`, lendo as partições diárias da mais nova para a mais antiga e
+    parando quando todos foram encontrados: ativos que reportam hoje custam só a partição de hoje. Em cada partição
+    só as colunas asset_id/timestamp são lidas, e os grupos de linhas fora dos ativos restantes são podados pelas estatísticas."""
+    pa, ds, _ = _import_pyarrow()
+    if not os.path.isdir(root): raise FileNotFoundError(f"Diretório Parquet '{root}' não encontrado.")
+    remaining, found = set(asset_ids), []
+    for partition in sorted((name for name in os.listdir(root) if name.startswith('date=')), reverse=True):
+        if not remaining: break
+        table = ds.dataset(os.path.join(root, partition), format='parquet').to_table(columns=['asset_id', 'timestamp'], filter=ds.field('asset_id').isin(list(remaining)))
+        if table.num_rows == 0: continue
+        latest = table.group_by('asset_id').aggregate([('timestamp', 'max')]).to_pandas()
+        found.append(latest); remaining -= set(latest['asset_id'])
+    if not found: return pd.Series(dtype='datetime64[ns]', name='last_timestamp', index=pd.Index([], name='asset_id'))
+    return pd.concat(found, ignore_index=True).set_index('asset_id')['timestamp_max'].rename('last_timestamp')
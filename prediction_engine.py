@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from parquet_store import read_latest_timestamps, read_sensor_readings
+from utilities import ASSET_PROFILES, SENSOR_STORAGE, TIMESTAMP_FORMAT, engine, ensure_database
+
+# Motor de previsão de falhas: carrega os históricos em lote, ajusta os modelos em paralelo e grava o
+# resultado na tabela `forecasts`. A página 11_Failure_Prediction apenas lê as previsões já calculadas.
+# Uso (fora do Streamlit): python prediction_engine.py [--backend hybrid|holt|linear|arima]
+
+HISTORY_POINTS = 200    # Leituras mais recentes usadas por série (mesmo LIMIT da consulta original)
+MIN_HISTORY_POINTS = 20 # Abaixo disso não há dados suficientes para o modelo
+FORECAST_STEPS = 24
+ARIMA_ORDER = (5, 1, 0)
+LINEAR_WINDOW = 60      # Janela (pontos mais recentes) da regressão de tendência linear
+HOLT_ALPHA, HOLT_BETA = 0.5, 0.1
+# Backends: 'holt' e 'linear' ajustam todas as séries de uma vez com NumPy; 'hybrid' varre com Holt e
+# confirma com ARIMA apenas as séries que cruzariam o limite crítico; 'arima' ajusta tudo com ARIMA.
+FORECAST_BACKENDS = {'hybrid': 'Holt + confirmação ARIMA', 'holt': 'Suavização de Holt', 'linear': 'Tendência linear', 'arima': 'ARIMA'}
+DEFAULT_BACKEND = 'hybrid'
+_refresh_lock = threading.Lock()
+
+
+def fit_arima_forecast(values, steps=FORECAST_STEPS, order=ARIMA_ORDER):
+    """Treina um modelo ARIMA e retorna a previsão (executado nos processos do pool)."""
+    from statsmodels.tsa.arima.model import ARIMA
+    warnings.filterwarnings("ignore")
+    try:
+        model_fit = ARIMA(values, order=order, enforce_stationarity=False, enforce_invertibility=False).fit()
+        return np.asarray(model_fit.forecast(steps=steps), dtype=float)
+    except Exception:
+        return None
+
+
+def stack_series(series_values, window=HISTORY_POINTS):
+    """Empilha as séries em uma matriz (séries × janela), alinhadas à direita e completadas com NaN à esquerda."""
+    matrix = np.full((len(series_values), window), np.nan)
+    for i, values in enumerate(series_values):
+        values = values[-window:]; matrix[i, window - len(values):] = values
+    return matrix
+
+
+def linear_trend_forecast(matrix, steps=FORECAST_STEPS, window=LINEAR_WINDOW):
+    """Extrapola a reta de mínimos quadrados dos últimos `window` pontos de cada série, todas de uma vez."""
+    matrix = matrix[:, -window:]; x = np.arange(matrix.shape[1], dtype=float)
+    valid = ~np.isnan(matrix); count = valid.sum(axis=1)
+    x_mean = (valid * x).sum(axis=1) / count; y_mean = np.nansum(matrix, axis=1) / count
+    dx = np.where(valid, x - x_mean[:, None], 0.0); dy = np.where(valid, matrix - y_mean[:, None], 0.0)
+    denominator = (dx ** 2).sum(axis=1)
+    slope = np.divide((dx * dy).sum(axis=1), denominator, out=np.zeros_like(denominator), where=denominator > 0)
+    future_x = x[-1] + np.arange(1, steps + 1)
+    return y_mean[:, None] + slope[:, None] * (future_x[None, :] - x_mean[:, None])
+
+
+def holt_forecast(matrix, steps=FORECAST_STEPS, alpha=HOLT_ALPHA, beta=HOLT_BETA):
+    """Suavização exponencial de Holt (nível + tendência) vetorizada sobre todas as séries."""
+    rows = np.arange(matrix.shape[0]); first_valid = np.argmax(~np.isnan(matrix), axis=1)
+    level = matrix[rows, first_valid]; trend = np.zeros(matrix.shape[0])
+    for t in range(matrix.shape[1]):
+        y = matrix[:, t]; active = (t > first_valid) & ~np.isnan(y)
+        new_level = alpha * y + (1 - alpha) * (level + trend)
+        trend = np.where(active, beta * (new_level - level) + (1 - beta) * trend, trend)
+        level = np.where(active, new_level, level)
+    return level[:, None] + trend[:, None] * np.arange(1, steps + 1)
+
+
+VECTORIZED_FORECASTERS = {'holt': holt_forecast, 'linear': linear_trend_forecast, 'hybrid': holt_forecast}
+
+
+def fit_arima_batch(values_list, max_workers=None):
+    """Ajusta ARIMA para várias séries distribuindo-as em um pool de processos."""
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fit_arima_forecast, values_list, chunksize=max(1, len(values_list) // (4 * workers))))
+
+
+def load_latest_timestamps(asset_ids=None):
+    """Último timestamp de leitura por ativo (usa o índice (asset_id, timestamp); no Parquet, só as partições mais novas
+    dos ativos informados, por padrão os cadastrados)."""
+    if SENSOR_STORAGE == "parquet":
+        if asset_ids is None: asset_ids = pd.read_sql("SELECT asset_id FROM assets", engine)['asset_id']
+        return read_latest_timestamps(asset_ids)
+    df = pd.read_sql("SELECT asset_id, MAX(timestamp) AS last_timestamp FROM sensor_data GROUP BY asset_id", engine, parse_dates=['last_timestamp'])
+    return df.set_index('asset_id')['last_timestamp']
+
+
+def load_sensor_histories(asset_ids, history_points=HISTORY_POINTS):
+    """Carrega, em uma única consulta, as últimas `history_points` leituras de cada ativo informado."""
+    sensors = list(dict.fromkeys(param for profile in ASSET_PROFILES.values() for param in profile['params']))
+    if SENSOR_STORAGE == "parquet":
+        df = read_sensor_readings(columns=['timestamp', 'asset_id'] + sensors, asset_ids=asset_ids)
+        return df.sort_values(['asset_id', 'timestamp']).groupby('asset_id').tail(history_points).reset_index(drop=True)
+    query = text(f"""
+        SELECT timestamp, asset_id, {', '.join(sensors)} FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY asset_id ORDER BY timestamp DESC) AS rn
+            FROM sensor_data WHERE asset_id IN :asset_ids
+        ) WHERE rn <= :history_points ORDER BY asset_id, timestamp
+    """).bindparams(bindparam('asset_ids', expanding=True))
+    return pd.read_sql(query, engine, params={"asset_ids": list(asset_ids), "history_points": history_points}, parse_dates=['timestamp'])
+
+
+def load_forecasts():
+    df = pd.read_sql("SELECT * FROM forecasts", engine, parse_dates=['last_timestamp', 'updated_at'])
+    df['forecast'] = df['forecast'].map(lambda values: json.loads(values) if values else None)
+    return df
+
+
+def forecast_to_series(row):
+    """Reconstrói a previsão de uma linha de `forecasts` como série indexada por timestamp."""
+    step = pd.Timedelta(seconds=row['step_seconds'])
+    return pd.Series(row['forecast'], index=[row['last_timestamp'] + step * (i + 1) for i in range(len(row['forecast']))])
+
+
+def hours_until_threshold(forecast, step, threshold):
+    """Horas entre a última leitura e o primeiro passo previsto acima do limite crítico (None se não cruzar)."""
+    crossing = np.flatnonzero(forecast > threshold)
+    if crossing.size == 0: return None
+    return int((step * (crossing[0] + 1)).total_seconds() / 3600)
+
+
+def find_stale_series(backend=DEFAULT_BACKEND):
+    """Séries (ativo × sensor) cujo último timestamp de entrada (ou backend) mudou desde a última previsão gravada."""
+    df_assets = pd.read_sql("SELECT asset_id, asset_type FROM assets", engine)
+    series = pd.DataFrame([
+        {'asset_id': asset['asset_id'], 'asset_type': asset['asset_type'], 'sensor': sensor, 'threshold': config['op_max'] * config['crit_factor']}
+        for asset in df_assets.to_dict('records') for sensor, config in ASSET_PROFILES.get(asset['asset_type'], {}).get('params', {}).items()
+    ], columns=['asset_id', 'asset_type', 'sensor', 'threshold'])
+    series['last_timestamp'] = series['asset_id'].map(load_latest_timestamps(series['asset_id'].unique()))
+    series = series.dropna(subset=['last_timestamp'])
+    cached = pd.read_sql("SELECT asset_id, sensor, last_timestamp AS cached_timestamp, backend AS cached_backend FROM forecasts", engine, parse_dates=['cached_timestamp'])
+    series = series.merge(cached, on=['asset_id', 'sensor'], how='left')
+    is_stale = series['cached_timestamp'].isna() | (series['last_timestamp'] > series['cached_timestamp']) | (series['cached_backend'] != backend)
+    return series[is_stale].drop(columns=['cached_timestamp', 'cached_backend'])
+
+
+def refresh_forecasts(max_workers=None, backend=DEFAULT_BACKEND):
+    """Reajusta apenas as séries que receberam dados novos e grava as previsões. Retorna o número de séries reajustadas."""
+    with _refresh_lock:
+        ensure_database()
+        stale = find_stale_series(backend)
+        if stale.empty: return 0
+        histories = {asset_id: group for asset_id, group in load_sensor_histories(stale['asset_id'].unique()).groupby('asset_id')}
+        tasks, rows = [], []
+        for series in stale.to_dict('records'):
+            history = histories.get(series['asset_id'])
+            values = history[series['sensor']].dropna() if history is not None else pd.Series(dtype=float)
+            row = {'asset_id': series['asset_id'], 'sensor': series['sensor'], 'last_timestamp': series['last_timestamp'].strftime(TIMESTAMP_FORMAT),
+                   'threshold': series['threshold'], 'hours_to_failure': None, 'step_seconds': None, 'forecast': None,
+                   'backend': backend, 'model': None, 'updated_at': datetime.now().strftime(TIMESTAMP_FORMAT)}
+            rows.append(row)
+            if len(values) > MIN_HISTORY_POINTS:
+                step = history['timestamp'].diff().median()
+                row['step_seconds'] = step.total_seconds()
+                tasks.append((row, values.to_numpy(dtype=float), step))
+        if tasks and backend in VECTORIZED_FORECASTERS:
+            forecasts = VECTORIZED_FORECASTERS[backend](stack_series([values for _, values, _ in tasks]))
+            for (row, _, step), forecast in zip(tasks, forecasts):
+                row.update(forecast=json.dumps(forecast.tolist()), model=backend if backend != 'hybrid' else 'holt',
+                           hours_to_failure=hours_until_threshold(forecast, step, row['threshold']))
+        # No modo híbrido só as séries sinalizadas pela varredura rápida passam pelo ARIMA
+        if backend == 'arima': arima_tasks = tasks
+        elif backend == 'hybrid': arima_tasks = [task for task in tasks if task[0]['hours_to_failure'] is not None]
+        else: arima_tasks = []
+        if arima_tasks:
+            for (row, _, step), forecast in zip(arima_tasks, fit_arima_batch([values for _, values, _ in arima_tasks], max_workers)):
+                if forecast is None: continue
+                row.update(forecast=json.dumps(forecast.tolist()), model='arima', hours_to_failure=hours_until_threshold(forecast, step, row['threshold']))
+        stmt = text("""
+            INSERT INTO forecasts (asset_id, sensor, last_timestamp, threshold, hours_to_failure, step_seconds, forecast, backend, model, updated_at)
+            VALUES (:asset_id, :sensor, :last_timestamp, :threshold, :hours_to_failure, :step_seconds, :forecast, :backend, :model, :updated_at)
+            ON CONFLICT(asset_id, sensor) DO UPDATE SET last_timestamp = excluded.last_timestamp, threshold = excluded.threshold,
+                hours_to_failure = excluded.hours_to_failure, step_seconds = excluded.step_seconds, forecast = excluded.forecast,
+                backend = excluded.backend, model = excluded.model, updated_at = excluded.updated_at
+        """)
+        with engine.connect() as conn:
+            conn.execute(stmt, rows); conn.commit()
+        return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Atualiza as previsões de falha gravadas na tabela forecasts.")
+    parser.add_argument('--backend', choices=list(FORECAST_BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument('--workers', type=int, default=None, help="Processos do pool de ajuste ARIMA.")
+    args = parser.parse_args()
+    start = datetime.now()
+    refit = refresh_forecasts(args.workers, args.backend)
+    print(f"{refit} série(s) reajustada(s) em {(datetime.now() - start).total_seconds():.1f}s.")
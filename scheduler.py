@@ -0,0 +1,102 @@
+import argparse
+import os
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from kpi_engine import refresh_kpis
+from prediction_engine import refresh_forecasts, FORECAST_BACKENDS, DEFAULT_BACKEND
+from utilities import (
+    engine, initialize_database, read_alert_events, update_alert_events, load_service_orders, suppress_resolved_alerts,
+    check_and_generate_os, check_and_generate_recurring_os, update_sensor_rollups, SCHEDULER_LEASE_NAME, TIMESTAMP_FORMAT
+)
+
+# Agendador de geração de OS (recorrentes e por alerta crítico), executado fora do Streamlit:
+#   python -m scheduler [--interval 60] [--once] [--forecast-backend hybrid]
+# Vários processos podem ser iniciados; apenas o dono do lease em `scheduler_leases` escreve.
+
+DEFAULT_INTERVAL_SECONDS = 60
+
+
+def acquire_lease(owner, lease_seconds):
+    """Tenta obter (ou renovar) o lease de escrita. Retorna True se este processo for o dono."""
+    now = datetime.now()
+    with engine.connect() as conn:
+        conn.execute(text("""
+            INSERT INTO scheduler_leases (name, owner, expires_at) VALUES (:name, :owner, :expires_at)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE scheduler_leases.owner = excluded.owner OR scheduler_leases.expires_at < :now
+        """), {"name": SCHEDULER_LEASE_NAME, "owner": owner, "expires_at": (now + timedelta(seconds=lease_seconds)).strftime(TIMESTAMP_FORMAT), "now": now.strftime(TIMESTAMP_FORMAT)})
+        current_owner = conn.execute(text("SELECT owner FROM scheduler_leases WHERE name = :name"), {"name": SCHEDULER_LEASE_NAME}).scalar()
+        conn.commit()
+    return current_owner == owner
+
+
+class LeaseLost(Exception):
+    """O lease expirou durante a rodada e foi assumido por outro processo."""
+
+
+def release_lease(owner):
+    with engine.connect() as conn:
+        conn.execute(text("UPDATE scheduler_leases SET expires_at = :now WHERE name = :name AND owner = :owner"), {"name": SCHEDULER_LEASE_NAME, "owner": owner, "now": datetime.now().strftime(TIMESTAMP_FORMAT)})
+        conn.commit()
+
+
+def run_cycle(owner=None, lease_seconds=None, forecast_backend=DEFAULT_BACKEND):
+    """Uma rodada do agendador: OS preventivas recorrentes e OS preditivas para alertas críticos. Retorna (preventivas, preditivas).
+    Com `owner`, o lease é renovado antes de cada etapa que grava; se outro processo o assumiu (rodada mais longa que
+    o lease), a rodada para com LeaseLost em vez de gravar junto com o novo dono."""
+    def renew_lease():
+        if owner is not None and not acquire_lease(owner, lease_seconds): raise LeaseLost("Lease assumido por outro processo; rodada interrompida.")
+    df_os = load_service_orders(); initial_count = len(df_os)
+    renew_lease(); df_os = check_and_generate_recurring_os(df_os); recurring_count = len(df_os) - initial_count
+    predictive_count = 0
+    # Um evento crítico por (ativo, motivo) basta para a OS: a tabela de eventos substitui a reclassificação do histórico bruto
+    renew_lease(); update_alert_events()
+    df_critical = read_alert_events(statuses=['Crítico']).drop_duplicates(['asset_id', 'reason']).rename(columns={'reason': 'status_reason'})
+    if not df_critical.empty:
+        renew_lease(); predictive_count = len(check_and_generate_os(suppress_resolved_alerts(df_critical), df_os)) - len(df_os)
+    renew_lease(); update_sensor_rollups() # Mantém os rollups dos painéis em dia mesmo sem ninguém com as páginas abertas
+    renew_lease(); refresh_kpis() # Idem para os agregados de KPI (só recalcula ativos com OS concluídas desde a última rodada)
+    renew_lease(); refresh_forecasts(backend=forecast_backend) # Previsões de falha lidas pela página 11 (só séries com dados novos)
+    renew_lease()
+    with engine.connect() as conn:
+        conn.execute(text("UPDATE scheduler_leases SET last_run = :now WHERE name = :name"), {"name": SCHEDULER_LEASE_NAME, "now": datetime.now().strftime(TIMESTAMP_FORMAT)})
+        conn.commit()
+    return recurring_count, predictive_count
+
+
+def run_scheduler(interval_seconds=DEFAULT_INTERVAL_SECONDS, once=False, forecast_backend=DEFAULT_BACKEND):
+    initialize_database()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM): signal.signal(sig, lambda *_: stop_event.set())
+    print(f"Agendador iniciado ({owner}), intervalo de {interval_seconds}s.")
+    try:
+        while not stop_event.is_set():
+            lease_seconds = 3 * interval_seconds
+            if acquire_lease(owner, lease_seconds):
+                try:
+                    recurring_count, predictive_count = run_cycle(owner, lease_seconds, forecast_backend)
+                    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {recurring_count} OS preventiva(s) e {predictive_count} OS preditiva(s) gerada(s).")
+                except LeaseLost as e:
+                    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {e}")
+                except Exception as e:
+                    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Erro na rodada do agendador: {e}")
+            else:
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Outro processo detém o lease; aguardando.")
+            if once: break
+            stop_event.wait(interval_seconds)
+    finally:
+        release_lease(owner)
+        print("Agendador finalizado.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agendador de geração automática de Ordens de Serviço.")
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL_SECONDS, help="Intervalo entre rodadas, em segundos.")
+    parser.add_argument('--once', action='store_true', help="Executa uma única rodada e sai.")
+    parser.add_argument('--forecast-backend', choices=list(FORECAST_BACKENDS), default=DEFAULT_BACKEND, help="Modelo usado nas previsões de falha.")
+    args = parser.parse_args()
+    run_scheduler(args.interval, args.once, args.forecast_backend)
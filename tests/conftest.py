@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, event
+
+# Os módulos da aplicação ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utilities
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Banco SQLite temporário, já migrado, no lugar de `utilities.engine` (o diretório atual também vira o temporário)."""
+    monkeypatch.chdir(tmp_path)
+    db_engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", pool_size=20); event.listen(db_engine, "connect", utilities.set_sqlite_pragmas)
+    monkeypatch.setattr(utilities, "engine", db_engine)
+    utilities.migrate_database()
+    yield db_engine
+    db_engine.dispose()
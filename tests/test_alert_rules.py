@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utilities import ASSET_PROFILES, apply_alert_rules
+
+# Paridade de apply_alert_rules (vetorizado) com as regras aplicadas linha a linha, como no laço original:
+# os parâmetros do perfil são avaliados em ordem e o último que disparar define status e motivo.
+
+PARAMS = list(dict.fromkeys(param for profile in ASSET_PROFILES.values() for param in profile['params']))
+MULTI_PARAM_TYPE = next(asset_type for asset_type, profile in ASSET_PROFILES.items() if len(profile['params']) >= 2)
+
+
+def thresholds(rules):
+    return {'crit_high': rules['op_max'] * rules['crit_factor'], 'warn_high': rules['op_max'] * rules['warn_factor'],
+            'crit_low': rules['op_min'] / rules['crit_factor'], 'warn_low': rules['op_min'] / rules['warn_factor']}
+
+
+def classify_row(row):
+    status, reason = 'Normal', ''
+    for param, rules in ASSET_PROFILES.get(row['asset_type'], {'params': {}})['params'].items():
+        x, limits = row.get(param, np.nan), thresholds(rules)
+        if pd.isna(x): continue
+        if x > limits['crit_high']: status, reason = 'Crítico', f'{param.title()} Alta'
+        elif x < limits['crit_low']: status, reason = 'Crítico', f'{param.title()} Baixa'
+        elif x > limits['warn_high']: status, reason = 'Atenção', f'{param.title()} Alta'
+        elif x < limits['warn_low']: status, reason = 'Atenção', f'{param.title()} Baixa'
+    return status, reason
+
+
+def classify(rows):
+    df = pd.DataFrame(rows)
+    for param in PARAMS:
+        if param not in df.columns: df[param] = np.nan
+    return df, apply_alert_rules(df)
+
+
+def edge_values(rules):
+    """Valores exatamente nos limites, logo acima/abaixo deles, dentro da faixa e NaN."""
+    limits = thresholds(rules)
+    values = [np.nan, (rules['op_min'] + rules['op_max']) / 2]
+    for limit in limits.values(): values += [limit, np.nextafter(limit, np.inf), np.nextafter(limit, -np.inf)]
+    return values
+
+
+def test_matches_row_wise_rules_on_edge_cases():
+    rng = np.random.default_rng(0); rows = []
+    for asset_type, profile in list(ASSET_PROFILES.items()) + [('Tipo Desconhecido', next(iter(ASSET_PROFILES.values())))]:
+        candidates = {param: edge_values(rules) for param, rules in profile['params'].items()}
+        for _ in range(200):
+            rows.append({'asset_id': 'A1', 'asset_type': asset_type, **{param: rng.choice(values) for param, values in candidates.items()}})
+    df, result = classify(rows)
+    expected = pd.DataFrame([classify_row(row) for row in df.to_dict('records')], columns=['status', 'status_reason'])
+    assert result['status'].astype(str).tolist() == expected['status'].tolist()
+    assert result['status_reason'].astype(str).tolist() == expected['status_reason'].tolist()
+
+
+@pytest.mark.parametrize("limit, expected", [('crit_high', 'Atenção'), ('warn_high', 'Normal'), ('crit_low', 'Atenção'), ('warn_low', 'Normal')])
+def test_value_exactly_on_threshold(limit, expected):
+    # Parâmetro com limite inferior positivo, para que os limites baixos sejam alcançáveis
+    asset_type, param, rules = next((asset_type, param, rules) for asset_type, profile in ASSET_PROFILES.items() for param, rules in profile['params'].items() if rules['op_min'] > 0)
+    _, result = classify([{'asset_id': 'A1', 'asset_type': asset_type, param: thresholds(rules)[limit]}])
+    assert result['status'].astype(str).iloc[0] == expected
+
+
+def test_nan_sensors_are_normal():
+    _, result = classify([{'asset_id': 'A1', 'asset_type': MULTI_PARAM_TYPE}])
+    assert (result['status'].astype(str).iloc[0], result['status_reason'].astype(str).iloc[0]) == ('Normal', '')
+
+
+def test_unknown_asset_type_is_normal():
+    param, rules = next(iter(ASSET_PROFILES[MULTI_PARAM_TYPE]['params'].items()))
+    _, result = classify([{'asset_id': 'A1', 'asset_type': 'Tipo Desconhecido', param: thresholds(rules)['crit_high'] * 10},
+                          {'asset_id': 'A2', 'asset_type': None, param: thresholds(rules)['crit_high'] * 10}])
+    assert result['status'].astype(str).tolist() == ['Normal', 'Normal']
+    assert result['status_reason'].astype(str).tolist() == ['', '']
+
+
+def test_last_violated_parameter_defines_status_and_reason():
+    (first, first_rules), (second, second_rules) = list(ASSET_PROFILES[MULTI_PARAM_TYPE]['params'].items())[:2]
+    critical_first = thresholds(first_rules)['crit_high'] * 1.1
+    warning_second = (thresholds(second_rules)['warn_high'] + thresholds(second_rules)['crit_high']) / 2
+    _, result = classify([
+        {'asset_id': 'A1', 'asset_type': MULTI_PARAM_TYPE, first: critical_first, second: thresholds(second_rules)['crit_high'] * 1.1},
+        {'asset_id': 'A1', 'asset_type': MULTI_PARAM_TYPE, first: critical_first, second: warning_second},
+        {'asset_id': 'A1', 'asset_type': MULTI_PARAM_TYPE, first: critical_first},
+    ])
+    # Ordem do perfil, não severidade: o aviso do segundo parâmetro sobrepõe o crítico do primeiro
+    assert result['status'].astype(str).tolist() == ['Crítico', 'Atenção', 'Crítico']
+    assert result['status_reason'].astype(str).tolist() == [f'{second.title()} Alta', f'{second.title()} Alta', f'{first.title()} Alta']
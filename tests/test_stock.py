@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import text
+
+import utilities
+from utilities import InsufficientStockError, reserve_parts_for_os, stock_ledger_mismatches, write_parts
+
+INITIAL_STOCK = 50
+N_THREADS = 8
+
+
+def create_parts(part_ids, stock=INITIAL_STOCK):
+    write_parts([{'part_id': part_id, 'description': part_id, 'stock_quantity': stock, 'min_stock_level': 1, 'unit_cost': 1.0} for part_id in part_ids])
+
+
+def query(sql):
+    with utilities.engine.connect() as conn: return dict(conn.execute(text(sql)).fetchall())
+
+
+def test_concurrent_reservations_keep_stock_consistent(temp_db):
+    part_ids = ['P1', 'P2', 'P3']; create_parts(part_ids)
+    # Bem mais pedidos do que saldo: parte das reservas tem de ser recusada
+    requests = [{part_ids[i % 3]: 1 + i % 3, part_ids[(i + 1) % 3]: 1} for i in range(120)]
+    barrier = threading.Barrier(N_THREADS)
+    def reserve(indices):
+        barrier.wait(); accepted, refused = [], []
+        for i in indices:
+            try: reserve_parts_for_os(f"OS-{i}", requests[i]); accepted.append(i)
+            except InsufficientStockError as e:
+                assert set(e.shortages) <= set(requests[i]) and all(available < requests[i][part_id] for part_id, available in e.shortages.items())
+                refused.append(i)
+        return accepted, refused
+    with ThreadPoolExecutor(N_THREADS) as executor:
+        results = list(executor.map(reserve, [range(t, len(requests), N_THREADS) for t in range(N_THREADS)]))
+    accepted = [i for batch, _ in results for i in batch]; refused = [i for _, batch in results for i in batch]
+    assert accepted and refused and len(accepted) + len(refused) == len(requests)
+
+    stock = query("SELECT part_id, stock_quantity FROM parts")
+    used = query("SELECT part_id, SUM(quantity_used) FROM os_parts_usage GROUP BY part_id")
+    ledger = query("SELECT part_id, SUM(quantity) FROM stock_movements GROUP BY part_id")
+    assert min(stock.values()) >= 0
+    assert all(stock[part_id] == INITIAL_STOCK - used.get(part_id, 0) == ledger[part_id] for part_id in part_ids)
+    assert stock_ledger_mismatches().empty
+    # Só as reservas aceitas deixaram uso registrado (tudo ou nada por OS)
+    assert set(query("SELECT os_id, COUNT(*) FROM os_parts_usage GROUP BY os_id")) == {f"OS-{i}" for i in accepted}
+
+
+def test_refused_reservation_writes_nothing(temp_db):
+    create_parts(['P1']); create_parts(['P2'], stock=1)
+    with pytest.raises(ValueError) as excinfo: reserve_parts_for_os("OS-1", {'P1': 5, 'P2': 2})
+    assert isinstance(excinfo.value, InsufficientStockError) and excinfo.value.shortages == {'P2': 1}
+    assert query("SELECT part_id, stock_quantity FROM parts") == {'P1': INITIAL_STOCK, 'P2': 1}
+    assert query("SELECT os_id, COUNT(*) FROM os_parts_usage GROUP BY os_id") == {}
+    assert stock_ledger_mismatches().empty
@@ -3,17 +3,55 @@ import pandas as pd
 import numpy as np
 import os
 import json
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from sqlalchemy import create_engine, text
+from datetime import date, datetime
+from sqlalchemy import bindparam, create_engine, event, text
+from sqlalchemy.exc import OperationalError
 from passlib.context import CryptContext
 import uuid # <-- NOVA IMPORTAÇÃO
+import threading
+import time
+import copy
+import math
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from parquet_store import read_latest_timestamps, read_sensor_readings
 
 # --- CONFIGURAÇÃO E CONSTANTES ---
 DB_FILE = "maintenance.db"
 engine = create_engine(f"sqlite:///{DB_FILE}")
+# Pragmas aplicados em toda nova conexão: WAL permite leituras concorrentes com uma escrita em andamento
+SQLITE_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -64000, "mmap_size": 268435456, "temp_store": "MEMORY"}
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items(): cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+event.listen(engine, "connect", set_sqlite_pragmas)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 UPLOAD_DIR = "uploads"
+# Armazenamento do histórico de sensores: "sqlite" (tabela sensor_data) ou "parquet" (partições diárias, ver parquet_store.py)
+SENSOR_STORAGE = os.environ.get("SENSOR_STORAGE", "sqlite")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f" # Mesmo formato gravado pelo pandas/SQLAlchemy na coluna sensor_data.timestamp
+SCHEDULER_LEASE_NAME = "os_generation" # Lease de escritor único do agendador (scheduler.py)
+# Chave de cada tabela de cadastro; as escritas nessas tabelas são por linha (INSERT ... ON CONFLICT), nunca regravam a tabela
+ENTITY_KEYS = {'assets': 'asset_id', 'parts': 'part_id', 'users': 'username', 'roles': 'role_name'}
+# Colunas de leitura de sensor_data; metadados do ativo (tipo, local, coordenadas) ficam apenas em `assets`
+SENSOR_COLUMNS = ['temperatura', 'pressao', 'vibracao', 'corrente_eletrica', 'vazao_oleo']
+# Índices do caminho quente de sensor_data: histórico por ativo (ORDER BY timestamp) e filtros por janela de tempo
+SENSOR_DATA_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_sensor_asset_ts ON sensor_data (asset_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_sensor_ts ON sensor_data (timestamp)",
+]
+# Índices da consulta paginada de OS (query_service_orders): filtros por status/técnico/ativo ordenados pela chave (creation_date, os_id)
+SERVICE_ORDER_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_os_created ON service_orders (creation_date, os_id)",
+    "CREATE INDEX IF NOT EXISTS idx_os_status_created ON service_orders (status, creation_date, os_id)",
+    "CREATE INDEX IF NOT EXISTS idx_os_assigned_created ON service_orders (assigned_to, status, creation_date, os_id)",
+    "CREATE INDEX IF NOT EXISTS idx_os_asset_created ON service_orders (asset_id, creation_date, os_id)",
+]
+OS_PAGE_SIZE = 50 # Linhas por página nas listas de OS
+# Livro de estoque (stock_movements): entradas positivas, baixas negativas; parts.stock_quantity é o saldo materializado
+STOCK_MOVEMENT_KINDS = ('saldo_inicial', 'consumo', 'ajuste')
+CONSUMPTION_WINDOW_DAYS = 90 # Janela do consumo médio diário usado na previsão de ruptura
+REORDER_LEAD_DAYS = 14 # Peças com ruptura prevista dentro deste prazo entram na lista de reposição
 
 AVAILABLE_PAGES = {
     "Tela Inicial": "1_Inicial_Screen",
@@ -54,70 +92,305 @@ ASSET_PROFILES = {
     "Sistema de Visão Computacional": perfil_eletronico, "Chiller Industrial": perfil_processo_termico, "Silo de Armazenamento": perfil_processo_hidraulico
 }
 
-# --- FUNÇÃO DE INICIALIZAÇÃO DO BANCO DE DADOS (CORRIGIDA) ---
-def initialize_database(clear_all=False):
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    with engine.connect() as conn:
-        # --- CORREÇÃO DE ORDEM ---
-        # 1. Garante que TODAS as tabelas existam
-        conn.execute(text("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL, role TEXT NOT NULL, name TEXT NOT NULL)"))
-        conn.execute(text("CREATE TABLE IF NOT EXISTS roles (role_name TEXT PRIMARY KEY, pages TEXT NOT NULL)"))
-        conn.execute(text("CREATE TABLE IF NOT EXISTS assets (asset_id TEXT PRIMARY KEY, asset_type TEXT, location TEXT, description TEXT, install_date DATE)"))
-        conn.execute(text("CREATE TABLE IF NOT EXISTS parts (part_id TEXT PRIMARY KEY, description TEXT, stock_quantity INTEGER, min_stock_level INTEGER DEFAULT 5, unit_cost REAL)"))
-        conn.execute(text("CREATE TABLE IF NOT EXISTS service_orders (os_id TEXT PRIMARY KEY, asset_id TEXT, asset_type TEXT, creation_date DATETIME, reason TEXT, priority TEXT, status TEXT, class TEXT, recorrencia TEXT, assigned_to TEXT, notes TEXT, estimated_cost REAL, actual_cost REAL, files_attached TEXT, root_cause TEXT, completion_date DATETIME )"))
-        conn.execute(text("CREATE TABLE IF NOT EXISTS os_parts_usage (usage_id INTEGER PRIMARY KEY AUTOINCREMENT, os_id TEXT, part_id TEXT, quantity_used INTEGER, FOREIGN KEY (os_id) REFERENCES service_orders(os_id), FOREIGN KEY (part_id) REFERENCES parts(part_id))"))
-        conn.execute(text("CREATE TABLE IF NOT EXISTS resolved_alerts (asset_id TEXT, reason TEXT, PRIMARY KEY (asset_id, reason))"))
-        conn.execute(text("CREATE TABLE IF NOT EXISTS sensor_data (timestamp DATETIME, asset_id TEXT, asset_type TEXT, location TEXT, latitude REAL, longitude REAL, temperatura REAL, pressao REAL, vibracao REAL, corrente_eletrica REAL, vazao_oleo REAL)"))
+def table_columns(conn, table_name):
+    return [row[1] for row in conn.execute(text(f"PRAGMA table_info({table_name})"))]
+def normalize_sensor_data(conn):
+    """Migra sensor_data do formato antigo (tipo, local e coordenadas repetidos em cada leitura) para o formato
+    estreito (timestamp, asset_id, leituras), levando os metadados para `assets`."""
+    print("Migrando sensor_data para o formato normalizado...")
+    conn.execute(text("INSERT INTO assets (asset_id, asset_type, location) SELECT asset_id, MAX(asset_type), MAX(location) FROM sensor_data WHERE asset_id NOT IN (SELECT asset_id FROM assets) GROUP BY asset_id"))
+    conn.execute(text("""
+        UPDATE assets SET
+            latitude = (SELECT s.latitude FROM sensor_data s WHERE s.asset_id = assets.asset_id AND s.latitude IS NOT NULL LIMIT 1),
+            longitude = (SELECT s.longitude FROM sensor_data s WHERE s.asset_id = assets.asset_id AND s.longitude IS NOT NULL LIMIT 1)
+        WHERE latitude IS NULL OR longitude IS NULL
+    """))
+    conn.execute(text(f"CREATE TABLE sensor_data_normalized (timestamp DATETIME, asset_id TEXT, {', '.join(c + ' REAL' for c in SENSOR_COLUMNS)})"))
+    existing = table_columns(conn, 'sensor_data') # Parâmetros que nunca foram gravados viram NULL
+    conn.execute(text(f"INSERT INTO sensor_data_normalized SELECT timestamp, asset_id, {', '.join(c if c in existing else 'NULL' for c in SENSOR_COLUMNS)} FROM sensor_data"))
+    conn.execute(text("DROP TABLE sensor_data"))
+    conn.execute(text("ALTER TABLE sensor_data_normalized RENAME TO sensor_data"))
 
-        # 2. Se `clear_all` for verdadeiro, AGORA podemos limpar as tabelas com segurança
-        if clear_all:
-            print("Limpando tabelas de dados operacionais...")
-            conn.execute(text("DELETE FROM assets"))
-            conn.execute(text("DELETE FROM sensor_data"))
-            conn.execute(text("DELETE FROM service_orders"))
-            conn.execute(text("DELETE FROM resolved_alerts"))
-            conn.execute(text("DELETE FROM os_parts_usage"))
-        
-        # 3. Cria índices
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_os_asset_id ON service_orders (asset_id)"))
-        
-        # 4. Insere dados padrão (apenas na primeira execução de todas)
-        if conn.execute(text("SELECT COUNT(*) FROM users")).scalar() == 0:
-            pd.DataFrame([{"username": "admin", "password": hash_password("123"), "role": "admin", "name": "Administrador"},{"username": "user", "password": hash_password("123"), "role": "viewer", "name": "Operador"}]).to_sql("users", conn, if_exists='append', index=False)
-        if conn.execute(text("SELECT COUNT(*) FROM roles")).scalar() == 0:
-            pd.DataFrame([
-                {"role_name": "admin", "pages": json.dumps(list(AVAILABLE_PAGES.values()))},
-                {"role_name": "viewer", "pages": json.dumps(["1_Inicial_Screen", "2_Plant_Map", "3_Equipment_Monitoring", "6_Equipment_History", "8_KPIs_Manutencao", "11_previsao_de_falhas"])}
-            ]).to_sql("roles", conn, if_exists='append', index=False)
-        
-        conn.commit()
+# --- MIGRAÇÕES VERSIONADAS DO ESQUEMA ---
+# Cada passo roda uma única vez por banco, em ordem, e fica registrado em `schema_version`. Os passos são
+# idempotentes, para que bancos criados antes do controle de versão (versão 0) possam passar por todos eles.
+def migration_base_schema(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL, role TEXT NOT NULL, name TEXT NOT NULL)"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS roles (role_name TEXT PRIMARY KEY, pages TEXT NOT NULL)"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS assets (asset_id TEXT PRIMARY KEY, asset_type TEXT, location TEXT, description TEXT, install_date DATE, latitude REAL, longitude REAL)"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS parts (part_id TEXT PRIMARY KEY, description TEXT, stock_quantity INTEGER, min_stock_level INTEGER DEFAULT 5, unit_cost REAL)"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS service_orders (os_id TEXT PRIMARY KEY, asset_id TEXT, asset_type TEXT, creation_date DATETIME, reason TEXT, priority TEXT, status TEXT, class TEXT, recorrencia TEXT, assigned_to TEXT, notes TEXT, estimated_cost REAL, actual_cost REAL, files_attached TEXT, root_cause TEXT, completion_date DATETIME )"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS os_parts_usage (usage_id INTEGER PRIMARY KEY AUTOINCREMENT, os_id TEXT, part_id TEXT, quantity_used INTEGER, FOREIGN KEY (os_id) REFERENCES service_orders(os_id), FOREIGN KEY (part_id) REFERENCES parts(part_id))"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS resolved_alerts (asset_id TEXT, reason TEXT, PRIMARY KEY (asset_id, reason))"))
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS sensor_data (timestamp DATETIME, asset_id TEXT, {', '.join(c + ' REAL' for c in SENSOR_COLUMNS)})"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_os_asset_id ON service_orders (asset_id)"))
+    # Dados padrão (apenas em um banco novo)
+    if conn.execute(text("SELECT COUNT(*) FROM users")).scalar() == 0:
+        pd.DataFrame([{"username": "admin", "password": hash_password("123"), "role": "admin", "name": "Administrador"},{"username": "user", "password": hash_password("123"), "role": "viewer", "name": "Operador"}]).to_sql("users", conn, if_exists='append', index=False)
+    if conn.execute(text("SELECT COUNT(*) FROM roles")).scalar() == 0:
+        pd.DataFrame([
+            {"role_name": "admin", "pages": json.dumps(list(AVAILABLE_PAGES.values()))},
+            {"role_name": "viewer", "pages": json.dumps(["1_Inicial_Screen", "2_Plant_Map", "3_Equipment_Monitoring", "6_Equipment_History", "8_KPIs_Manutencao", "11_Failure_Prediction"])}
+        ]).to_sql("roles", conn, if_exists='append', index=False)
+def migration_normalize_sensor_data(conn):
+    asset_columns = table_columns(conn, 'assets')
+    for column in ('latitude', 'longitude'):
+        if column not in asset_columns: conn.execute(text(f"ALTER TABLE assets ADD COLUMN {column} REAL"))
+    if 'asset_type' in table_columns(conn, 'sensor_data'): normalize_sensor_data(conn)
+def migration_sensor_watermarks(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS sensor_watermarks (asset_id TEXT PRIMARY KEY, last_timestamp DATETIME)"))
+def migration_sensor_indexes(conn):
+    for ddl in SENSOR_DATA_INDEXES: conn.execute(text(ddl))
+def migration_forecasts(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS forecasts (asset_id TEXT, sensor TEXT, last_timestamp DATETIME, threshold REAL, hours_to_failure INTEGER, step_seconds REAL, forecast TEXT, backend TEXT, model TEXT, updated_at DATETIME, PRIMARY KEY (asset_id, sensor))"))
+    forecast_columns = table_columns(conn, 'forecasts')
+    for column in ('backend', 'model'):
+        if column not in forecast_columns: conn.execute(text(f"ALTER TABLE forecasts ADD COLUMN {column} TEXT"))
+def migration_scheduler_leases(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS scheduler_leases (name TEXT PRIMARY KEY, owner TEXT, expires_at DATETIME, last_run DATETIME)"))
+def migration_sensor_rollups(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS sensor_rollups (resolution TEXT, bucket DATETIME, asset_id TEXT, sensor TEXT, min_value REAL, max_value REAL, sum_value REAL, count INTEGER, worst_status INTEGER, worst_reason TEXT, PRIMARY KEY (resolution, asset_id, sensor, bucket))"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS rollup_watermarks (asset_id TEXT PRIMARY KEY, last_timestamp DATETIME)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_rollups_bucket ON sensor_rollups (resolution, bucket)"))
+def migration_entity_keys(conn):
+    # Tabelas regravadas pelo antigo to_sql('replace') perderam a chave primária: restaura a unicidade da chave. Fica a
+    # linha mais recente de cada chave; as demais são copiadas para `<tabela>_duplicates` antes de sair da tabela
+    for table, key in ENTITY_KEYS.items():
+        duplicates = f"{table} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {table} GROUP BY {key})"
+        if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {duplicates})")).scalar():
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_duplicates AS SELECT * FROM {table} WHERE 0"))
+            conn.execute(text(f"INSERT INTO {table}_duplicates SELECT * FROM {duplicates}"))
+            conn.execute(text(f"DELETE FROM {duplicates}"))
+        conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_{key} ON {table} ({key})"))
+def migration_fix_prediction_page_id(conn):
+    # O perfil padrão 'viewer' era criado com um ID de página inexistente para a Previsão de Falhas
+    conn.execute(text("UPDATE roles SET pages = REPLACE(pages, '\"11_previsao_de_falhas\"', '\"11_Failure_Prediction\"')"))
+def migration_service_order_indexes(conn):
+    for ddl in SERVICE_ORDER_INDEXES: conn.execute(text(ddl))
+def migration_parts_usage_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_parts_usage_os ON os_parts_usage (os_id)"))
+def migration_stock_movements(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS stock_movements (movement_id INTEGER PRIMARY KEY AUTOINCREMENT, part_id TEXT NOT NULL, quantity INTEGER NOT NULL, kind TEXT NOT NULL, os_id TEXT, created_at DATETIME NOT NULL)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_stock_movements_part ON stock_movements (part_id, created_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_stock_movements_kind ON stock_movements (kind, created_at, part_id)"))
+    # Histórico existente: cada uso de peça vira uma baixa na data da OS, e o saldo inicial fecha com o saldo atual
+    conn.execute(text("""INSERT INTO stock_movements (part_id, quantity, kind, os_id, created_at)
+        SELECT u.part_id, -u.quantity_used, 'consumo', u.os_id, COALESCE(o.completion_date, o.creation_date, :now)
+        FROM os_parts_usage AS u LEFT JOIN service_orders AS o ON o.os_id = u.os_id JOIN parts AS p ON p.part_id = u.part_id ORDER BY u.usage_id"""), {"now": datetime.now().strftime(TIMESTAMP_FORMAT)})
+    conn.execute(text("""INSERT INTO stock_movements (part_id, quantity, kind, created_at)
+        SELECT p.part_id, COALESCE(p.stock_quantity, 0) - COALESCE(SUM(m.quantity), 0), 'saldo_inicial', COALESCE(MIN(m.created_at), :now)
+        FROM parts AS p LEFT JOIN stock_movements AS m ON m.part_id = p.part_id GROUP BY p.part_id"""), {"now": datetime.now().strftime(TIMESTAMP_FORMAT)})
+def migration_kpi_aggregates(conn):
+    # Agregados diários do motor de KPIs (kpi_engine.py) e a assinatura das OS concluídas da última atualização
+    kpi_measures = "orders INTEGER, repair_hours REAL, uptime_hours REAL, uptime_count INTEGER, cost REAL"
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS kpi_asset_daily (day TEXT, asset_id TEXT, asset_type TEXT, os_class TEXT, root_cause TEXT, {kpi_measures}, PRIMARY KEY (day, asset_id, os_class, root_cause))"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_kpi_asset_daily_asset ON kpi_asset_daily (asset_id)"))
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS kpi_daily (day TEXT, asset_type TEXT, os_class TEXT, root_cause TEXT, {kpi_measures}, PRIMARY KEY (day, asset_type, os_class, root_cause))"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS kpi_state (id INTEGER PRIMARY KEY CHECK (id = 1), completed_orders INTEGER, last_completion DATETIME, refreshed_at DATETIME)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_os_status_completed ON service_orders (status, completion_date, asset_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_os_created_class ON service_orders (creation_date, class)"))
+def migration_alert_events(conn):
+    # Transições de status por ativo (ended_at NULL = alerta em andamento; no máximo um em andamento por ativo)
+    conn.execute(text("CREATE TABLE IF NOT EXISTS alert_events (event_id INTEGER PRIMARY KEY AUTOINCREMENT, asset_id TEXT NOT NULL, status TEXT NOT NULL, reason TEXT, started_at DATETIME NOT NULL, ended_at DATETIME, last_reading_at DATETIME NOT NULL, readings INTEGER NOT NULL)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_alert_events_asset ON alert_events (asset_id, started_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_alert_events_last_reading ON alert_events (last_reading_at)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_alert_events_open ON alert_events (asset_id) WHERE ended_at IS NULL"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS alert_watermarks (asset_id TEXT PRIMARY KEY, last_timestamp DATETIME)"))
+def migration_drop_sensor_watermarks(conn):
+    conn.execute(text("DROP TABLE IF EXISTS sensor_watermarks"))
+def migration_kpi_dirty_assets(conn):
+    # Ativos cujas OS concluídas mudaram desde a última atualização dos KPIs, marcados pelo próprio banco em qualquer
+    # caminho de escrita (páginas, gerador, edições de custo/causa/datas em OS já concluídas)
+    conn.execute(text("CREATE TABLE IF NOT EXISTS kpi_dirty_assets (asset_id TEXT PRIMARY KEY)"))
+    kpi_columns = ['status', 'asset_id', 'asset_type', 'class', 'root_cause', 'creation_date', 'completion_date', 'actual_cost']
+    conn.execute(text("CREATE TRIGGER IF NOT EXISTS trg_kpi_os_insert AFTER INSERT ON service_orders WHEN NEW.status = 'Concluída' "
+                      "BEGIN INSERT OR IGNORE INTO kpi_dirty_assets (asset_id) VALUES (NEW.asset_id); END"))
+    conn.execute(text("CREATE TRIGGER IF NOT EXISTS trg_kpi_os_delete AFTER DELETE ON service_orders WHEN OLD.status = 'Concluída' "
+                      "BEGIN INSERT OR IGNORE INTO kpi_dirty_assets (asset_id) VALUES (OLD.asset_id); END"))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS trg_kpi_os_update AFTER UPDATE OF {', '.join(kpi_columns)} ON service_orders "
+                      f"WHEN (OLD.status = 'Concluída' OR NEW.status = 'Concluída') AND ({' OR '.join(f'OLD.{c} IS NOT NEW.{c}' for c in kpi_columns)}) "
+                      "BEGIN INSERT OR IGNORE INTO kpi_dirty_assets (asset_id) VALUES (OLD.asset_id), (NEW.asset_id); END"))
+    conn.execute(text("DELETE FROM kpi_state")) # Edições anteriores aos gatilhos não foram marcadas: a próxima atualização reconstrói tudo
+MIGRATIONS = [
+    (1, "Esquema inicial e dados padrão", migration_base_schema),
+    (2, "sensor_data normalizado; coordenadas em assets", migration_normalize_sensor_data),
+    (3, "Marcas d'água da análise incremental", migration_sensor_watermarks),
+    (4, "Índices de sensor_data", migration_sensor_indexes),
+    (5, "Cache de previsões (forecasts)", migration_forecasts),
+    (6, "Lease do agendador de OS", migration_scheduler_leases),
+    (7, "Rollups de sensores", migration_sensor_rollups),
+    (8, "Chaves únicas das tabelas de cadastro", migration_entity_keys),
+    (9, "Correção do ID da página de previsão no perfil viewer", migration_fix_prediction_page_id),
+    (10, "Índices da consulta paginada de OS", migration_service_order_indexes),
+    (11, "Índice de os_parts_usage por OS", migration_parts_usage_index),
+    (12, "Livro de movimentações de estoque", migration_stock_movements),
+    (13, "Agregados diários de KPIs de manutenção", migration_kpi_aggregates),
+    (14, "Eventos de alerta (transições de status)", migration_alert_events),
+    (15, "Remove as marcas d'água da análise incremental (substituída por rollups e eventos)", migration_drop_sensor_watermarks),
+    (16, "Ativos com KPIs a recalcular (gatilhos em service_orders)", migration_kpi_dirty_assets),
+]
+def schema_version(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at DATETIME)"))
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+def migrate_database(verbose=False):
+    """Aplica as migrações pendentes em uma única transação (BEGIN IMMEDIATE serializa processos concorrentes).
+    Retorna a lista de versões aplicadas."""
+    applied = []
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            current = schema_version(conn)
+            for version, description, migration in MIGRATIONS:
+                if version <= current: continue
+                if verbose: print(f"Aplicando migração {version}: {description}")
+                migration(conn)
+                conn.execute(text("INSERT INTO schema_version (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+                             {"version": version, "description": description, "applied_at": datetime.now().strftime(TIMESTAMP_FORMAT)})
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback(); raise
+    return applied
+@st.cache_resource
+def ensure_database():
+    """Prepara o banco uma vez por processo (diretório de uploads + migrações pendentes). Os loaders assumem o esquema pronto."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True); migrate_database(); return True
+def initialize_database(clear_all=False):
+    """Migra o esquema e, com `clear_all`, limpa as tabelas de dados operacionais (usado pelo gerador de dados)."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True); migrate_database()
+    if not clear_all: return
+    print("Limpando tabelas de dados operacionais...")
+    with engine.begin() as conn:
+        for table in ('assets', 'sensor_data', 'sensor_rollups', 'rollup_watermarks', 'forecasts', 'service_orders', 'resolved_alerts', 'os_parts_usage', 'stock_movements', 'kpi_asset_daily', 'kpi_daily', 'kpi_state', 'kpi_dirty_assets', 'alert_events', 'alert_watermarks'):
+            conn.execute(text(f"DELETE FROM {table}"))
 
 # (O resto do arquivo é idêntico à versão estável anterior, completo abaixo)
 DARK_THEME_CSS = """<style>...</style>""" # O CSS é mantido
 def apply_theme(): st.markdown(DARK_THEME_CSS, unsafe_allow_html=True)
 def hash_password(password: str) -> str: return pwd_context.hash(password)
 def verify_password(plain_password: str, hashed_password: str) -> bool: return pwd_context.verify(plain_password, hashed_password)
+# --- CACHE DE USUÁRIOS E PERFIS (RBAC) ---
+DIRECTORY_TTL_SECONDS = 60 # Prazo para enxergar alterações feitas por outros processos
+class DirectoryCache:
+    """Cópia em memória, compartilhada pelo processo, de uma tabela pequena lida a cada interação (usuários, perfis).
+    Escritas neste processo incrementam `version` e invalidam na hora; o TTL cobre as feitas por outros processos."""
+    def __init__(self, loader, ttl_seconds=DIRECTORY_TTL_SECONDS):
+        self._loader = loader; self._ttl = ttl_seconds; self._lock = threading.Lock()
+        self._data = None; self._loaded_version = -1; self._loaded_at = 0.0; self.version = 0
+    def _is_fresh(self):
+        return self._data is not None and self._loaded_version == self.version and time.monotonic() - self._loaded_at < self._ttl
+    def get(self):
+        """Dados em cache (somente leitura); recarrega se a versão mudou ou o TTL expirou."""
+        if self._is_fresh(): return self._data
+        with self._lock:
+            if not self._is_fresh():
+                version = self.version # Uma invalidação durante a leitura força nova recarga na próxima chamada
+                self._data = self._loader(); self._loaded_version = version; self._loaded_at = time.monotonic()
+            return self._data
+    def invalidate(self):
+        with self._lock: self.version += 1
+def read_users():
+    df = pd.read_sql("SELECT * FROM users", engine); return df.set_index('username').to_dict('index')
+def read_roles():
+    df = pd.read_sql("SELECT role_name, pages FROM roles", engine)
+    return {role_name: {'pages': json.loads(pages)} for role_name, pages in zip(df['role_name'], df['pages'])}
+USER_DIRECTORY = DirectoryCache(read_users)
+ROLE_DIRECTORY = DirectoryCache(read_roles)
 def load_users():
-    initialize_database(); df = pd.read_sql("SELECT * FROM users", engine); return df.set_index('username').to_dict('index')
+    return copy.deepcopy(USER_DIRECTORY.get())
+def ensure_password_hash(password):
+    return password if not password or password.startswith('$2b$') else hash_password(password)
 def save_users(users_data):
-    for user, data in users_data.items():
-        if data.get('password') and not data['password'].startswith('$2b$'): users_data[user]['password'] = hash_password(data['password'])
-    df = pd.DataFrame.from_dict(users_data, orient='index').reset_index().rename(columns={'index': 'username'}); df.to_sql("users", engine, if_exists='replace', index=False)
+    """Insere/atualiza os usuários informados (upsert em lote); usuários fora do dicionário não são tocados."""
+    upsert_rows("users", [{**data, 'username': user, 'password': ensure_password_hash(data.get('password'))} for user, data in users_data.items()])
+def insert_user(username, name, password, role):
+    """Cadastra um usuário; retorna False se o login já existir."""
+    return insert_row("users", {'username': username, 'name': name, 'password': ensure_password_hash(password), 'role': role})
+def update_user(username, **fields):
+    if 'password' in fields: fields['password'] = ensure_password_hash(fields['password'])
+    return update_row("users", username, **fields)
 def load_roles():
-    initialize_database(); df = pd.read_sql("SELECT * FROM roles", engine)
-    return {row['role_name']: {'pages': json.loads(row['pages'])} for _, row in df.iterrows()}
+    return copy.deepcopy(ROLE_DIRECTORY.get())
 def save_roles(roles_data):
-    df = pd.DataFrame([{'role_name': r, 'pages': json.dumps(p.get('pages',[]))} for r,p in roles_data.items()]); df.to_sql("roles", engine, if_exists='replace', index=False)
+    """Insere/atualiza os perfis informados (upsert em lote); perfis fora do dicionário não são tocados."""
+    upsert_rows("roles", [{'role_name': r, 'pages': json.dumps(p.get('pages', []))} for r, p in roles_data.items()])
+def insert_role(role_name, pages=()):
+    """Cria um perfil; retorna False se ele já existir."""
+    return insert_row("roles", {'role_name': role_name, 'pages': json.dumps(list(pages))})
+# --- LOGIN: VERIFICAÇÃO BCRYPT EM POOL LIMITADO E LIMITE DE TENTATIVAS ---
+LOGIN_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1)) # O bcrypt libera o GIL: as threads rodam em paralelo sem travar os reruns
+LOGIN_MAX_PENDING = 32 # Logins em execução + na fila; acima disso o login é recusado na hora em vez de enfileirar
+LOGIN_TIMEOUT_SECONDS = 15
+LOGIN_FAILURE_WINDOW_SECONDS = 300
+LOGIN_MAX_FAILURES_PER_USER = 5
+LOGIN_MAX_FAILURES_PER_IP = 20
+LOGIN_REHASH_ON_UPDATE = True # Regrava o hash no login quando os parâmetros do pwd_context mudam (ex.: mais rounds)
+login_executor = ThreadPoolExecutor(max_workers=LOGIN_WORKERS, thread_name_prefix="login")
+login_slots = threading.BoundedSemaphore(LOGIN_MAX_PENDING)
+class LoginThrottle:
+    """Falhas recentes por chave (usuário ou IP) numa janela deslizante, compartilhadas pelo processo."""
+    def __init__(self, max_failures, window_seconds=LOGIN_FAILURE_WINDOW_SECONDS):
+        self._max = max_failures; self._window = window_seconds; self._failures = {}; self._lock = threading.Lock()
+    def _recent(self, key, now):
+        attempts = [t for t in self._failures.get(key, ()) if now - t < self._window]
+        if attempts: self._failures[key] = attempts
+        else: self._failures.pop(key, None)
+        return attempts
+    def retry_after(self, key):
+        """Segundos até a chave voltar a poder tentar (0 se não está bloqueada)."""
+        with self._lock:
+            now = time.monotonic(); attempts = self._recent(key, now)
+            return self._window - (now - attempts[-self._max]) if len(attempts) >= self._max else 0
+    def record_failure(self, key):
+        with self._lock:
+            now = time.monotonic(); self._recent(key, now); self._failures.setdefault(key, []).append(now)
+            if len(self._failures) > 10000: # Descarta chaves expiradas para a memória não crescer com IPs/usuários aleatórios
+                for stale in [k for k, v in self._failures.items() if now - v[-1] >= self._window]: del self._failures[stale]
+    def reset(self, key):
+        with self._lock: self._failures.pop(key, None)
+USER_LOGIN_THROTTLE = LoginThrottle(LOGIN_MAX_FAILURES_PER_USER)
+IP_LOGIN_THROTTLE = LoginThrottle(LOGIN_MAX_FAILURES_PER_IP)
+def fetch_user(username):
+    """Busca um único usuário pela chave (sem carregar a tabela inteira); None se não existir."""
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT username, name, password, role FROM users WHERE username = :username"), {"username": username}).mappings().first()
+    return dict(row) if row else None
+def check_credentials(username, password):
+    """Roda no pool de login: verifica a senha do usuário e, se o hash estiver desatualizado, regrava-o.
+    Usuários inexistentes também pagam um bcrypt, para o tempo de resposta não revelar quais logins existem."""
+    user = fetch_user(username)
+    if user is None or not user['password']: pwd_context.dummy_verify(); return None
+    try: valid, new_hash = pwd_context.verify_and_update(password, user['password'])
+    except ValueError: return None # Hash em formato desconhecido
+    if not valid: return None
+    if new_hash and LOGIN_REHASH_ON_UPDATE: update_row("users", username, password=new_hash) # Já é um hash: não passa por ensure_password_hash
+    return user
+def client_ip_address():
+    try: return st.context.ip_address
+    except Exception: return None # Fora de uma sessão do Streamlit (ou versão sem st.context.ip_address)
 def validate_login(username, password):
-    USERS = load_users(); user_data = USERS.get(username.lower())
-    if user_data and verify_password(password, user_data['password']):
-        st.session_state.update({'authenticated': True, 'username': username.lower(), 'role': user_data['role'], 'name': user_data['name']})
-    else: st.error("Usuário ou senha incorretos.")
+    username = username.lower(); ip_address = client_ip_address()
+    throttles = [(USER_LOGIN_THROTTLE, username)] + ([(IP_LOGIN_THROTTLE, ip_address)] if ip_address else [])
+    wait = max(throttle.retry_after(key) for throttle, key in throttles)
+    if wait: st.error(f"Muitas tentativas de login sem sucesso. Tente novamente em {math.ceil(wait / 60)} minuto(s)."); return
+    if not login_slots.acquire(blocking=False): st.error("Muitos logins simultâneos no momento. Tente novamente em instantes."); return
+    try: future = login_executor.submit(check_credentials, username, password)
+    except Exception: login_slots.release(); raise
+    future.add_done_callback(lambda _: login_slots.release()) # A vaga só é liberada quando o bcrypt termina, mesmo após timeout
+    try: user_data = future.result(timeout=LOGIN_TIMEOUT_SECONDS)
+    except FutureTimeoutError: st.error("O login demorou mais que o esperado. Tente novamente."); return
+    if user_data:
+        USER_LOGIN_THROTTLE.reset(username) # O contador do IP só expira com o tempo: um login válido não libera tentativas em outras contas
+        st.session_state.update({'authenticated': True, 'username': username, 'role': user_data['role'], 'name': user_data['name']})
+    else:
+        for throttle, key in throttles: throttle.record_failure(key)
+        st.error("Usuário ou senha incorretos.")
 def check_authentication():
+    ensure_database()
     if not st.session_state.get('authenticated', False): st.switch_page("App.py")
 def has_page_access(page_filename):
     if 'role' not in st.session_state or st.session_state['role'] is None: st.switch_page("App.py")
-    ROLES = load_roles(); user_role = st.session_state['role']
+    ROLES = ROLE_DIRECTORY.get(); user_role = st.session_state['role'] # Consulta ao cache, sem acesso ao banco
     if user_role not in ROLES: st.error("Perfil não encontrado."); st.stop()
     allowed_pages = ROLES[user_role].get('pages', []);
     if page_filename not in allowed_pages: st.error("🚫 Acesso negado."); st.stop()
@@ -153,91 +426,631 @@ def add_attachment_to_os(os_id, filename):
             current_files.append(filename); new_files_json = json.dumps(current_files)
             stmt = text("UPDATE service_orders SET files_attached = :files WHERE os_id = :os_id")
             conn.execute(stmt, {"files": new_files_json, "os_id": os_id}); conn.commit()
-@st.cache_data
+# --- LEITURA DOS SENSORES ---
+def read_sensor_rows(since=None, con=None, until=None, asset_ids=None):
+    """Leituras em (since, until] (sem limite se None), opcionalmente de alguns ativos, com o tipo do ativo
+    (vindo de `assets`) para as regras de alerta. Sem `con`, usa o `engine` do módulo no momento da chamada."""
+    con = engine if con is None else con
+    if SENSOR_STORAGE == "parquet": df = read_sensor_readings(since=since, until=until, asset_ids=asset_ids)
+    else:
+        conditions, params = [], {}
+        if since is not None: conditions.append("timestamp > :since"); params["since"] = since.strftime(TIMESTAMP_FORMAT)
+        if until is not None: conditions.append("timestamp <= :until"); params["until"] = until.strftime(TIMESTAMP_FORMAT)
+        if asset_ids is not None: conditions.append("asset_id IN :asset_ids"); params["asset_ids"] = list(asset_ids)
+        query = text("SELECT * FROM sensor_data" + (f" WHERE {' AND '.join(conditions)}" if conditions else ""))
+        if asset_ids is not None: query = query.bindparams(bindparam('asset_ids', expanding=True))
+        df = pd.read_sql(query, con, params=params, parse_dates=['timestamp'])
+    return attach_asset_types(df.drop(columns=['asset_type', 'location', 'latitude', 'longitude'], errors='ignore'), con) # Arquivos no formato antigo
+def attach_asset_types(df, con=None):
+    """As regras de alerta dependem do tipo do ativo, que vem de `assets` (categórico: um código por leitura)."""
+    con = engine if con is None else con
+    asset_types = pd.read_sql("SELECT asset_id, asset_type FROM assets", con).set_index('asset_id')['asset_type']
+    df.insert(2, 'asset_type', pd.Categorical(df['asset_id'].map(asset_types), categories=list(dict.fromkeys(list(ASSET_PROFILES) + asset_types.dropna().unique().tolist()))))
+    return df
+def filter_new_rows(df, watermarks):
+    """Mantém apenas as leituras posteriores à marca d'água do respectivo ativo."""
+    if df.empty or not watermarks: return df
+    asset_marks = df['asset_id'].map(watermarks)
+    return df[asset_marks.isna() | (df['timestamp'] > asset_marks)]
+def read_sensor_rows_after(watermarks, con=None):
+    """Leituras posteriores à marca d'água de cada ativo (`watermarks`: asset_id -> timestamp), com o tipo do ativo.
+    Cada ativo é lido a partir da própria marca pelo índice (asset_id, timestamp), então um ativo parado não obriga a
+    reler o histórico dos demais; ativos sem marca (novos) são lidos desde o início."""
+    con = engine if con is None else con
+    if not watermarks: return read_sensor_rows(con=con)
+    if SENSOR_STORAGE == "parquet":
+        # Ativos cadastrados sem marca são lidos por completo; os demais em grupos pelo dia da marca (poda de partições)
+        new_assets = pd.read_sql("SELECT asset_id FROM assets", con)['asset_id']; new_assets = new_assets[~new_assets.isin(list(watermarks))]
+        marks = pd.Series(watermarks)
+        frames = [read_sensor_readings(asset_ids=new_assets)] if not new_assets.empty else []
+        frames += [read_sensor_readings(since=group.min(), asset_ids=group.index) for _, group in marks.groupby(marks.dt.normalize())]
+        df = filter_new_rows(pd.concat(frames, ignore_index=True), watermarks)
+    else:
+        # Ativos distintos por saltos no índice (um MIN por ativo, sem varrer a tabela), cada um com a sua marca
+        query = text("""
+            WITH RECURSIVE ids(asset_id) AS (
+                SELECT MIN(asset_id) FROM sensor_data
+                UNION ALL SELECT (SELECT MIN(asset_id) FROM sensor_data WHERE asset_id > ids.asset_id) FROM ids WHERE ids.asset_id IS NOT NULL
+            ), marks AS (
+                SELECT ids.asset_id, COALESCE(w.value, '') AS last_timestamp FROM ids LEFT JOIN json_each(:marks) AS w ON w.key = ids.asset_id WHERE ids.asset_id IS NOT NULL
+            )
+            SELECT s.* FROM marks AS m CROSS JOIN sensor_data AS s ON s.asset_id = m.asset_id AND s.timestamp > m.last_timestamp
+        """)
+        df = pd.read_sql(query, con, params={"marks": json.dumps({a: ts.strftime(TIMESTAMP_FORMAT) for a, ts in watermarks.items()})}, parse_dates=['timestamp'])
+    return attach_asset_types(df.drop(columns=['asset_type', 'location', 'latitude', 'longitude'], errors='ignore'), con)
 def load_and_analyze_sensor_data():
+    """Histórico inteiro classificado pelas regras de alerta. As páginas e o agendador leem os rollups e os eventos de
+    alerta, mantidos incrementalmente; esta leitura completa fica para análises e benchmarks."""
     try:
-        df = pd.read_sql("SELECT * FROM sensor_data", engine, parse_dates=['timestamp']); return apply_alert_rules(df)
+        return apply_alert_rules(read_sensor_rows())
     except Exception:
         st.error("Tabela 'sensor_data' não encontrada. Execute 'gerador_dados_planta.py' primeiro."); return None
+
+# --- ROLLUPS PRÉ-AGREGADOS DOS SENSORES ---
+# Resoluções em ordem crescente; cada nível é agregado a partir do anterior (leituras de 1 min -> 15 min -> 1 h -> 1 dia)
+ROLLUP_RESOLUTIONS = {'15min': pd.Timedelta(minutes=15), '1h': pd.Timedelta(hours=1), '1D': pd.Timedelta(days=1)}
+ROLLUP_COLUMNS = ['resolution', 'bucket', 'asset_id', 'sensor', 'min_value', 'max_value', 'sum_value', 'count', 'worst_status', 'worst_reason']
+# Executado direto no driver (placeholders "?" e tuplas): a carga inicial pode ter centenas de milhares de buckets
+ROLLUP_UPSERT = f"""
+    INSERT INTO sensor_rollups ({', '.join(ROLLUP_COLUMNS)}) VALUES ({', '.join('?' * len(ROLLUP_COLUMNS))})
+    ON CONFLICT(resolution, asset_id, sensor, bucket) DO UPDATE SET
+        min_value = MIN(min_value, excluded.min_value), max_value = MAX(max_value, excluded.max_value),
+        sum_value = sum_value + excluded.sum_value, count = count + excluded.count,
+        worst_reason = CASE WHEN excluded.worst_status > worst_status THEN excluded.worst_reason ELSE worst_reason END,
+        worst_status = MAX(worst_status, excluded.worst_status)
+"""
+def aggregate_sensor_rollups(df_analyzed):
+    """Agrega leituras já classificadas em (ativo, sensor, bucket) para cada resolução de ROLLUP_RESOLUTIONS.
+    O pior status de um sensor considera só as leituras cujo motivo de alerta é aquele sensor, então o pior
+    status do ativo em um bucket é o máximo entre os seus sensores."""
+    reasons = ALERT_RULES['reasons']
+    # Status e motivo codificados em um único inteiro: o máximo do código dá o pior status e o motivo correspondente
+    worst_key = df_analyzed['status'].cat.codes.to_numpy(dtype=np.int64)*len(reasons) + df_analyzed['status_reason'].cat.codes.to_numpy()
+    alert_sensor = df_analyzed['status_reason'].cat.codes.to_numpy()
+    alert_sensor = np.where(alert_sensor > 0, (alert_sensor - 1)//2, -1) # Índice do parâmetro em ALERT_RULES['params']
+    frames = []
+    for sensor in [c for c in SENSOR_COLUMNS if c in df_analyzed.columns]:
+        has_value = df_analyzed[sensor].notna().to_numpy()
+        if not has_value.any(): continue
+        sensor_key = np.where(alert_sensor == ALERT_RULES['params'].index(sensor), worst_key, 0) if sensor in ALERT_RULES['params'] else np.zeros(len(worst_key), dtype=np.int64)
+        frames.append(pd.DataFrame({'asset_id': df_analyzed['asset_id'].to_numpy()[has_value], 'sensor': sensor, 'timestamp': df_analyzed['timestamp'].to_numpy()[has_value],
+                                    'value': df_analyzed[sensor].to_numpy(dtype=float)[has_value], 'worst_key': sensor_key[has_value]}))
+    if not frames: return pd.DataFrame()
+    level = pd.concat(frames, ignore_index=True)
+    level = level.assign(min_value=level['value'], max_value=level['value'], sum_value=level['value'], count=1)
+    rollups = []
+    for resolution in ROLLUP_RESOLUTIONS:
+        level = level.assign(timestamp=level['timestamp'].dt.floor(resolution)).groupby(['asset_id', 'sensor', 'timestamp'], sort=False).agg(
+            min_value=('min_value', 'min'), max_value=('max_value', 'max'), sum_value=('sum_value', 'sum'), count=('count', 'sum'), worst_key=('worst_key', 'max')
+        ).reset_index()
+        rollups.append(level.assign(resolution=resolution))
+    rollups = pd.concat(rollups, ignore_index=True).rename(columns={'timestamp': 'bucket'})
+    rollups['worst_status'] = rollups['worst_key'] // len(reasons); rollups['worst_reason'] = np.array(reasons, dtype=object)[rollups['worst_key'] % len(reasons)]
+    return rollups.drop(columns=['worst_key'])
+def update_sensor_rollups():
+    """Incorpora aos rollups as leituras posteriores à marca d'água de cada ativo (tabela rollup_watermarks), cada
+    ativo lido a partir da própria marca. Tudo ocorre em uma transação BEGIN IMMEDIATE: processos concorrentes (páginas,
+    agendador) se serializam e nenhuma leitura é somada duas vezes. Chamada uma vez por renderização das páginas que
+    leem rollups e a cada rodada do agendador; as funções de leitura não atualizam. Retorna o número de leituras incorporadas."""
+    with engine.connect() as conn:
+        try: conn.exec_driver_sql("BEGIN IMMEDIATE")
+        except OperationalError: return 0 # Outro processo está atualizando os rollups; usa o que já está gravado
+        try:
+            watermarks = {asset_id: pd.Timestamp(ts) for asset_id, ts in conn.execute(text("SELECT asset_id, last_timestamp FROM rollup_watermarks"))}
+            df_new = read_sensor_rows_after(watermarks, conn)
+            if df_new.empty: conn.rollback(); return 0
+            rollups = aggregate_sensor_rollups(apply_alert_rules(df_new))
+            rollups['bucket'] = rollups['bucket'].dt.strftime(TIMESTAMP_FORMAT)
+            if not rollups.empty: conn.exec_driver_sql(ROLLUP_UPSERT, list(rollups[ROLLUP_COLUMNS].astype(object).itertuples(index=False, name=None)))
+            new_marks = df_new.groupby('asset_id')['timestamp'].max()
+            conn.execute(text("INSERT INTO rollup_watermarks (asset_id, last_timestamp) VALUES (:asset_id, :last_timestamp) ON CONFLICT(asset_id) DO UPDATE SET last_timestamp = excluded.last_timestamp"),
+                         [{"asset_id": a, "last_timestamp": ts.strftime(TIMESTAMP_FORMAT)} for a, ts in new_marks.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback(); raise
+    return len(df_new)
+def choose_rollup_resolution(window, min_buckets):
+    """Resolução mais grossa que ainda divide a janela em pelo menos `min_buckets` intervalos (None = usar as leituras brutas)."""
+    fitting = [resolution for resolution, size in ROLLUP_RESOLUTIONS.items() if window / size >= min_buckets]
+    return fitting[-1] if fitting else None
+def load_latest_sensor_timestamps():
+    """Última leitura já incorporada aos rollups, por ativo (não atualiza: ver update_sensor_rollups)."""
+    return pd.read_sql("SELECT asset_id, last_timestamp FROM rollup_watermarks", engine, parse_dates=['last_timestamp']).set_index('asset_id')['last_timestamp']
+def load_latest_reading(asset_id):
+    """Leitura mais recente de um ativo nos dados brutos (busca no índice (asset_id, timestamp); None sem leituras)."""
+    if SENSOR_STORAGE == "parquet": latest = read_latest_timestamps([asset_id]).get(asset_id)
+    else:
+        with engine.connect() as conn: latest = conn.execute(text("SELECT MAX(timestamp) FROM sensor_data WHERE asset_id = :asset_id"), {"asset_id": asset_id}).scalar()
+    return pd.Timestamp(latest) if latest is not None and pd.notna(latest) else None
+def render_pending_readings_note(asset_id, processed_until):
+    """Avisa quando o ativo tem leituras posteriores às já processadas pelo agendador (rollups ou eventos de alerta)."""
+    latest = load_latest_reading(asset_id)
+    if latest is not None and latest > processed_until:
+        st.caption(f"ℹ️ Dados processados até {processed_until:%d/%m/%Y %H:%M}; as leituras até {latest:%d/%m/%Y %H:%M} entram na próxima rodada do agendador (`python -m scheduler`).")
+def load_sensor_rollups(resolution, since=None, asset_ids=None, until=None):
+    """Rollups de uma resolução, opcionalmente entre os buckets que contêm `since` e `until` e para alguns ativos.
+    Inclui a média (soma/contagem) e o pior status como categórico ordenado (não atualiza: ver update_sensor_rollups)."""
+    conditions, params = ["resolution = :resolution"], {"resolution": resolution}
+    if since is not None: conditions.append("bucket >= :since"); params["since"] = pd.Timestamp(since).floor(resolution).strftime(TIMESTAMP_FORMAT)
+    if until is not None: conditions.append("bucket <= :until"); params["until"] = pd.Timestamp(until).strftime(TIMESTAMP_FORMAT)
+    if asset_ids is not None: conditions.append("asset_id IN :asset_ids"); params["asset_ids"] = list(asset_ids)
+    query = text(f"SELECT * FROM sensor_rollups WHERE {' AND '.join(conditions)} ORDER BY asset_id, sensor, bucket")
+    if asset_ids is not None: query = query.bindparams(bindparam('asset_ids', expanding=True))
+    df = pd.read_sql(query, engine, params=params, parse_dates=['bucket'])
+    df['mean_value'] = df['sum_value'] / df['count']
+    df['worst_status'] = pd.Categorical.from_codes(df['worst_status'].astype(int), categories=STATUS_LEVELS, ordered=True)
+    return df
+def load_sensor_window(asset_id, start, end):
+    """Leituras brutas e classificadas de um ativo no período (start, end] (usa o índice por ativo/timestamp)."""
+    return apply_alert_rules(read_sensor_rows(since=pd.Timestamp(start), until=pd.Timestamp(end), asset_ids=[asset_id]))
+# --- EVENTOS DE ALERTA (TRANSIÇÕES DE STATUS) ---
+# Cada leitura é classificada uma única vez, ao ser gravada ou na primeira atualização depois disso; só as mudanças de
+# (status, motivo) de cada ativo viram linhas em alert_events. Trechos Normal não são gravados: o ativo está Normal
+# sempre que não há evento cobrindo o instante. ended_at é a primeira leitura já fora do estado (NULL = em andamento) e
+# last_reading_at a última leitura dentro dele, usada nas janelas para dar o mesmo resultado da classificação por leitura.
+ALERT_EVENT_INSERT = "INSERT INTO alert_events (asset_id, status, reason, started_at, ended_at, last_reading_at, readings) VALUES (?, ?, ?, ?, ?, ?, ?)"
+def record_alert_transitions(conn, df_classified):
+    """Incorpora a alert_events leituras já classificadas (apply_alert_rules), todas posteriores às já incorporadas do
+    mesmo ativo (evaluate_alert_events filtra pela marca d'água): continua ou encerra o evento em andamento e insere um
+    evento por trecho contínuo em alerta.
+    Retorna o número de eventos inseridos."""
+    if df_classified.empty: return 0
+    reasons = ALERT_RULES['reasons']
+    df = df_classified[['asset_id', 'timestamp', 'status', 'status_reason']].sort_values(['asset_id', 'timestamp'], kind='stable').reset_index(drop=True)
+    # Estado codificado como em aggregate_sensor_rollups: 0 = Normal, sem motivo
+    state = status_codes(df['status']).astype(np.int64)*len(reasons) + pd.Categorical(df['status_reason'], categories=reasons).codes
+    open_events = pd.read_sql("SELECT asset_id, status, reason FROM alert_events WHERE ended_at IS NULL", conn)
+    open_state = pd.Series(status_codes(open_events['status']).astype(np.int64)*len(reasons) + pd.Categorical(open_events['reason'].fillna(''), categories=reasons).codes, index=open_events['asset_id'])
+    first = df['asset_id'].ne(df['asset_id'].shift()).to_numpy()
+    previous = np.roll(state, 1); previous[first] = df.loc[first, 'asset_id'].map(open_state).fillna(0).to_numpy(dtype=np.int64)
+    starts = first | (state != previous) # Primeira leitura de cada trecho (a do ativo abre um trecho mesmo sem mudança)
+    runs = df.loc[starts, ['asset_id', 'timestamp']].assign(state=state[starts], first=first[starts], continues=first[starts] & (state[starts] == previous[starts]),
+                                                            readings=np.bincount(np.cumsum(starts) - 1))
+    runs['last_reading_at'] = df['timestamp'].to_numpy()[np.append(np.flatnonzero(starts)[1:] - 1, len(df) - 1)]
+    runs['ended_at'] = runs['timestamp'].shift(-1).where(runs['asset_id'].shift(-1) == runs['asset_id'])
+    # Só os trechos em alerta e os que encerram um evento em andamento são gravados (trechos Normal são a maioria)
+    has_open = runs['first'] & runs['asset_id'].isin(open_state.index)
+    runs = runs[(runs['state'] > 0) | has_open]; has_open = has_open[runs.index]
+    for column in ('timestamp', 'ended_at', 'last_reading_at'): runs[column] = runs[column].dt.strftime(TIMESTAMP_FORMAT).astype(object).where(runs[column].notna(), None)
+    runs = runs.rename(columns={'timestamp': 'started_at'})
+    # Eventos em andamento: encerrados na primeira leitura com outro estado, ou estendidos pelo trecho que os continua
+    closing = runs[has_open & ~runs['continues']]
+    if not closing.empty: conn.exec_driver_sql("UPDATE alert_events SET ended_at = ? WHERE asset_id = ? AND ended_at IS NULL", list(zip(closing['started_at'], closing['asset_id'])))
+    extended = runs[runs['continues'] & (runs['state'] > 0)]
+    if not extended.empty: conn.exec_driver_sql("UPDATE alert_events SET readings = readings + ?, ended_at = ?, last_reading_at = ? WHERE asset_id = ? AND ended_at IS NULL",
+                                                list(zip(extended['readings'].astype(int).tolist(), extended['ended_at'], extended['last_reading_at'], extended['asset_id'])))
+    new_events = runs[~runs['continues'] & (runs['state'] > 0)]
+    if not new_events.empty:
+        conn.exec_driver_sql(ALERT_EVENT_INSERT, list(zip(new_events['asset_id'], np.array(STATUS_LEVELS, dtype=object)[new_events['state'] // len(reasons)],
+                                                          np.array(reasons, dtype=object)[new_events['state'] % len(reasons)], new_events['started_at'], new_events['ended_at'], new_events['last_reading_at'], new_events['readings'].astype(int).tolist())))
+    return len(new_events)
+def evaluate_alert_events(conn, df_readings, watermarks=None):
+    """Classifica as leituras posteriores à marca d'água de cada ativo (tabela alert_watermarks), registra as transições
+    e avança as marcas, na transação aberta em `conn`. Leituras atrasadas (anteriores à marca) são ignoradas, como nos rollups.
+    Retorna o número de leituras avaliadas."""
+    if watermarks is None: watermarks = {asset_id: pd.Timestamp(ts) for asset_id, ts in conn.execute(text("SELECT asset_id, last_timestamp FROM alert_watermarks"))}
+    df_new = filter_new_rows(df_readings, watermarks)
+    if df_new.empty: return 0
+    record_alert_transitions(conn, apply_alert_rules(df_new))
+    new_marks = df_new.groupby('asset_id', observed=True)['timestamp'].max()
+    conn.exec_driver_sql("INSERT INTO alert_watermarks (asset_id, last_timestamp) VALUES (?, ?) ON CONFLICT(asset_id) DO UPDATE SET last_timestamp = excluded.last_timestamp",
+                         [(a, ts.strftime(TIMESTAMP_FORMAT)) for a, ts in new_marks.items()])
+    return len(df_new)
+def update_alert_events():
+    """Avalia as leituras gravadas sem passar pelo serviço de ingestão (gerador de dados, cargas em lote), cada ativo
+    lido a partir da própria marca, em uma transação BEGIN IMMEDIATE como update_sensor_rollups. Chamada uma vez por
+    renderização das páginas que leem eventos e a cada rodada do agendador; as funções de leitura não atualizam.
+    Retorna o número de leituras avaliadas."""
+    with engine.connect() as conn:
+        try: conn.exec_driver_sql("BEGIN IMMEDIATE")
+        except OperationalError: return 0 # Outro processo está gravando eventos; usa o que já está gravado
+        try:
+            watermarks = {asset_id: pd.Timestamp(ts) for asset_id, ts in conn.execute(text("SELECT asset_id, last_timestamp FROM alert_watermarks"))}
+            evaluated = evaluate_alert_events(conn, read_sensor_rows_after(watermarks, conn), watermarks)
+            if not evaluated: conn.rollback(); return 0
+            conn.commit()
+        except Exception:
+            conn.rollback(); raise
+    return evaluated
+def read_alert_events(asset_ids=None, statuses=None, since=None, until=None):
+    """Eventos de alerta com leituras em (since, until], opcionalmente de alguns ativos e status, com o tipo do ativo
+    vindo de `assets`. Do mais recente para o mais antigo."""
+    conditions, params = [], {}
+    if since is not None: conditions.append("e.last_reading_at > :since"); params["since"] = pd.Timestamp(since).strftime(TIMESTAMP_FORMAT)
+    if until is not None: conditions.append("e.started_at <= :until"); params["until"] = pd.Timestamp(until).strftime(TIMESTAMP_FORMAT)
+    if asset_ids is not None: conditions.append("e.asset_id IN :asset_ids"); params["asset_ids"] = list(asset_ids)
+    if statuses is not None: conditions.append("e.status IN :statuses"); params["statuses"] = list(statuses)
+    query = text("SELECT e.*, a.asset_type FROM alert_events AS e LEFT JOIN assets AS a ON a.asset_id = e.asset_id" + (f" WHERE {' AND '.join(conditions)}" if conditions else "") + " ORDER BY e.started_at DESC")
+    for name in ('asset_ids', 'statuses'):
+        if name in params: query = query.bindparams(bindparam(name, expanding=True))
+    return pd.read_sql(query, engine, params=params, parse_dates={column: {'format': 'ISO8601'} for column in ('started_at', 'ended_at', 'last_reading_at')})
+def load_latest_alert_timestamps():
+    """Última leitura já classificada nos eventos de alerta, por ativo (não atualiza: ver update_alert_events)."""
+    return pd.read_sql("SELECT asset_id, last_timestamp FROM alert_watermarks", engine, parse_dates={'last_timestamp': {'format': 'ISO8601'}}).set_index('asset_id')['last_timestamp']
+def load_alert_status_summary(window, end=None, suppress_resolved=False):
+    """Pior status de cada ativo com leituras na janela que termina em `end` (padrão: leitura mais recente), a partir
+    dos eventos com leituras na janela; ativos sem evento na janela ficam Normal (não atualiza: ver update_alert_events)."""
+    latest = load_latest_alert_timestamps()
+    if latest.empty: return pd.DataFrame(columns=['asset_id', 'status'])
+    end = latest.max() if end is None else pd.Timestamp(end); start = end - window
+    df = read_alert_events(since=start, until=end)
+    if suppress_resolved:
+        # Mesma regra de suppress_resolved_alerts, aplicada ao motivo de cada evento
+        df_resolved = pd.read_sql("SELECT asset_id, reason FROM resolved_alerts", engine)
+        df.loc[pd.MultiIndex.from_frame(df[['asset_id', 'reason']]).isin(pd.MultiIndex.from_frame(df_resolved)), 'status'] = 'Normal (Resolvido)'
+    assets = latest.index[latest > start]
+    status = worst_status(df[df['asset_id'].isin(assets)], 'asset_id').reindex(assets, fill_value='Normal')
+    return status.rename_axis('asset_id').reset_index()
+
+# --- REDUÇÃO DE PONTOS PARA GRÁFICOS ---
+CHART_POINT_BUDGET = 1000 # Pontos por série enviados ao Plotly (padrão; configurável na página de monitoramento)
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: índices de `n_out` pontos que preservam o formato visual da série.
+    Em cada intervalo fica o ponto que forma o maior triângulo com o ponto escolhido antes e a média do intervalo seguinte."""
+    n = len(y)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64) # n_out-2 intervalos entre o primeiro e o último ponto
+    selected = np.empty(n_out, dtype=np.int64); selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        area = np.abs((x[a] - avg_x)*(y[start:stop] - y[a]) - (x[a] - x[start:stop])*(avg_y - y[a]))
+        a = start + int(np.argmax(area)); selected[i + 1] = a
+    return selected
+def minmax_indices(y, n_out):
+    """Mín/máx por intervalo: divide a série em n_out/2 intervalos e mantém o menor e o maior ponto de cada um."""
+    n = len(y)
+    if n_out >= n: return np.arange(n)
+    bins = pd.Series(np.asarray(y, dtype=float)).groupby(np.arange(n) * max(n_out // 2, 1) // n)
+    return np.unique(np.concatenate([bins.idxmin().to_numpy(), bins.idxmax().to_numpy()]))
+def downsample_indices(x, y, budget, keep=None):
+    """Índices (ordenados) das leituras a plotar: até `budget` pontos por LTTB, sempre incluindo as marcadas em `keep`
+    (alertas). Se as marcadas passarem de metade do orçamento, são reduzidas por mín/máx, preservando os picos."""
+    n = len(y)
+    if n <= budget: return np.arange(n)
+    forced = np.flatnonzero(keep) if keep is not None else np.array([], dtype=np.int64)
+    if len(forced) > budget // 2: forced = forced[minmax_indices(np.asarray(y)[forced], budget // 2)]
+    return np.union1d(lttb_indices(x, y, budget - len(forced)), forced)
+def rebucket_rollups(df_rollup, budget):
+    """Mín/máx por intervalo sobre rollups: reagrupa cada (ativo, sensor) em no máximo `budget` intervalos iguais."""
+    if df_rollup.empty or df_rollup.groupby(['asset_id', 'sensor']).size().max() <= budget: return df_rollup
+    first = df_rollup['bucket'].min(); step = ((df_rollup['bucket'].max() - first) / max(budget - 1, 1)).ceil('s')
+    df = df_rollup.assign(bucket=first + (df_rollup['bucket'] - first) // step * step, status_code=df_rollup['worst_status'].cat.codes)
+    keys = ['asset_id', 'sensor', 'bucket']
+    grouped = df.groupby(keys, sort=False)
+    result = grouped.agg(min_value=('min_value', 'min'), max_value=('max_value', 'max'), sum_value=('sum_value', 'sum'), count=('count', 'sum'), status_code=('status_code', 'max')).reset_index()
+    result['worst_reason'] = df.loc[grouped['status_code'].idxmax().to_numpy(), 'worst_reason'].to_numpy()
+    result['mean_value'] = result['sum_value'] / result['count']
+    result['worst_status'] = pd.Categorical.from_codes(result.pop('status_code'), categories=STATUS_LEVELS, ordered=True)
+    return result.assign(resolution=df_rollup['resolution'].iloc[0])
+def load_scheduler_status():
+    """Dono do lease e horário da última rodada do agendador de OS (None se ele nunca rodou)."""
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT owner, expires_at, last_run FROM scheduler_leases WHERE name = :name"), {"name": SCHEDULER_LEASE_NAME}).fetchone()
+    if row is None: return None
+    return {'owner': row[0], 'expires_at': pd.Timestamp(row[1]), 'last_run': pd.Timestamp(row[2]) if row[2] else None}
 def load_service_orders():
-    initialize_database(); return pd.read_sql("SELECT * FROM service_orders", engine, parse_dates=['creation_date', 'completion_date'])
+    return pd.read_sql("SELECT * FROM service_orders", engine, parse_dates=['creation_date', 'completion_date'])
+# --- CONSULTA PAGINADA DE OS ---
+def query_service_orders(statuses=None, classes=None, assignees=None, asset_ids=None, created_from=None, created_to=None, after=None, limit=OS_PAGE_SIZE):
+    """Uma página de OS filtrada no SQL, da mais recente para a mais antiga (paginação por chave, sem OFFSET).
+    Filtros de lista valem como IN (None = sem filtro); `created_from` é inclusivo e `created_to` exclusivo. `after` é o
+    cursor (creation_date, os_id) da última linha da página anterior; `limit=None` traz tudo. Retorna (página, cursor da próxima página ou None)."""
+    conditions, params, expanding = [], ({"limit": limit + 1} if limit is not None else {}), []
+    for column, name, values in [('status', 'statuses', statuses), ('class', 'classes', classes), ('assigned_to', 'assignees', assignees), ('asset_id', 'asset_ids', asset_ids)]:
+        if values is None: continue
+        if len(values) == 0: conditions.append("0"); continue # Filtro vazio: nenhuma OS (a consulta ainda devolve as colunas)
+        conditions.append(f"{column} IN :{name}"); params[name] = list(values); expanding.append(name)
+    if created_from is not None: conditions.append("creation_date >= :created_from"); params["created_from"] = to_db_value(pd.Timestamp(created_from))
+    if created_to is not None: conditions.append("creation_date < :created_to"); params["created_to"] = to_db_value(pd.Timestamp(created_to))
+    if after is not None:
+        conditions.append("(creation_date < :after_date OR (creation_date = :after_date AND os_id < :after_id))"); params["after_date"], params["after_id"] = after
+    # creation_date é devolvida também como texto cru: o cursor compara com o valor exatamente como está gravado
+    query = text("SELECT *, creation_date AS cursor_date FROM service_orders" + (f" WHERE {' AND '.join(conditions)}" if conditions else "") +
+                 " ORDER BY creation_date DESC, os_id DESC" + (" LIMIT :limit" if limit is not None else ""))
+    if expanding: query = query.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+    df_page = pd.read_sql(query, engine, params=params, parse_dates=['creation_date', 'completion_date'])
+    next_cursor = None
+    if limit is not None and len(df_page) > limit:
+        df_page = df_page.iloc[:limit]; last = df_page.iloc[-1]; next_cursor = (last['cursor_date'], last['os_id'])
+    return df_page.drop(columns=['cursor_date']), next_cursor
+def load_service_order_filter_options():
+    """Valores distintos de status e classe para os filtros das listas de OS (consultas cobertas pelos índices)."""
+    with engine.connect() as conn:
+        return {column: [value for (value,) in conn.execute(text(f'SELECT DISTINCT "{column}" FROM service_orders WHERE "{column}" IS NOT NULL ORDER BY 1'))] for column in ('status', 'class')}
+def service_orders_pager(key, page_size=OS_PAGE_SIZE, **filters):
+    """Página atual de query_service_orders com botões de navegação; a pilha de cursores fica na sessão e volta à
+    primeira página quando os filtros mudam."""
+    state = st.session_state.setdefault(f"{key}_pager", {'filters': None, 'cursors': [None]})
+    signature = repr(sorted(filters.items()))
+    if state['filters'] != signature: state.update(filters=signature, cursors=[None])
+    df_page, next_cursor = query_service_orders(after=state['cursors'][-1], limit=page_size, **filters)
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    col_prev.button("◀ Anteriores", key=f"{key}_prev", disabled=len(state['cursors']) == 1, on_click=state['cursors'].pop)
+    col_info.caption(f"Página {len(state['cursors'])} · {len(df_page)} OS exibida(s)")
+    col_next.button("Próximas ▶", key=f"{key}_next", disabled=next_cursor is None, on_click=state['cursors'].append, args=(next_cursor,))
+    return df_page
 def add_resolved_alert(asset_id, reason):
     new_entry = pd.DataFrame([{'asset_id': asset_id, 'reason': reason}])
     try: new_entry.to_sql("resolved_alerts", engine, if_exists='append', index=False)
     except: pass
 def suppress_resolved_alerts(df_analyzed):
-    df_resolved = pd.read_sql("SELECT * FROM resolved_alerts", engine).drop_duplicates()
+    """Marca como 'Normal (Resolvido)' os alertas cujo (ativo, motivo) foi resolvido. Retorna um novo frame; o frame
+    recebido não é alterado."""
+    df_resolved = pd.read_sql("SELECT asset_id, reason FROM resolved_alerts", engine).drop_duplicates()
     if df_resolved.empty: return df_analyzed
-    df_analyzed['alert_key'] = df_analyzed['asset_id'] + "_" + df_analyzed['status_reason']; df_resolved['alert_key'] = df_resolved['asset_id'] + "_" + df_resolved['reason']
-    resolved_mask = df_analyzed['alert_key'].isin(df_resolved['alert_key'])
-    df_analyzed.loc[resolved_mask, 'status'] = 'Normal (Resolvido)'; df_analyzed.drop(columns=['alert_key'], inplace=True)
-    return df_analyzed
+    resolved_mask = pd.MultiIndex.from_arrays([df_analyzed['asset_id'].astype(str), df_analyzed['status_reason'].astype(str)]).isin(pd.MultiIndex.from_frame(df_resolved.astype(str)))
+    return df_analyzed.assign(status=df_analyzed['status'].mask(resolved_mask, 'Normal (Resolvido)'))
+# Níveis de status em ordem crescente de severidade (usados como categorias ordenadas)
+STATUS_LEVELS = ['Normal', 'Normal (Resolvido)', 'Atenção', 'Crítico']
+def status_codes(statuses):
+    """Código de severidade de cada status: posição em STATUS_LEVELS (-1 para vazio ou desconhecido)."""
+    return pd.Categorical(statuses, categories=STATUS_LEVELS, ordered=True).codes
+def worst_status(df, by, status_col='status', start=None, end=None, time_col='timestamp'):
+    """Pior status por grupo, opcionalmente só das linhas com `time_col` em [start, end]. O máximo é tirado sobre os
+    códigos de severidade no groupby nativo e devolvido como categórico ordenado (ex.: 'Normal (Resolvido)' > 'Normal')."""
+    if start is not None: df = df[df[time_col] >= start]
+    if end is not None: df = df[df[time_col] <= end]
+    codes = df.assign(_status_code=status_codes(df[status_col])).groupby(by, observed=True, sort=False)['_status_code'].max()
+    return pd.Series(pd.Categorical.from_codes(codes.to_numpy(), categories=STATUS_LEVELS, ordered=True), index=codes.index, name=status_col)
+def compile_alert_rules(profiles=ASSET_PROFILES):
+    """Compila os perfis em arrays de limites indexados por (código do tipo de ativo, posição do parâmetro no perfil)."""
+    asset_types = list(profiles)
+    params = list(dict.fromkeys(param for profile in profiles.values() for param in profile['params']))
+    n_slots = max(len(profile['params']) for profile in profiles.values())
+    compiled = {'asset_types': asset_types, 'params': params, 'param_idx': np.full((len(asset_types), n_slots), -1)}
+    for key in ('crit_high', 'warn_high', 'crit_low', 'warn_low'): compiled[key] = np.full((len(asset_types), n_slots), np.nan)
+    for t, profile in enumerate(profiles.values()):
+        for j, (param, rules) in enumerate(profile['params'].items()):
+            compiled['param_idx'][t, j] = params.index(param)
+            compiled['crit_high'][t, j] = rules['op_max']*rules['crit_factor']; compiled['warn_high'][t, j] = rules['op_max']*rules['warn_factor']
+            compiled['crit_low'][t, j] = rules['op_min']/rules['crit_factor']; compiled['warn_low'][t, j] = rules['op_min']/rules['warn_factor']
+    # Código de motivo 0 = sem motivo; 1 + 2*i = "<Parâmetro i> Alta"; 2 + 2*i = "<Parâmetro i> Baixa"
+    compiled['reasons'] = [''] + [f'{param.title()} {side}' for param in params for side in ('Alta', 'Baixa')]
+    return compiled
+ALERT_RULES = compile_alert_rules()
 def apply_alert_rules(df):
-    df_alerts = df.copy(); df_alerts['status'] = 'Normal'; df_alerts['status_reason'] = ''
-    for asset_type, profile in ASSET_PROFILES.items():
-        if asset_type in df_alerts['asset_type'].unique():
-            for param, rules in profile['params'].items():
-                if param in df_alerts.columns and not df_alerts[df_alerts['asset_type']==asset_type][param].isnull().all():
-                    crit_high=rules['op_max']*rules['crit_factor']; warn_high=rules['op_max']*rules['warn_factor']
-                    crit_low=rules['op_min']/rules['crit_factor']; warn_low=rules['op_min']/rules['warn_factor']
-                    is_type = (df_alerts['asset_type'] == asset_type)
-                    df_alerts.loc[is_type & (df_alerts[param] > crit_high), ['status', 'status_reason']] = ['Crítico',f'{param.title()} Alta']; df_alerts.loc[is_type & (df_alerts[param] < crit_low), ['status', 'status_reason']] = ['Crítico',f'{param.title()} Baixa']; df_alerts.loc[is_type & (df_alerts[param] > warn_high) & (df_alerts[param] <= crit_high), ['status', 'status_reason']] = ['Atenção',f'{param.title()} Alta']; df_alerts.loc[is_type & (df_alerts[param] < warn_low) & (df_alerts[param] >= crit_low), ['status', 'status_reason']] = ['Atenção',f'{param.title()} Baixa']
+    """Classifica todas as linhas em uma única passada vetorizada sobre os limites compilados em ALERT_RULES.
+    Como na regra original, o último parâmetro do perfil que disparar define status e motivo da linha."""
+    rules = ALERT_RULES; df_alerts = df.copy(); n_rows = len(df_alerts)
+    status = np.zeros(n_rows, dtype=np.int8); reason = np.zeros(n_rows, dtype=np.int16)
+    type_codes = pd.Categorical(df_alerts['asset_type'], categories=rules['asset_types']).codes
+    rows = np.flatnonzero(type_codes >= 0); codes = type_codes[rows]
+    values = np.column_stack([df_alerts[param].to_numpy(dtype=float, na_value=np.nan) if param in df_alerts.columns else np.full(n_rows, np.nan) for param in rules['params']])
+    normal, warning, critical = (STATUS_LEVELS.index(level) for level in ('Normal', 'Atenção', 'Crítico'))
+    for j in range(rules['param_idx'].shape[1]):
+        param_idx = rules['param_idx'][codes, j]
+        x = values[rows, np.maximum(param_idx, 0)]
+        crit_high, warn_high = rules['crit_high'][codes, j], rules['warn_high'][codes, j]
+        crit_low, warn_low = rules['crit_low'][codes, j], rules['warn_low'][codes, j]
+        slot_status = np.full(len(rows), normal, dtype=np.int8); slot_reason = np.zeros(len(rows), dtype=np.int16)
+        for mask, level, side in ((x > crit_high, critical, 1), (x < crit_low, critical, 2), ((x > warn_high) & (x <= crit_high), warning, 1), ((x < warn_low) & (x >= crit_low), warning, 2)):
+            slot_status[mask] = level; slot_reason[mask] = 2*param_idx[mask] + side
+        hit = slot_status != normal
+        status[rows[hit]] = slot_status[hit]; reason[rows[hit]] = slot_reason[hit]
+    df_alerts['status'] = pd.Categorical.from_codes(status, categories=STATUS_LEVELS, ordered=True)
+    df_alerts['status_reason'] = pd.Categorical.from_codes(reason, categories=rules['reasons'])
     return df_alerts
+def active_order_keys(df_os, statuses):
+    """Índice (asset_id, reason) das OS nos status informados, para checagem de duplicidade em lote."""
+    active = df_os.loc[df_os['status'].isin(statuses), ['asset_id', 'reason']].astype(str)
+    return pd.MultiIndex.from_frame(active)
+def to_db_value(value):
+    """Converte um valor Python/pandas para o que é gravado no SQLite (NaN/NaT -> NULL, datas no formato das colunas)."""
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)): return None
+    if isinstance(value, datetime): return value.strftime(TIMESTAMP_FORMAT)
+    if isinstance(value, date): return value.isoformat()
+    return value.item() if isinstance(value, np.generic) else value
+def insert_service_orders(new_orders):
+    """Insere várias OS em uma única transação (executemany)."""
+    columns = list(new_orders[0])
+    stmt = text(f"INSERT INTO service_orders ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})")
+    with engine.begin() as conn:
+        conn.execute(stmt, [{c: to_db_value(order[c]) for c in columns} for order in new_orders])
 def check_and_generate_os(df_analyzed, df_os):
-    critical_problems = df_analyzed[df_analyzed['status'] == 'Crítico'][['asset_id', 'asset_type', 'status_reason']].drop_duplicates()
-    new_os_list = []
-    for _, problem in critical_problems.iterrows():
-        has_active_os = not df_os[(df_os['asset_id'] == problem['asset_id']) & (df_os['reason'] == problem['status_reason']) & (df_os['status'].isin(['Aberta', 'Em Andamento']))].empty
-        if not has_active_os:
-            new_os_list.append({'os_id': f"OS-{uuid.uuid4().hex[:12]}", 'asset_id': problem['asset_id'], 'asset_type': problem['asset_type'], 'creation_date': datetime.now(), 'reason': problem['status_reason'], 'priority': 'Crítica', 'status': 'Aberta', 'class': 'Preditiva', 'recorrencia': 'Não recorrente', 'assigned_to': 'Não atribuído', 'notes': '', 'estimated_cost': 0.0, 'actual_cost': 0.0, 'files_attached': json.dumps([]), 'completion_date': pd.NaT})
-    if new_os_list:
-        df_new_os = pd.DataFrame(new_os_list); append_to_table(df_new_os, "service_orders"); st.toast("Novas OS Preditivas foram geradas!", icon="✅")
-        return pd.concat([df_os, df_new_os], ignore_index=True)
-    return df_os
+    critical_problems = df_analyzed.loc[df_analyzed['status'] == 'Crítico', ['asset_id', 'asset_type', 'status_reason']].drop_duplicates().astype(str)
+    # Anti-join: descarta os problemas que já têm OS ativa para o mesmo (ativo, motivo)
+    problem_keys = pd.MultiIndex.from_frame(critical_problems[['asset_id', 'status_reason']])
+    critical_problems = critical_problems[~problem_keys.isin(active_order_keys(df_os, ['Aberta', 'Em Andamento']))]
+    if critical_problems.empty: return df_os
+    now = datetime.now()
+    new_os_list = [{'os_id': f"OS-{uuid.uuid4().hex[:12]}", 'asset_id': problem['asset_id'], 'asset_type': problem['asset_type'], 'creation_date': now, 'reason': problem['status_reason'], 'priority': 'Crítica', 'status': 'Aberta', 'class': 'Preditiva', 'recorrencia': 'Não recorrente', 'assigned_to': 'Não atribuído', 'notes': '', 'estimated_cost': 0.0, 'actual_cost': 0.0, 'files_attached': json.dumps([]), 'completion_date': pd.NaT} for problem in critical_problems.to_dict('records')]
+    insert_service_orders(new_os_list)
+    return pd.concat([df_os, pd.DataFrame(new_os_list)], ignore_index=True)
 
+RECURRENCE_PERIODS = {'Semanalmente': pd.DateOffset(weeks=1), 'Mensalmente': pd.DateOffset(months=1), 'Trimestralmente': pd.DateOffset(months=3), 'Semestralmente': pd.DateOffset(months=6), 'Anualmente': pd.DateOffset(years=1)}
 def check_and_generate_recurring_os(df_os):
-    recurrence_map = {'Semanalmente': relativedelta(weeks=1), 'Mensalmente': relativedelta(months=1), 'Trimestralmente': relativedelta(months=3), 'Semestralmente': relativedelta(months=6), 'Anualmente': relativedelta(years=1)}
-    preventive_completed = df_os[(df_os['class'] == 'Preventiva') & (df_os['recorrencia'] != 'Não recorrente') & (df_os['status'] == 'Concluída')].copy()
+    preventive_completed = df_os[(df_os['class'] == 'Preventiva') & (df_os['recorrencia'] != 'Não recorrente') & (df_os['status'] == 'Concluída')].dropna(subset=['asset_id', 'reason'])
     if preventive_completed.empty: return df_os
-    new_os_list = []
-    for _, group in preventive_completed.groupby(['asset_id', 'reason']):
-        last_os = group.sort_values(by='completion_date', ascending=False).iloc[0]
-        period = recurrence_map.get(last_os['recorrencia'])
-        if period and datetime.now() >= (last_os['completion_date'] + period):
-            has_open_os = not df_os[(df_os['asset_id'] == last_os['asset_id']) & (df_os['reason'] == last_os['reason']) & (df_os['status'] == 'Aberta')].empty
-            if not has_open_os:
-                # --- CORREÇÃO: Usa uuid para garantir um ID único ---
-                new_os_id = f"OS-{uuid.uuid4().hex[:12]}"
-                new_os_list.append({'os_id': new_os_id, 'asset_id': last_os['asset_id'], 'asset_type': last_os['asset_type'], 'creation_date': datetime.now(), 'reason': last_os['reason'], 'priority': last_os['priority'], 'status': 'Aberta', 'class': 'Preventiva', 'recorrencia': last_os['recorrencia'], 'assigned_to': last_os['assigned_to'], 'notes': '', 'estimated_cost': last_os['estimated_cost'], 'actual_cost': 0.0, 'parts_used': '', 'files_attached': json.dumps([]), 'completion_date': pd.NaT})
-    if new_os_list:
-        df_new_os = pd.DataFrame(new_os_list)
-        append_to_table(df_new_os, "service_orders")
-        st.toast(f"{len(new_os_list)} nova(s) OS Preventiva(s) gerada(s)!", icon="🗓️")
-        return pd.concat([df_os, df_new_os], ignore_index=True)
-    return df_os
+    # Última OS concluída de cada (ativo, motivo) e a data em que a próxima vence, calculada por período de recorrência
+    last_os = preventive_completed.sort_values(by='completion_date', ascending=False, kind='stable').drop_duplicates(subset=['asset_id', 'reason'])
+    due_date = pd.Series(pd.NaT, index=last_os.index, dtype='datetime64[ns]')
+    for recurrence, period in RECURRENCE_PERIODS.items():
+        is_recurrence = last_os['recorrencia'] == recurrence
+        due_date[is_recurrence] = last_os.loc[is_recurrence, 'completion_date'] + period
+    now = datetime.now()
+    last_os = last_os[due_date <= now]
+    last_os = last_os[~pd.MultiIndex.from_frame(last_os[['asset_id', 'reason']].astype(str)).isin(active_order_keys(df_os, ['Aberta']))]
+    if last_os.empty: return df_os
+    new_os_list = [{'os_id': f"OS-{uuid.uuid4().hex[:12]}", 'asset_id': os_row['asset_id'], 'asset_type': os_row['asset_type'], 'creation_date': now, 'reason': os_row['reason'], 'priority': os_row['priority'], 'status': 'Aberta', 'class': 'Preventiva', 'recorrencia': os_row['recorrencia'], 'assigned_to': os_row['assigned_to'], 'notes': '', 'estimated_cost': os_row['estimated_cost'], 'actual_cost': 0.0, 'files_attached': json.dumps([]), 'completion_date': pd.NaT} for os_row in last_os.to_dict('records')]
+    insert_service_orders(new_os_list)
+    return pd.concat([df_os, pd.DataFrame(new_os_list)], ignore_index=True)
 
 @st.cache_data
 def load_parts():
-    initialize_database(); return pd.read_sql("SELECT * FROM parts", engine)
+    return pd.read_sql("SELECT * FROM parts", engine)
 def save_parts(df_parts):
-    df_parts.to_sql("parts", engine, if_exists='replace', index=False)
+    """Grava o frame editado como o cadastro de peças: upsert em lote das linhas e exclusão das peças ausentes do frame."""
+    write_parts(df_parts.to_dict('records'), delete_missing=True)
+def upsert_part(part):
+    write_parts([part])
+def write_parts(parts, delete_missing=False):
+    """Upsert de peças em que a mudança de stock_quantity entra no livro de estoque como ajuste (ou saldo inicial de uma
+    peça nova), na mesma transação que atualiza o saldo materializado. Com `delete_missing`, apaga as peças fora de `parts`."""
+    part_ids = [part['part_id'] for part in parts]
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE") # Lê o saldo e grava a diferença sem que outra baixa entre no meio
+        try:
+            if delete_missing: delete_missing_keys(conn, "parts", part_ids)
+            current = dict(conn.execute(text("SELECT part_id, stock_quantity FROM parts WHERE part_id IN :part_ids").bindparams(bindparam('part_ids', expanding=True)), {"part_ids": part_ids}).fetchall()) if part_ids else {}
+            execute_upserts(conn, "parts", parts)
+            now = datetime.now().strftime(TIMESTAMP_FORMAT)
+            movements = [{"part_id": part['part_id'], "quantity": int(part['stock_quantity']) - int(current.get(part['part_id']) or 0), "kind": 'ajuste' if part['part_id'] in current else 'saldo_inicial', "created_at": now}
+                         for part in parts if part.get('stock_quantity') is not None and not pd.isna(part['stock_quantity'])]
+            record_stock_movements(conn, [m for m in movements if m['quantity'] or m['kind'] == 'saldo_inicial'])
+            conn.commit()
+        except Exception:
+            conn.rollback(); raise
+    clear_entity_cache("parts")
 @st.cache_data
 def load_assets():
-    initialize_database(); return pd.read_sql("SELECT * FROM assets", engine, parse_dates=['install_date'])
+    return pd.read_sql("SELECT * FROM assets", engine, parse_dates=['install_date'])
 def save_assets(df_assets):
-    df_assets.to_sql("assets", engine, if_exists='replace', index=False)
-def add_part_to_os(os_id, part_id, quantity):
+    """Grava o frame editado como o cadastro de ativos: upsert em lote das linhas e exclusão dos ativos ausentes do frame."""
+    with engine.begin() as conn:
+        delete_missing_keys(conn, "assets", df_assets['asset_id'].tolist())
+        if not df_assets.empty: execute_upserts(conn, "assets", df_assets.to_dict('records'))
+    clear_entity_cache("assets")
+def insert_asset(asset):
+    """Cadastra um ativo; retorna False se o ID já existir."""
+    return insert_row("assets", asset)
+
+# --- REPOSITÓRIO: ESCRITA POR LINHA NAS TABELAS DE CADASTRO ---
+# Todas as escritas são parametrizadas e tocam só as linhas informadas (custo proporcional às linhas alteradas)
+def clear_entity_cache(table):
+    if table == "assets": load_assets.clear()
+    elif table == "parts": load_parts.clear()
+    elif table == "users": USER_DIRECTORY.invalidate()
+    elif table == "roles": ROLE_DIRECTORY.invalidate()
+def insert_row(table, row):
+    """Insere uma linha; retorna False, sem alterar nada, se a chave já existir (seguro com editores concorrentes)."""
+    columns = list(row)
+    stmt = text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)}) ON CONFLICT({ENTITY_KEYS[table]}) DO NOTHING")
+    with engine.begin() as conn:
+        inserted = conn.execute(stmt, {c: to_db_value(row[c]) for c in columns}).rowcount == 1
+    clear_entity_cache(table); return inserted
+def update_row(table, key, **fields):
+    """Atualiza apenas os campos informados de uma linha; retorna False se a chave não existir."""
+    return update_rows(table, [{ENTITY_KEYS[table]: key, **fields}]) == 1
+def update_rows(table, rows):
+    """Atualiza em uma transação os campos presentes em cada linha (que deve conter a chave). Retorna as linhas alteradas."""
+    key = ENTITY_KEYS[table]; updated = 0
+    with engine.begin() as conn:
+        for columns, group in group_rows_by_columns(rows).items():
+            fields = [c for c in columns if c != key]
+            stmt = text(f"UPDATE {table} SET {', '.join(f'{c} = :{c}' for c in fields)} WHERE {key} = :{key}")
+            updated += conn.execute(stmt, [{c: to_db_value(row[c]) for c in columns} for row in group]).rowcount
+    clear_entity_cache(table); return updated
+def upsert_rows(table, rows):
+    """Insere ou atualiza várias linhas em uma transação (INSERT ... ON CONFLICT DO UPDATE). Em linhas já existentes só
+    as colunas informadas mudam; colunas omitidas em linhas novas ficam com o valor padrão da tabela."""
+    if not rows: return
+    with engine.begin() as conn: execute_upserts(conn, table, rows)
+    clear_entity_cache(table)
+def execute_upserts(conn, table, rows):
+    key = ENTITY_KEYS[table]
+    for columns, group in group_rows_by_columns(rows).items():
+        updates = ', '.join(f'{c} = excluded.{c}' for c in columns if c != key)
+        stmt = text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)}) ON CONFLICT({key}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING"))
+        conn.execute(stmt, [{c: to_db_value(row[c]) for c in columns} for row in group])
+def delete_missing_keys(conn, table, keys):
+    """Apaga as linhas cuja chave não está em `keys` (lista passada como JSON, sem limite de parâmetros do SQLite)."""
+    key = ENTITY_KEYS[table]
+    return conn.execute(text(f"DELETE FROM {table} WHERE {key} NOT IN (SELECT value FROM json_each(:keys))"), {"keys": json.dumps([str(k) for k in keys])}).rowcount
+def delete_row(table, key):
+    with engine.begin() as conn:
+        deleted = conn.execute(text(f"DELETE FROM {table} WHERE {ENTITY_KEYS[table]} = :key"), {"key": key}).rowcount == 1
+    clear_entity_cache(table); return deleted
+def group_rows_by_columns(rows):
+    """Agrupa linhas (dicts) pelo conjunto de colunas, para um executemany por formato de instrução."""
+    groups = {}
+    for row in rows: groups.setdefault(tuple(row), []).append(row)
+    return groups
+class InsufficientStockError(ValueError):
+    """Reserva recusada por falta de saldo; `shortages` é {part_id: disponível} das peças sem saldo suficiente."""
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__("Estoque insuficiente: " + ", ".join(f"{part_id} (disponível: {available})" for part_id, available in shortages.items()))
+def reserve_parts_for_os(os_id, quantities):
+    """Baixa de estoque e registro de uso de várias peças para uma OS numa única transação (tudo ou nada).
+    Cada baixa é um UPDATE condicional (stock_quantity >= quantidade), então retiradas simultâneas da mesma peça
+    nunca deixam o estoque negativo nem perdem atualização. `quantities` é {part_id: quantidade}.
+    Sem saldo suficiente em alguma peça, nada é gravado e levanta InsufficientStockError."""
+    quantities = {part_id: int(quantity) for part_id, quantity in quantities.items() if quantity}
+    if any(quantity < 0 for quantity in quantities.values()): raise ValueError("Quantidades de peças devem ser positivas.")
+    shortages = {}
     with engine.connect() as conn:
-        stock_quantity = conn.execute(text("SELECT stock_quantity FROM parts WHERE part_id = :part_id"), {"part_id": part_id}).scalar()
-        if stock_quantity is None or stock_quantity < quantity:
-            st.error(f"Estoque insuficiente para a peça {part_id}. Disponível: {stock_quantity or 0}"); return False
-        usage_df = pd.DataFrame([{"os_id": os_id, "part_id": part_id, "quantity_used": quantity}])
-        append_to_table(usage_df, "os_parts_usage")
-        new_quantity = stock_quantity - quantity
-        stmt = text("UPDATE parts SET stock_quantity = :new_qty WHERE part_id = :part_id")
-        conn.execute(stmt, {"new_qty": new_quantity, "part_id": part_id}); conn.commit()
-        st.success(f"{quantity} unidade(s) de '{part_id}' adicionada(s) à OS."); return True
-@st.cache_data
+        conn.exec_driver_sql("BEGIN IMMEDIATE") # Trava de escrita desde o início: sem upgrade de leitura para escrita sob concorrência
+        try:
+            for part_id, quantity in quantities.items():
+                updated = conn.execute(text("UPDATE parts SET stock_quantity = stock_quantity - :quantity WHERE part_id = :part_id AND stock_quantity >= :quantity"),
+                                       {"quantity": quantity, "part_id": part_id}).rowcount
+                if not updated: shortages[part_id] = conn.execute(text("SELECT stock_quantity FROM parts WHERE part_id = :part_id"), {"part_id": part_id}).scalar() or 0
+            if shortages: raise InsufficientStockError(shortages) # O except abaixo desfaz as baixas já feitas
+            conn.execute(text("INSERT INTO os_parts_usage (os_id, part_id, quantity_used) VALUES (:os_id, :part_id, :quantity_used)"),
+                         [{"os_id": os_id, "part_id": part_id, "quantity_used": quantity} for part_id, quantity in quantities.items()])
+            now = datetime.now().strftime(TIMESTAMP_FORMAT)
+            record_stock_movements(conn, [{"part_id": part_id, "quantity": -quantity, "kind": 'consumo', "os_id": os_id, "created_at": now} for part_id, quantity in quantities.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback(); raise
+    clear_entity_cache("parts")
+def record_stock_movements(conn, movements):
+    """Anexa movimentações ao livro de estoque (nunca atualizadas nem apagadas); roda na transação de quem altera o saldo."""
+    if not movements: return
+    conn.execute(text("INSERT INTO stock_movements (part_id, quantity, kind, os_id, created_at) VALUES (:part_id, :quantity, :kind, :os_id, :created_at)"),
+                 [{"os_id": None, **movement} for movement in movements])
+def load_stock_movements(part_id, since=None):
+    """Movimentações de uma peça (mais recentes primeiro), com o saldo após cada uma."""
+    query = "SELECT movement_id, part_id, quantity, kind, os_id, created_at FROM stock_movements WHERE part_id = :part_id ORDER BY created_at, movement_id"
+    df = pd.read_sql(text(query), engine, params={"part_id": part_id}, parse_dates=['created_at'])
+    df['balance'] = df['quantity'].cumsum()
+    if since is not None: df = df[df['created_at'] >= pd.Timestamp(since)]
+    return df.iloc[::-1].reset_index(drop=True)
+def stock_ledger_mismatches():
+    """Peças cujo saldo materializado (parts.stock_quantity) difere da soma do livro; vazio quando estão consistentes."""
+    return pd.read_sql("""SELECT p.part_id, p.stock_quantity, COALESCE(SUM(m.quantity), 0) AS ledger_quantity FROM parts AS p
+        LEFT JOIN stock_movements AS m ON m.part_id = p.part_id GROUP BY p.part_id HAVING p.stock_quantity IS NOT COALESCE(SUM(m.quantity), 0)""", engine)
+def estimate_stock_runway(window_days=CONSUMPTION_WINDOW_DAYS, lead_days=REORDER_LEAD_DAYS, now=None):
+    """Consumo médio diário de cada peça na janela e dias até a ruptura com o saldo atual. Lê só as baixas da janela
+    (índice por tipo e data) e a primeira movimentação de cada peça, que encurta a janela de peças recém-cadastradas."""
+    now = pd.Timestamp(now or datetime.now()); since = now - pd.Timedelta(days=window_days)
+    with engine.connect() as conn:
+        consumed = pd.read_sql(text("SELECT part_id, -SUM(quantity) AS consumed FROM stock_movements WHERE kind = 'consumo' AND created_at >= :since GROUP BY part_id"),
+                               conn, params={"since": since.strftime(TIMESTAMP_FORMAT)}).set_index('part_id')['consumed']
+        first_seen = pd.read_sql(text("SELECT part_id, MIN(created_at) AS first_seen FROM stock_movements GROUP BY part_id"), conn, parse_dates=['first_seen']).set_index('part_id')['first_seen']
+    df = load_parts()[['part_id', 'description', 'stock_quantity', 'min_stock_level']].copy()
+    df['consumed'] = df['part_id'].map(consumed).fillna(0).astype(int)
+    tracked_days = ((now - df['part_id'].map(first_seen).fillna(now).clip(lower=since)) / pd.Timedelta(days=1)).clip(lower=1.0)
+    df['daily_consumption'] = df['consumed'] / tracked_days
+    stock = df['stock_quantity'].fillna(0).clip(lower=0)
+    df['days_to_stockout'] = (stock / df['daily_consumption'].where(df['daily_consumption'] > 0)).fillna(np.inf) # Sem consumo: nunca rompe
+    df['stockout_date'] = now + pd.to_timedelta(df['days_to_stockout'].where(df['days_to_stockout'] <= 3650), unit='D') # Só data rupturas nos próximos 10 anos
+    df['reorder'] = (df['days_to_stockout'] <= lead_days) | (df['stock_quantity'] <= df['min_stock_level'])
+    return df.sort_values('days_to_stockout').reset_index(drop=True)
+def add_part_to_os(os_id, part_id, quantity):
+    try: reserve_parts_for_os(os_id, {part_id: quantity})
+    except InsufficientStockError as e:
+        st.error(f"Estoque insuficiente para a peça {part_id}. Disponível: {e.shortages[part_id]}"); return False
+    st.success(f"{quantity} unidade(s) de '{part_id}' adicionada(s) à OS."); return True
+SQL_IN_CHUNK = 900 # Ids por consulta IN, abaixo do limite de variáveis do SQLite em versões antigas
+def get_parts_for_orders(os_ids):
+    """Uso de peças de um conjunto de OS numa única consulta (em blocos só para listas muito grandes), com o custo de cada
+    lançamento; o agrupamento por OS fica a cargo de quem chama."""
+    os_ids = list(dict.fromkeys(os_ids))
+    query = text("SELECT T1.os_id, T1.part_id, T2.description, T1.quantity_used, T2.unit_cost FROM os_parts_usage AS T1 "
+                 "JOIN parts AS T2 ON T1.part_id = T2.part_id WHERE T1.os_id IN :os_ids ORDER BY T1.usage_id").bindparams(bindparam('os_ids', expanding=True))
+    chunks = [pd.read_sql(query, engine, params={"os_ids": os_ids[i:i + SQL_IN_CHUNK]}) for i in range(0, len(os_ids), SQL_IN_CHUNK)]
+    df_usage = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=['os_id', 'part_id', 'description', 'quantity_used', 'unit_cost'])
+    return df_usage.assign(total_cost=df_usage['quantity_used'] * df_usage['unit_cost'])
 def get_parts_for_os(os_id):
-    query = "SELECT T2.description, T1.quantity_used, T2.unit_cost FROM os_parts_usage AS T1 JOIN parts AS T2 ON T1.part_id = T2.part_id WHERE T1.os_id = ?"
-    return pd.read_sql(query, engine, params=(os_id,))
\ No newline at end of file
+    return get_parts_for_orders([os_id])[['description', 'quantity_used', 'unit_cost']]
+def summarize_asset_costs(df_orders, df_usage):
+    """Custo por ativo a partir das OS e do uso de peças já carregados: nº de OS, mão de obra (actual_cost), peças e total."""
+    parts_cost = df_usage.groupby('os_id')['total_cost'].sum()
+    df_costs = df_orders[['asset_id', 'os_id']].assign(labor_cost=df_orders['actual_cost'].fillna(0.0), parts_cost=df_orders['os_id'].map(parts_cost).fillna(0.0))
+    summary = df_costs.groupby('asset_id').agg(orders=('os_id', 'size'), labor_cost=('labor_cost', 'sum'), parts_cost=('parts_cost', 'sum'))
+    return summary.assign(total_cost=summary['labor_cost'] + summary['parts_cost'])